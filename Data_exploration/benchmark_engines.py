@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from referential_state import compare_referentials
+
+
+SCRIPTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Command building the referential with each engine into an output directory
+ENGINES = {
+    'spark': lambda args, output: [sys.executable, os.path.join(SCRIPTS_DIRECTORY, "build_referential.py"), "--engine", "spark", "--master", args.master],
+    'duckdb': lambda args, output: [sys.executable, os.path.join(SCRIPTS_DIRECTORY, "build_referential.py"), "--engine", "duckdb",
+                                    "--memory-limit-mb", str(args.memory_limit_mb)],
+    'incremental': lambda args, output: [sys.executable, os.path.join(SCRIPTS_DIRECTORY, "referential_state.py"), "--state", os.path.join(output, "state.db")]
+}
+# Seconds between two samples of the memory of the build
+RSS_SAMPLE_INTERVAL_S = 0.1
+
+
+def get_process_tree_rss(pid):
+    """
+    Resident memory of a process and its descendants (the JVM of Spark), read from /proc.
+    Returns: int, bytes
+    """
+    children = {}
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat", "r") as stat_file:
+                    parent = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(parent, []).append(int(name))
+            except (OSError, IndexError, ValueError):
+                continue
+
+    rss_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status", "r") as status_file:
+                rss_kb += next((int(line.split()[1]) for line in status_file if line.startswith("VmRSS:")), 0)
+        except OSError:
+            continue
+    return rss_kb * 1024
+
+
+def run_engine(command, log_path):
+    """
+    Runs a build until it ends, sampling the memory of its process tree.
+    Returns: tuple[float, int, int], the duration in seconds, the peak resident memory in bytes and the exit code
+    """
+    start = time.perf_counter()
+    peak_rss = 0
+    with open(log_path, "w") as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        while process.poll() is None:
+            peak_rss = max(peak_rss, get_process_tree_rss(process.pid))
+            time.sleep(RSS_SAMPLE_INTERVAL_S)
+    return time.perf_counter() - start, peak_rss, process.returncode
+
+
+def is_equivalent(report, tolerance):
+    """
+    Same rows in every file, equal quartiles in every cell, and no value further than tolerance, the averages being allowed
+    a last digit apart when the float sum falls on a rounding tie.
+    Returns: bool
+    """
+    return all(result['missing'] == 0 and result['extra'] == 0 and round(result['max_difference'], 9) <= tolerance
+               and result.get('max_iqr_difference', 0) == 0 for result in report.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the referential build of each engine, with its peak memory, and compares their files.")
+    parser.add_argument('--ladder', default="./data/matchs/")
+    parser.add_argument('--otps', default="./data/otp_matchs/", help="Empty to skip.")
+    parser.add_argument('--input-format', choices=['csv', 'parquet', 'participants'], default='csv')
+    parser.add_argument('--engines', default="spark,duckdb", help=f"Comma separated, among {', '.join(ENGINES)}. The first one is the reference.")
+    parser.add_argument('--reference', help="Output of a previous build used as the reference instead of the first engine, e.g. a Spark build.")
+    parser.add_argument('--output', default="./results/benchmark_engines")
+    parser.add_argument('--master', default="local[*]")
+    parser.add_argument('--memory-limit-mb', type=int, default=2048)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--patches', help="Patch range of the games, passed to every engine.")
+    args = parser.parse_args()
+
+    results = {}
+    for engine in args.engines.split(","):
+        output = os.path.abspath(os.path.join(args.output, engine))
+        os.makedirs(output, exist_ok=True)
+        command = ENGINES[engine](args, output) + ["--ladder", args.ladder, "--otps", args.otps, "--input-format", args.input_format, "--output", output]\
+            + (["--patches", args.patches] if args.patches else [])
+        duration, peak_rss, return_code = run_engine(command, os.path.join(output, "build.log"))
+        results[engine] = {'output': output, 'duration_s': round(duration, 3), 'peak_rss_mb': round(peak_rss / 2 ** 20, 1), 'return_code': return_code}
+        print(f"{engine:<12}| {duration:>8.1f}s | peak RSS {peak_rss / 2 ** 20:>8.1f} MB | exit {return_code}")
+
+    reference = args.reference or next((result['output'] for result in results.values() if result['return_code'] == 0), None)
+    equivalent = True
+    for engine, result in results.items():
+        if result['return_code'] != 0 or result['output'] == reference:
+            continue
+        result['comparison'] = compare_referentials(result['output'], reference)
+        result['equivalent'] = is_equivalent(result['comparison'], args.tolerance)
+        equivalent &= result['equivalent']
+        print(f"{engine:<12}| {'equivalent' if result['equivalent'] else 'DIFFERENT'} to {reference}")
+        for name, comparison in result['comparison'].items():
+            print(f"    {name:<24} {json.dumps(comparison)}")
+
+    with open(os.path.join(args.output, "benchmark.json"), "w") as report_file:
+        json.dump({'reference': reference, 'engines': results}, report_file, indent=2)
+    sys.exit(0 if equivalent and all(result['return_code'] == 0 for result in results.values()) else 1)
@@ -0,0 +1,132 @@
+import argparse
+import os
+import time
+
+from format_match_api_response import GENERAL_COLUMN_NAMES, PLAYER_COLUMN_NAMES
+
+
+# Columns aggregated like the average_percentiles results of the notebooks
+BENCHMARK_COLUMNS = ['player_kills', 'player_death', 'player_assist', 'player_total_dmg_to_champions', 'player_vision_score']
+
+
+def build_participants_from_wide(wide_root, participants_root):
+    """
+    Derives the participants layout from wide Parquet files, keeping their patch=/queue= directories.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    general_columns = list(GENERAL_COLUMN_NAMES.values())
+    for directory, _, files in os.walk(wide_root):
+        for file_name in files:
+            if not file_name.endswith(".parquet"):
+                continue
+            wide_table = pq.read_table(os.path.join(directory, file_name))
+            tables = []
+            for i in range(1, 11):
+                player_columns = [f"player_{i}_{column}" for column in PLAYER_COLUMN_NAMES.values()]
+                tables.append(wide_table.select(general_columns + player_columns)
+                              .rename_columns(general_columns + [f"player_{column}" for column in PLAYER_COLUMN_NAMES.values()]))
+
+            target_directory = os.path.join(participants_root, os.path.relpath(directory, wide_root))
+            os.makedirs(target_directory, exist_ok=True)
+            participants_table = pa.concat_tables(tables)
+            pq.write_table(participants_table, os.path.join(target_directory, file_name), compression="zstd", row_group_size=participants_table.num_rows)
+
+
+def get_wide_participants_df(spark, wide_root):
+    """
+    Turns the wide rows into participant rows as the notebooks do, exploding an array of 10 player structs.
+    """
+    from pyspark.sql.functions import array, col, explode, struct
+
+    player_structs = [
+        struct(*[col(f"player_{i}_{column}").alias(f"player_{column}") for column in PLAYER_COLUMN_NAMES.values()])
+        for i in range(1, 11)
+    ]
+    return spark.read.parquet(wide_root)\
+        .withColumn("players", explode(array(*player_structs)))\
+        .select(*GENERAL_COLUMN_NAMES.values(), *[col(f"players.player_{column}").alias(f"player_{column}") for column in PLAYER_COLUMN_NAMES.values()])
+
+
+def get_participants_df(spark, participants_root):
+    """
+    Reads the participant rows as they are stored.
+    """
+    return spark.read.parquet(participants_root)
+
+
+def run_notebook_aggregation(df):
+    """
+    Filters the games and the main lanes of each champion, then computes the average and quartiles per champion, lane and result.
+    Returns: list of Row
+    """
+    from pyspark.sql.functions import avg, col, lit, percentile, round, sum
+    from pyspark.sql.window import Window
+
+    games_df = df.where(col("game_patch_version").isNotNull())\
+        .where(col("player_individual_position") != "Invalid")\
+        .where(col("game_duration") >= 900)
+
+    champ_lanes = games_df.groupBy('player_champ_name', 'player_individual_position')\
+        .count()\
+        .withColumn('total_champ_game', sum(col('count')).over(Window.partitionBy('player_champ_name')))\
+        .withColumn('percent_games', (col('count') / col('total_champ_game')) * 100)\
+        .where(col('percent_games') > 35)\
+        .select('player_champ_name', 'player_individual_position')
+
+    agg_exprs = []
+    for col_name in BENCHMARK_COLUMNS:
+        agg_exprs.append(round(avg(col_name), 4).alias(f"avg_{col_name}"))
+        for quartile, label in zip([0.25, 0.5, 0.75], ["Q1", "Q2", "Q3"]):
+            agg_exprs.append(round(percentile(col_name, lit(quartile), lit(1)), 4).alias(f"{label}_{col_name}"))
+
+    return games_df.join(champ_lanes, ['player_champ_name', 'player_individual_position'], 'inner')\
+        .groupBy("player_champ_name", "player_individual_position", "player_win")\
+        .agg(*agg_exprs)\
+        .collect()
+
+
+def time_aggregation(get_df, runs):
+    """
+    Runs the aggregation on a freshly read dataframe several times.
+    Returns: tuple[list[float], int] with the durations in seconds and the number of result rows
+    """
+    durations = []
+    rows = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = run_notebook_aggregation(get_df())
+        durations.append(time.perf_counter() - start)
+    return durations, len(rows)
+
+
+def get_directory_size(root):
+    return sum(os.path.getsize(os.path.join(directory, file_name)) for directory, _, files in os.walk(root) for file_name in files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the notebooks aggregation on the wide and participants Parquet layouts.")
+    parser.add_argument('--wide', default="./matchs_parquet/chall", help="Root of the wide layout (OUTPUT_FORMAT=parquet).")
+    parser.add_argument('--participants', default="./participants_parquet/chall", help="Root of the participants layout.")
+    parser.add_argument('--build-participants', action='store_true', help="Derives the participants layout from the wide one first.")
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.build_participants:
+        build_participants_from_wide(args.wide, args.participants)
+
+    from pyspark.sql import SparkSession
+
+    spark = SparkSession.builder\
+            .master("local")\
+            .appName("Layouts benchmark")\
+            .getOrCreate()
+
+    for name, root, get_df in [
+        ("wide + explode", args.wide, lambda: get_wide_participants_df(spark, args.wide)),
+        ("participants", args.participants, lambda: get_participants_df(spark, args.participants))
+    ]:
+        durations, result_rows = time_aggregation(get_df, args.runs)
+        print(f"{name:<16}| {get_directory_size(root) / 1e6:>8.1f} MB | best {min(durations):>7.2f}s | "
+              f"mean {sum(durations) / len(durations):>7.2f}s | {result_rows} result rows")
@@ -0,0 +1,93 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from output_writers import AppendLog, RotatingLineWriter
+
+
+# Line of the size of a match CSV line
+SAMPLE_LINE = "EUW1_7591052254;" + ";".join(["player_puuid_0123456789abcdef", "Ahri", "MIDDLE", "12", "3", "7", "24567", "31"] * 10)
+
+
+def append_line_to_file(line, file_path):
+    """
+    Previous helper of the crawlers : the file is opened for every line.
+    """
+    with open(file_path, "a", encoding="utf-8") as f:
+        f.write(str(line) + "\n")
+
+
+def write_checkpoint(file_name, checkpoint, open_mode):
+    """
+    Previous checkpoint helper, called with a single line per checkpoint.
+    """
+    if type(checkpoint) == str:
+        with open(file_name, open_mode, encoding="utf-8") as f:
+            f.write(str(checkpoint) + "\n")
+    elif type(checkpoint) == list:
+        with open(file_name, open_mode, encoding="utf-8") as f:
+            for line in checkpoint:
+                f.write(str(line) + "\n")
+
+
+def run_append_line_to_file(directory, lines):
+    for _ in range(lines):
+        append_line_to_file(SAMPLE_LINE, os.path.join(directory, "lines.csv"))
+
+
+def run_write_checkpoint(directory, lines):
+    for _ in range(lines):
+        write_checkpoint(os.path.join(directory, "lines.csv"), SAMPLE_LINE, "a")
+
+
+def run_append_log(directory, lines, fsync_interval_s):
+    append_log = AppendLog(os.path.join(directory, "lines.csv"), fsync_interval_s)
+    for _ in range(lines):
+        append_log.write(SAMPLE_LINE)
+    append_log.close()
+
+
+def run_rotating_writer(directory, lines, fsync_interval_s, max_lines):
+    persisted = []
+    writer = RotatingLineWriter(directory, "bench_match", ".csv", max_lines=max_lines, fsync_interval_s=fsync_interval_s,
+                                on_persisted=persisted.extend)
+    for i in range(lines):
+        writer.write(SAMPLE_LINE, i)
+    writer.close()
+    assert len(persisted) == lines
+
+
+def time_writer(run, lines, runs):
+    """
+    Times a writer in a new directory for every run.
+    Returns: float, the best lines / s
+    """
+    rates = []
+    for _ in range(runs):
+        directory = tempfile.mkdtemp(dir=".")
+        try:
+            start = time.perf_counter()
+            run(directory, lines)
+            rates.append(lines / (time.perf_counter() - start))
+        finally:
+            shutil.rmtree(directory)
+    return max(rates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the lines / s of the previous file helpers and of output_writers.")
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--fsync-interval', type=float, default=5, help="Seconds between two fsync of the open writers.")
+    parser.add_argument('--max-lines', type=int, default=240, help="Lines per file of the rotating writer.")
+    args = parser.parse_args()
+
+    for name, run in [
+        ("append_line_to_file", run_append_line_to_file),
+        ("write_checkpoint", run_write_checkpoint),
+        ("AppendLog", lambda directory, lines: run_append_log(directory, lines, args.fsync_interval)),
+        ("RotatingLineWriter", lambda directory, lines: run_rotating_writer(directory, lines, args.fsync_interval, args.max_lines))
+    ]:
+        print(f"{name:<20}| {time_writer(run, args.lines, args.runs):>12,.0f} lines/s")
@@ -0,0 +1,787 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from datetime import datetime
+from format_match_api_response import GENERAL_COLUMN_NAMES, MATCH_ROW_SCHEMA, PLAYER_COLUMN_NAMES
+from output_writers import get_temp_path, write_file_atomically
+
+
+# Games shorter than this are remakes, left out as in the notebooks
+MIN_GAME_DURATION_S = 900
+# Surrenders before this duration are counted as early surrenders in ff_stats.csv
+EARLY_SURRENDER_S = 1200
+# Share (%) of the games of a champion played in a lane for the lane to be kept, as the champ_lanes filter of the OTP notebook
+CHAMPION_LANE_PERCENT = 35
+# Minute bins of ff_per_mins.csv, later surrenders being too rare to be shown
+FF_MINUTE_BINS_LIMIT = 52
+# Decimals of the per minute values, rounded as in the notebooks
+PER_MINUTE_DIGITS = 3
+# Shuffle partitions of the job, the Spark default of 200 being far too many for the size of the referential
+SHUFFLE_PARTITIONS = int(os.getenv("REFERENTIAL_SHUFFLE_PARTITIONS", 16))
+
+PING_COLUMNS = [
+    'player_pings_total',
+    'player_pings_all_in',
+    'player_pings_assist',
+    'player_pings_command',
+    'player_pings_missing',
+    'player_pings_ennemy_vision',
+    'player_pings_hold',
+    'player_pings_get_back',
+    'player_pings_need_vision',
+    'player_pings_on_my_way',
+    'player_pings_push',
+    'player_pings_vision_cleared',
+    'player_pings_biasic'
+]
+KDA_COLUMNS = ['player_kills', 'player_death', 'player_assist', 'kda']
+DAMAGE_COLUMNS = ['player_physical_dmg_to_champions', 'player_magical_dmg_to_champions', 'player_total_dmg_to_champions']
+BUILDING_COLUMNS = ['player_damage_dealt_objectives', 'player_damage_dealt_turrets']
+WARD_COLUMNS = ['player_control_wards_bought', 'player_wards_placed', 'player_wards_killed', 'player_vision_score']
+MULTI_KILL_COLUMNS = ['player_double_kill', 'player_triple_kill', 'player_quadra_kill', 'player_penta_kill']
+
+# (columns, per minute, main lanes only) of each stat group of average_percentiles.csv, in the order of the file.
+# The OTP notebook computes the KDA on every lane of a champion and the other groups on its main lanes only.
+REFERENTIAL_STATS = [
+    (PING_COLUMNS, True, True),
+    (KDA_COLUMNS, False, False),
+    (DAMAGE_COLUMNS, False, True),
+    (DAMAGE_COLUMNS, True, True),
+    (BUILDING_COLUMNS, True, True),
+    (WARD_COLUMNS, False, True)
+]
+
+ARTIFACTS = ['average_percentiles.csv', 'multi_kills.csv', 'duration.csv', 'ff_per_mins.csv', 'ff_stats.csv', 'tier_percentiles.csv',
+             'percentile_cdfs.npy', 'tier_percentile_cdfs.npy', 'win_effects.csv', 'stat_correlations.npy']
+# Empirical CDF of each row of the percentile files, in a float32 array of CDF_KNOTS quantiles per row written next to the CSV, in its row order
+CDF_ARTIFACTS = {'average_percentiles.csv': 'percentile_cdfs.npy', 'tier_percentiles.csv': 'tier_percentile_cdfs.npy'}
+CDF_KNOTS = 101
+CDF_QUANTILES = [i / (CDF_KNOTS - 1) for i in range(CDF_KNOTS)]
+# Index of the quartiles in the CDF knots
+QUARTILE_KNOTS = [(CDF_KNOTS - 1) // 4, (CDF_KNOTS - 1) // 2, 3 * (CDF_KNOTS - 1) // 4]
+# Win effect of each stat and correlations between the stats of each (champion, lane), see get_win_effect_artifacts
+WIN_EFFECT_ARTIFACTS = ['win_effects.csv', 'stat_correlations.npy']
+# Variance below which a stat is taken as constant, relative to its squared average
+CONSTANT_VARIANCE = 1e-12
+
+# Tiers of the ladder, lowest first as in ladder.py. The matches of a tier are written in files named by its players file,
+# e.g. ./matchs/diamond_match_N.csv, ./matchs/na1-master_match_N.csv or ./matchs_parquet/chall/patch=X/queue=Y/
+TIERS = ['IRON', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'EMERALD', 'DIAMOND', 'MASTER', 'GRANDMASTER', 'CHALLENGER']
+TIER_FILE_PREFIXES = {'chall': 'CHALLENGER'}
+# Tier and position of the rows of tier_percentiles.csv computed over every tier and every lane
+ALL_TIERS = 'ALL'
+ALL_POSITIONS = 'ALL'
+
+# Key of a patch for the range filters, major * PATCH_KEY_BASE + minor
+PATCH_KEY_BASE = 1000
+
+# API name of each exploded column, used as the column_stats of average_percentiles.csv
+API_NAMES = {
+    **{f"player_{column}": key for key, column in PLAYER_COLUMN_NAMES.items()},
+    'player_pings_total': 'totalPings',
+    'kda': 'kda'
+}
+
+
+def get_stat_name(column, per_minute):
+    """
+    Name of a stat in average_percentiles.csv, e.g. "assistMePingsPerMins" for player_pings_assist per minute.
+    Returns: str
+    """
+    return API_NAMES[column] + ("PerMins" if per_minute else "")
+
+
+def get_stat_column(column, per_minute):
+    """
+    Column of match_df_exploded holding a stat, see add_stat_columns.
+    Returns: str
+    """
+    return f"{column}_per_mins" if per_minute else column
+
+
+def get_win_effect_stats():
+    """
+    Returns: list[tuple[str, str]], the (stat name, column of match_df_exploded) of every stat of average_percentiles.csv, in the order of the file
+    """
+    return [(get_stat_name(column, per_minute), get_stat_column(column, per_minute)) for columns, per_minute, _ in REFERENTIAL_STATS for column in columns]
+
+
+WIN_EFFECT_STATS = get_win_effect_stats()
+# (i, j) stat pairs of the cross products of the moments, the upper triangle of the matrix row after row
+WIN_EFFECT_PAIRS = [(i, j) for i in range(len(WIN_EFFECT_STATS)) for j in range(i, len(WIN_EFFECT_STATS))]
+
+
+def new_moments():
+    """
+    Returns: list, the [count, sums, cross products] moments of the stats of WIN_EFFECT_STATS over no participant
+    """
+    import numpy as np
+
+    return [0, np.zeros(len(WIN_EFFECT_STATS)), np.zeros((len(WIN_EFFECT_STATS), len(WIN_EFFECT_STATS)))]
+
+
+def get_moments(count, sums, pair_products):
+    """
+    Moments from the count, the sums of each stat and the cross products of WIN_EFFECT_PAIRS, as aggregated by Spark or DuckDB.
+    Returns: list
+    """
+    import numpy as np
+
+    products = np.zeros((len(WIN_EFFECT_STATS), len(WIN_EFFECT_STATS)))
+    rows, columns = np.array(WIN_EFFECT_PAIRS).T
+    products[rows, columns] = products[columns, rows] = np.array(pair_products, dtype=np.float64)
+    return [int(count), np.array(sums, dtype=np.float64), products]
+
+
+def add_moments(moments, values):
+    """
+    Adds the participant rows of values, one column per stat of WIN_EFFECT_STATS, to moments, the rows missing a stat being skipped.
+    """
+    import numpy as np
+
+    values = values[~np.isnan(values).any(axis=1)]
+    moments[0] += len(values)
+    moments[1] += values.sum(axis=0)
+    moments[2] += values.T @ values
+
+
+def get_win_effect_artifacts(moments):
+    """
+    Win effect of each stat and correlation matrix of the stats of each (champion, lane) group, from the moments of its winning and
+    losing participants. The win effect is Cohen's d : the average of the wins minus the one of the losses, over their pooled standard
+    deviation. It is None, as the correlations of a stat, without two values of each result or for a constant stat.
+    moments: dict[tuple[str, str, bool], list], the moments of each (champion, position, win)
+    Returns: tuple[list[tuple], numpy.ndarray], the rows of win_effects.csv, a row per stat of each group ordered as average_percentiles.csv,
+    and the float32 (groups, stats, stats) correlation matrices of the groups in the same order
+    """
+    import numpy as np
+
+    groups = sorted({key[:2] for key in moments}, key=lambda group: group[1], reverse=True)
+    groups = sorted(groups, key=lambda group: (group[0] == 'GLOBAL', group[0]))
+    stats = len(WIN_EFFECT_STATS)
+    rows = []
+    correlations = np.full((len(groups), stats, stats), np.nan, dtype=np.float32)
+    for g, (champion, position) in enumerate(groups):
+        results = [moments.get((champion, position, win), new_moments()) for win in (True, False)]
+        count = results[0][0] + results[1][0]
+        averages, variances = [], []
+        for result_count, sums, products in results:
+            averages.append(sums / max(result_count, 1))
+            variances.append((np.diag(products) - sums * averages[-1]) / (result_count - 1) if result_count > 1 else np.full(stats, np.nan))
+
+        sums, products = results[0][1] + results[1][1], results[0][2] + results[1][2]
+        if count > 1:
+            covariance = (products - np.outer(sums, sums) / count) / (count - 1)
+            is_variable = np.diag(covariance) > CONSTANT_VARIANCE * ((sums / count) ** 2 + 1)
+            deviations = np.sqrt(np.where(is_variable, np.diag(covariance), np.nan))
+            correlations[g] = np.clip(covariance / np.outer(deviations, deviations), -1, 1)
+
+        effects = np.full(stats, np.nan)
+        if min(results[0][0], results[1][0]) > 1:
+            pooled = ((results[0][0] - 1) * variances[0] + (results[1][0] - 1) * variances[1]) / (count - 2)
+            is_variable = pooled > CONSTANT_VARIANCE * (((sums / count) ** 2) + 1)
+            effects[is_variable] = (averages[0] - averages[1])[is_variable] / np.sqrt(pooled[is_variable])
+        rows.extend((champion, position, stat_name, None if np.isnan(effect) else round(float(effect), 4), count)
+                    for (stat_name, _), effect in zip(WIN_EFFECT_STATS, effects))
+    return rows, correlations
+
+
+def get_file_tier(path, root):
+    """
+    Tier of the matches of a file, read from the first of its names under root starting with a tier prefix.
+    Returns: str | None, None for the files of no tier (OTPs, retried matches)
+    """
+    relative_path = os.path.relpath(path, root) if os.path.isdir(root) else os.path.basename(path)
+    for name in relative_path.split(os.sep):
+        prefix = name.split("_")[0].split("-")[-1].lower()
+        tier = TIER_FILE_PREFIXES.get(prefix, prefix.upper())
+        if tier in TIERS:
+            return tier
+    return None
+
+
+def get_tier_files(path):
+    """
+    Returns: dict[str | None, list[str]], the files of an input by tier
+    """
+    tier_files = {}
+    for file_path in get_input_files(path):
+        tier_files.setdefault(get_file_tier(file_path, path), []).append(file_path)
+    return tier_files
+
+
+def get_tier_order(tier):
+    """
+    Orders the tiers of tier_percentiles.csv, lowest first and ALL_TIERS last.
+    Returns: int
+    """
+    return TIERS.index(tier) if tier in TIERS else len(TIERS)
+
+
+def get_patch_key(game_version):
+    """
+    Orders the patches : 15004 for the patch "15.4" or the game version "15.4.657.1245".
+    Returns: int | None, None for a version not starting with major.minor
+    """
+    parts = str(game_version).split(".")
+    try:
+        return int(parts[0]) * PATCH_KEY_BASE + int(parts[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def parse_patch_range(patches):
+    """
+    Parses the patch range of a referential version, "15.1-15.4", or a single patch, "15.4".
+    Returns: dict with the first and last patch
+    """
+    first, _, last = patches.partition("-")
+    first, last = first.strip(), (last or first).strip()
+    if get_patch_key(first) is None or get_patch_key(last) is None or get_patch_key(first) > get_patch_key(last):
+        raise ValueError(f'Invalid patch range "{patches}", expected e.g. "15.1-15.4" or "15.4"')
+    return {'first': first, 'last': last}
+
+
+def get_spark_schema(row_schema):
+    """
+    Converts a column name -> python type schema to a Spark schema.
+    Returns: StructType
+    """
+    from pyspark.sql.types import BooleanType, LongType, StringType, StructField, StructType
+
+    spark_types = {str: StringType(), int: LongType(), bool: BooleanType()}
+    return StructType([StructField(column, spark_types[value_type], True) for column, value_type in row_schema.items()])
+
+
+def read_games(spark, path, input_format):
+    """
+    Reads the match rows of a source, a directory or a list of files : the ";" separated CSV of the crawler, or its wide or participants Parquet layout.
+    Returns: DataFrame
+    """
+    paths = path if isinstance(path, list) else [path]
+    if input_format == 'csv':
+        return spark.read.format('csv').option("sep", ";").option("header", "false").schema(get_spark_schema(MATCH_ROW_SCHEMA)).load(paths)
+    return spark.read.parquet(*paths)
+
+
+def explode_players(df):
+    """
+    Turns the wide rows into participant rows as the notebooks do, exploding an array of 10 player structs.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import array, col, explode, struct
+
+    player_structs = [
+        struct(*[col(f"player_{i}_{column}").alias(f"player_{column}") for column in PLAYER_COLUMN_NAMES.values()])
+        for i in range(1, 11)
+    ]
+    return df.withColumn("players", explode(array(*player_structs)))\
+        .select(*GENERAL_COLUMN_NAMES.values(), 'is_ladder', 'tier',
+                *[col(f"players.player_{column}").alias(f"player_{column}") for column in PLAYER_COLUMN_NAMES.values()])
+
+
+def add_stat_columns(df):
+    """
+    Adds the total pings, the KDA and the per minute value of each per minute stat, rounded as in the notebooks.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import coalesce, col, round
+
+    total_pings = col(PING_COLUMNS[1])
+    for column in PING_COLUMNS[2:]:
+        total_pings = total_pings + col(column)
+    df = df.select('*', total_pings.alias('player_pings_total'),
+                   coalesce((col('player_kills') + col('player_assist')) / col('player_death'), col('player_kills') + col('player_assist')).alias('kda'))
+
+    per_minute_columns = sorted({column for columns, per_minute, _ in REFERENTIAL_STATS if per_minute for column in columns})
+    return df.select('*', *[round(col(column) / (col('game_duration') / 60), PER_MINUTE_DIGITS).alias(get_stat_column(column, True))
+                            for column in per_minute_columns])
+
+
+def get_match_df_exploded(spark, ladder_path, otps_path, input_format, partitions, patch_range=None):
+    """
+    Reads the ladder and OTP matches, each game once, as one row per player of the games lasting at least MIN_GAME_DURATION_S,
+    and played on the patches of patch_range (see parse_patch_range) if given.
+    is_ladder tells the ladder games, which alone make the GLOBAL rows and the duration / surrender artifacts, and tier the tier
+    of their files, the highest one for a game of several tiers.
+    The rows are partitioned by champion, so the champion aggregations and the lane filter do not shuffle them again.
+    Returns: DataFrame, cached
+    """
+    from functools import reduce
+    from pyspark.sql.functions import col, lit, row_number, split
+    from pyspark.sql.window import Window
+
+    game_key = ['game_id'] if input_format != 'participants' else ['game_id', 'player_participant_id']
+    ladder_df = reduce(lambda df, other: df.unionByName(other), [
+        read_games(spark, files, input_format)
+        .withColumn('tier', lit(tier).cast('string'))
+        .withColumn('tier_rank', lit(get_tier_order(tier) if tier else -1))
+        for tier, files in get_tier_files(ladder_path).items()
+    ])
+    ladder_df = ladder_df.withColumn('game_rank', row_number().over(Window.partitionBy(*game_key).orderBy(col('tier_rank').desc())))\
+        .where(col('game_rank') == 1)\
+        .drop('game_rank', 'tier_rank')
+    games_df = ladder_df.withColumn('is_ladder', lit(True))
+    if otps_path:
+        otps_df = read_games(spark, otps_path, input_format)\
+            .join(ladder_df.select('game_id').distinct(), 'game_id', 'left_anti')\
+            .dropDuplicates(game_key)\
+            .withColumn('tier', lit(None).cast('string'))
+        games_df = games_df.unionByName(otps_df.withColumn('is_ladder', lit(False)))
+
+    if input_format != 'participants':
+        games_df = explode_players(games_df)
+
+    match_df_exploded = games_df.where(col("game_patch_version").isNotNull())\
+        .where(col("player_individual_position") != "Invalid")\
+        .where(col("game_duration") >= MIN_GAME_DURATION_S)
+    if patch_range:
+        version = split(col("game_patch_version"), r"\.")
+        patch_key = version[0].cast('int') * PATCH_KEY_BASE + version[1].cast('int')
+        match_df_exploded = match_df_exploded.where(patch_key.between(get_patch_key(patch_range['first']), get_patch_key(patch_range['last'])))
+    return add_stat_columns(match_df_exploded)\
+        .repartition(partitions, 'player_champ_name')\
+        .persist()
+
+
+def filter_champion_lanes(df):
+    """
+    Keeps the lanes holding more than CHAMPION_LANE_PERCENT % of the games of their champion.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import broadcast, col, sum
+    from pyspark.sql.window import Window
+
+    champ_lanes = df.groupBy('player_champ_name', 'player_individual_position')\
+        .count()\
+        .withColumn('total_champ_game', sum(col('count')).over(Window.partitionBy('player_champ_name')))\
+        .where((col('count') / col('total_champ_game')) * 100 > CHAMPION_LANE_PERCENT)\
+        .select('player_champ_name', 'player_individual_position')
+    return df.join(broadcast(champ_lanes), ['player_champ_name', 'player_individual_position'], 'inner')
+
+
+def get_average(column):
+    """
+    Average of a stat column. The per minute values are summed as integers of their last decimal, the other stats but the kda being
+    integers summed exactly as doubles : the average does not depend on the order of the rows, so that its ties round as with DuckDB.
+    Returns: Column
+    """
+    from pyspark.sql.functions import avg, col, count, round, sum
+
+    if not column.endswith("_per_mins"):
+        return avg(column)
+    scale = 10 ** PER_MINUTE_DIGITS
+    return sum(round(col(column) * scale).cast('long')) / (count(column) * scale)
+
+
+def compute_stats(df, group_columns, stats):
+    """
+    Computes the average, quartiles and CDF knots of each stat per group, the knots of a column coming from a single percentile
+    and the quartiles being read from them.
+    stats: list[tuple[str, str, int]] of (stat name, column, stat index)
+    Returns: DataFrame with the group columns, stat_index, column_stats, AVG, Q1, Q2, Q3, count, the values of the stat, and knots
+    """
+    from pyspark.sql.functions import array, col, count, explode, lit, percentile, round, struct
+
+    agg_exprs = []
+    stat_structs = []
+    for i, (stat_name, column, stat_index) in enumerate(stats):
+        agg_exprs.append(get_average(column).alias(f"avg_{i}"))
+        agg_exprs.append(percentile(column, CDF_QUANTILES, lit(1)).alias(f"knots_{i}"))
+        agg_exprs.append(count(column).alias(f"count_{i}"))
+        stat_structs.append(struct(
+            lit(stat_index).alias('stat_index'),
+            lit(stat_name).alias('column_stats'),
+            round(col(f"avg_{i}"), 4).alias('AVG'),
+            *[round(col(f"knots_{i}")[knot], 4).alias(label) for knot, label in zip(QUARTILE_KNOTS, ["Q1", "Q2", "Q3"])],
+            col(f"count_{i}").alias('count'),
+            col(f"knots_{i}").alias('knots')
+        ))
+
+    return df.groupBy(*group_columns)\
+        .agg(*agg_exprs)\
+        .withColumn('stats', explode(array(*stat_structs)))\
+        .select(*group_columns, *[col(f"stats.{name}").alias(name) for name in ['stat_index', 'column_stats', 'AVG', 'Q1', 'Q2', 'Q3', 'count', 'knots']])
+
+
+def get_referential_stats(main_lanes):
+    """
+    Returns: list[tuple[str, str, int]], the (stat name, column, position in the file) of the stats of REFERENTIAL_STATS
+    computed on the main lanes of the champions or on all their lanes
+    """
+    stats = []
+    stat_index = 0
+    for columns, per_minute, main_lanes_only in REFERENTIAL_STATS:
+        for column in columns:
+            if main_lanes_only == main_lanes:
+                stats.append((get_stat_name(column, per_minute), get_stat_column(column, per_minute), stat_index))
+            stat_index += 1
+    return stats
+
+
+def order_champion_rows(df, *columns):
+    """
+    Orders the rows by champion, the GLOBAL rows last, then by lane and result as the notebooks do.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import col, desc
+
+    return df.orderBy(col('player_champ_name') == 'GLOBAL', 'player_champ_name', desc('player_individual_position'), desc('player_win'), *columns)
+
+
+def build_average_percentiles(match_df_exploded, main_lanes_df):
+    """
+    Per champion rows from the OTP and ladder games, and GLOBAL rows per lane from the ladder games, with the CDF knots of each row last.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import col, lit
+
+    champion_group = ['player_champ_name', 'player_individual_position', 'player_win']
+    global_group = ['player_individual_position', 'player_win']
+    ladder_df = match_df_exploded.where(col('is_ladder'))
+
+    stats_df = compute_stats(main_lanes_df, champion_group, get_referential_stats(True))\
+        .unionByName(compute_stats(match_df_exploded, champion_group, get_referential_stats(False)))\
+        .unionByName(compute_stats(ladder_df, global_group, get_referential_stats(True) + get_referential_stats(False))
+                     .withColumn('player_champ_name', lit('GLOBAL')))
+
+    return order_champion_rows(stats_df, 'stat_index')\
+        .select(*champion_group, 'column_stats', 'AVG', 'Q1', 'Q2', 'Q3', 'knots')
+
+
+def build_tier_percentiles(match_df_exploded, main_lanes_df):
+    """
+    Rows of average_percentiles.csv per tier : per champion from the ladder games of the tier, on the main lanes of the champion
+    over every tier, and GLOBAL per lane. Then the GLOBAL rows of every lane (ALL_POSITIONS) of every tier (ALL_TIERS), last level
+    of the fallback of the back end. The count of values of each row lets the back end skip the thin cells, the CDF knots come last.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import col, create_map, desc, lit
+
+    tier_champion_group = ['tier', 'player_champ_name', 'player_individual_position', 'player_win']
+    all_stats = get_referential_stats(True) + get_referential_stats(False)
+    tier_df = match_df_exploded.where(col('tier').isNotNull())
+
+    stats_df = compute_stats(main_lanes_df.where(col('tier').isNotNull()), tier_champion_group, get_referential_stats(True))\
+        .unionByName(compute_stats(tier_df, tier_champion_group, get_referential_stats(False)))\
+        .unionByName(compute_stats(tier_df, ['tier', 'player_individual_position', 'player_win'], all_stats)
+                     .withColumn('player_champ_name', lit('GLOBAL')))\
+        .unionByName(compute_stats(match_df_exploded.where(col('is_ladder')), ['player_win'], all_stats)
+                     .withColumn('tier', lit(ALL_TIERS))
+                     .withColumn('player_champ_name', lit('GLOBAL'))
+                     .withColumn('player_individual_position', lit(ALL_POSITIONS)))
+
+    # The order of ALL_TIERS, out of the map, is null : ordered last
+    tier_order = create_map(*[value for i, tier in enumerate(TIERS) for value in (lit(tier), lit(i))])[col('tier')]
+    return stats_df.orderBy(tier_order.isNull(), tier_order, col('player_champ_name') == 'GLOBAL', 'player_champ_name',
+                            desc('player_individual_position'), desc('player_win'), 'stat_index')\
+        .select(*tier_champion_group, 'column_stats', 'AVG', 'Q1', 'Q2', 'Q3', 'count', 'knots')
+
+
+def build_multi_kills(match_df_exploded, main_lanes_df):
+    """
+    Average multi kills per game of each champion on its main lanes, and per lane over the ladder games (GLOBAL).
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import col, lit, mean
+
+    agg_exprs = [mean(col(column)).alias(column) for column in MULTI_KILL_COLUMNS]
+    champion_df = main_lanes_df.groupBy('player_champ_name', 'player_individual_position', 'player_win').agg(*agg_exprs)
+    global_df = match_df_exploded.where(col('is_ladder'))\
+        .groupBy('player_individual_position', 'player_win')\
+        .agg(*agg_exprs)\
+        .withColumn('player_champ_name', lit('GLOBAL'))
+    return order_champion_rows(champion_df.unionByName(global_df))\
+        .select('player_champ_name', 'player_individual_position', 'player_win', *MULTI_KILL_COLUMNS)
+
+
+def get_win_moments(match_df_exploded, main_lanes_df):
+    """
+    Moments of the stats of WIN_EFFECT_STATS per champion on its main lanes, and per lane over the ladder games (GLOBAL), the participants
+    missing a stat being skipped. The sums and cross products are aggregated in one pass per group level, then collected.
+    Returns: dict[tuple[str, str, bool], list], the moments of each (champion, position, win)
+    """
+    from pyspark.sql.functions import col, count, lit, sum as spark_sum
+
+    columns = [column for _, column in WIN_EFFECT_STATS]
+    aggregations = [count(lit(1)).alias('count'),
+                    *[spark_sum(col(column)).alias(f"sum_{i}") for i, column in enumerate(columns)],
+                    *[spark_sum(col(columns[i]) * col(columns[j])).alias(f"product_{i}_{j}") for i, j in WIN_EFFECT_PAIRS]]
+    champion_df = main_lanes_df.dropna(subset=columns)\
+        .groupBy('player_champ_name', 'player_individual_position', 'player_win').agg(*aggregations)
+    global_df = match_df_exploded.where(col('is_ladder')).dropna(subset=columns)\
+        .groupBy('player_individual_position', 'player_win').agg(*aggregations)\
+        .withColumn('player_champ_name', lit('GLOBAL'))
+
+    return {(row['player_champ_name'], row['player_individual_position'], row['player_win']):
+            get_moments(row['count'], [row[f"sum_{i}"] for i in range(len(columns))], [row[f"product_{i}_{j}"] for i, j in WIN_EFFECT_PAIRS])
+            for row in champion_df.unionByName(global_df).collect()}
+
+
+def get_ladder_games_df(match_df_exploded):
+    """
+    One row per ladder game with its duration and whether it ended in a surrender.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import col, first, max
+
+    return match_df_exploded.where(col('is_ladder'))\
+        .groupBy('game_id')\
+        .agg(first('game_duration').alias('game_duration'), max(col('player_ended_surrender')).alias('ff'))
+
+
+def build_duration(games_df):
+    """
+    Average and quartiles of the ladder games duration, in minutes.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import avg, col, lit, percentile, round
+
+    return games_df.agg(avg('game_duration').alias('average'), percentile('game_duration', [0.25, 0.5, 0.75], lit(1)).alias('quartiles'))\
+        .select(round(col('average') / 60, 2).alias('average'),
+                *[round(col('quartiles')[i] / 60, 2).alias(label) for i, label in enumerate(['q1', 'median', 'q3'])])
+
+
+def build_ff_stats(games_df):
+    """
+    Share of the ladder games ended in a surrender, then the share of the surrenders before and after EARLY_SURRENDER_S.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import col, count, lit, round, sum, when
+
+    early_ff = col('ff') & (col('game_duration') < EARLY_SURRENDER_S)
+    counts_df = games_df.agg(count(lit(1)).alias('games'),
+                             sum(when(col('ff'), 1).otherwise(0)).alias('ff_games'),
+                             sum(when(early_ff, 1).otherwise(0)).alias('early_ff_games'))
+    return counts_df.select(
+        round(col('ff_games') / col('games') * 100, 2).alias('percents_ff'),
+        round(col('early_ff_games') / col('ff_games') * 100, 2).alias('percents_pre_20_ff'),
+        round((col('ff_games') - col('early_ff_games')) / col('ff_games') * 100, 2).alias('percents_post_20_ff')
+    )
+
+
+def build_ff_per_mins(games_df):
+    """
+    Share of the surrenders of the ladder games per minute of game.
+    Returns: DataFrame
+    """
+    from pyspark.sql.functions import asc, col, count, floor, lit, round, sum
+    from pyspark.sql.window import Window
+
+    return games_df.where(col('ff'))\
+        .groupBy(floor(col('game_duration') / 60).alias('minute_bins'))\
+        .agg(count(lit(1)).alias('count'))\
+        .withColumn('count', round(col('count') / sum(col('count')).over(Window.partitionBy()) * 100, 2))\
+        .where(col('minute_bins') < FF_MINUTE_BINS_LIMIT)\
+        .orderBy(asc('minute_bins'))
+
+
+def get_csv_value(value):
+    """
+    Formats a value as Spark writes it in a CSV, booleans in lower case and None as an empty field.
+    Returns: str
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def write_artifact(df, path):
+    """
+    Collects the ordered rows of an artifact and replaces the file with them, without header as the back end reads them.
+    Returns: dict with the rows count and the sha256 of the file
+    """
+    lines = [",".join(get_csv_value(value) for value in row) for row in df.collect()]
+    write_file_atomically(path, lines)
+    return {'rows': len(lines), 'sha256': get_file_hash(path)}
+
+
+def write_array_artifact(array, path):
+    """
+    Replaces a numpy file with an array.
+    Returns: dict with the rows count (first dimension) and the sha256 of the file
+    """
+    import numpy as np
+
+    temp_path = get_temp_path(path)
+    with open(temp_path, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return {'rows': len(array), 'sha256': get_file_hash(path)}
+
+
+def write_cdf_artifact(knots_rows, path):
+    """
+    Replaces a CDF file with the float32 (rows, CDF_KNOTS) array of the knots of each row, NaN for a row without values.
+    Returns: dict with the rows count and the sha256 of the file
+    """
+    import numpy as np
+
+    knots = np.full((len(knots_rows), CDF_KNOTS), np.nan, dtype=np.float32)
+    for i, row_knots in enumerate(knots_rows):
+        if row_knots is not None:
+            knots[i] = np.asarray(row_knots, dtype=np.float64)
+    return write_array_artifact(knots, path)
+
+
+def write_win_effect_artifacts(moments, output):
+    """
+    Replaces win_effects.csv and stat_correlations.npy with the win effects and correlations of the moments, see get_win_effect_artifacts.
+    Returns: dict[str, dict], the rows count and sha256 of each file
+    """
+    rows, correlations = get_win_effect_artifacts(moments)
+    path = os.path.join(output, WIN_EFFECT_ARTIFACTS[0])
+    write_file_atomically(path, [",".join(get_csv_value(value) for value in row) for row in rows])
+    return {WIN_EFFECT_ARTIFACTS[0]: {'rows': len(rows), 'sha256': get_file_hash(path)},
+            WIN_EFFECT_ARTIFACTS[1]: write_array_artifact(correlations, os.path.join(output, WIN_EFFECT_ARTIFACTS[1]))}
+
+
+def write_percentile_artifacts(df, path, cdf_path):
+    """
+    Collects the ordered rows of a percentile artifact once, and writes its CSV file and the CDF file of the knots of its rows.
+    Returns: tuple[dict, dict], the rows count and sha256 of each file
+    """
+    rows = df.collect()
+    write_file_atomically(path, [",".join(get_csv_value(value) for value in row[:-1]) for row in rows])
+    return {'rows': len(rows), 'sha256': get_file_hash(path)}, write_cdf_artifact([row[-1] for row in rows], cdf_path)
+
+
+def get_file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_input_files(path):
+    """
+    Lists the data files of an input as Spark reads them, skipping the hidden and _ prefixed files.
+    Returns: list[str], sorted
+    """
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for directory, directories, file_names in os.walk(path):
+        directories[:] = [name for name in directories if not name.startswith(('.', '_'))]
+        files.extend(os.path.join(directory, name) for name in file_names if not name.startswith(('.', '_')))
+    return sorted(files)
+
+
+def describe_input(path):
+    """
+    Size and sha256 of each file of an input, and a hash of the whole input changing as soon as one file does.
+    Returns: dict
+    """
+    files = [{'path': os.path.relpath(file_path, path) if os.path.isdir(path) else os.path.basename(file_path),
+              'bytes': os.path.getsize(file_path),
+              'sha256': get_file_hash(file_path)} for file_path in get_input_files(path)]
+    input_hash = hashlib.sha256("\n".join(f"{file['path']}:{file['sha256']}" for file in files).encode("utf-8")).hexdigest()
+    return {'path': path, 'files': files, 'sha256': input_hash}
+
+
+def build_referential(spark, ladder_path, otps_path, output, input_format='csv', partitions=SHUFFLE_PARTITIONS, patch_range=None):
+    """
+    Builds every artifact of ARTIFACTS in output, each file being replaced as a whole, then writes manifest.json.
+    patch_range: dict of the first and last patch of the games, every patch when None
+    Returns: dict, the manifest
+    """
+    os.makedirs(output, exist_ok=True)
+    durations = {}
+
+    start = time.perf_counter()
+    match_df_exploded = get_match_df_exploded(spark, ladder_path, otps_path, input_format, partitions, patch_range)
+    participant_rows = match_df_exploded.count()
+    durations['match_df_exploded'] = time.perf_counter() - start
+    print(f"[INFO] - {datetime.now()} : {participant_rows} participant rows cached in {durations['match_df_exploded']:.1f}s")
+
+    main_lanes_df = filter_champion_lanes(match_df_exploded).persist()
+    games_df = get_ladder_games_df(match_df_exploded).persist()
+    builders = {
+        'average_percentiles.csv': lambda: build_average_percentiles(match_df_exploded, main_lanes_df),
+        'multi_kills.csv': lambda: build_multi_kills(match_df_exploded, main_lanes_df),
+        'duration.csv': lambda: build_duration(games_df),
+        'ff_per_mins.csv': lambda: build_ff_per_mins(games_df),
+        'ff_stats.csv': lambda: build_ff_stats(games_df),
+        'tier_percentiles.csv': lambda: build_tier_percentiles(match_df_exploded, main_lanes_df),
+        'win_effects.csv': lambda: get_win_moments(match_df_exploded, main_lanes_df)
+    }
+
+    artifacts = {}
+    for name in builders:
+        start = time.perf_counter()
+        if name in CDF_ARTIFACTS:
+            cdf_name = CDF_ARTIFACTS[name]
+            artifacts[name], artifacts[cdf_name] = write_percentile_artifacts(builders[name](), os.path.join(output, name), os.path.join(output, cdf_name))
+        elif name in WIN_EFFECT_ARTIFACTS:
+            artifacts.update(write_win_effect_artifacts(builders[name](), output))
+        else:
+            artifacts[name] = write_artifact(builders[name](), os.path.join(output, name))
+        durations[name] = time.perf_counter() - start
+        print(f"[INFO] - {datetime.now()} : {name} written, {artifacts[name]['rows']} rows in {durations[name]:.1f}s")
+
+    main_lanes_df.unpersist()
+    games_df.unpersist()
+    match_df_exploded.unpersist()
+
+    inputs = {'ladder': describe_input(ladder_path)}
+    if otps_path:
+        inputs['otps'] = describe_input(otps_path)
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec="seconds"),
+        'spark_version': spark.version,
+        'input_format': input_format,
+        'patches': patch_range,
+        'inputs': inputs,
+        'participant_rows': participant_rows,
+        'artifacts': artifacts,
+        'durations_s': {name: round(seconds, 3) for name, seconds in durations.items()}
+    }
+    write_file_atomically(os.path.join(output, "manifest.json"), [json.dumps(manifest, indent=2)])
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the referential CSV files of the back end from the crawled matches.")
+    parser.add_argument('--ladder', default="./data/matchs/", help="Matches of the ladder players, source of the GLOBAL rows, durations and surrenders.")
+    parser.add_argument('--otps', default="./data/otp_matchs/", help="Matches of the OTPs, added to the ladder ones for the per champion rows. Empty to skip.")
+    parser.add_argument('--input-format', choices=['csv', 'parquet', 'participants'], default='csv',
+                        help="csv : crawler CSV lines, parquet : wide Parquet layout, participants : participants Parquet layout.")
+    parser.add_argument('--output', default="./results/referential", help="Directory of the artifacts, e.g. ../Web/Back_end/data.")
+    parser.add_argument('--engine', choices=['spark', 'duckdb'], default='spark', help="duckdb : same files without a JVM, see referential_duckdb.py.")
+    parser.add_argument('--master', default="local[*]")
+    parser.add_argument('--partitions', type=int, default=SHUFFLE_PARTITIONS)
+    parser.add_argument('--memory-limit-mb', type=int, help="Memory of the duckdb engine, beyond which it spills to disk.")
+    parser.add_argument('--patches', help="Patch range of the games, e.g. 15.1-15.4 or 15.4, every patch when empty. See publish_referential.py.")
+    args = parser.parse_args()
+    patch_range = parse_patch_range(args.patches) if args.patches else None
+
+    if args.engine == 'duckdb':
+        from referential_duckdb import MEMORY_LIMIT_MB, build_referential_duckdb
+
+        start = time.perf_counter()
+        build_referential_duckdb(args.ladder, args.otps or None, args.output, args.input_format, args.memory_limit_mb or MEMORY_LIMIT_MB,
+                                 patch_range=patch_range)
+        print(f"[INFO] - {datetime.now()} : Referential built in {args.output} in {time.perf_counter() - start:.1f}s")
+        raise SystemExit(0)
+
+    from pyspark.sql import SparkSession
+
+    spark = SparkSession.builder\
+            .master(args.master)\
+            .appName("Referential build")\
+            .config("spark.sql.shuffle.partitions", args.partitions)\
+            .config("spark.sql.adaptive.enabled", "true")\
+            .getOrCreate()
+
+    start = time.perf_counter()
+    build_referential(spark, args.ladder, args.otps or None, args.output, args.input_format, args.partitions, patch_range)
+    print(f"[INFO] - {datetime.now()} : Referential built in {args.output} in {time.perf_counter() - start:.1f}s")
+    spark.stop()
@@ -0,0 +1,260 @@
+import argparse
+import math
+import os
+import sqlite3
+import threading
+
+from datetime import datetime
+
+
+POSITIONS = ['TOP', 'JUNGLE', 'MIDDLE', 'BOTTOM', 'UTILITY']
+
+# Samples of a (champion, position, win) cell past which its quartiles are considered stable
+COVERAGE_TARGET_SAMPLES = int(os.getenv("COVERAGE_TARGET_SAMPLES", 300))
+# Share of the games of a champion played in a lane for the lane to count, as the champ_lanes filter of the OTP notebook
+CHAMPION_LANE_SHARE = 0.35
+
+
+def get_quartile_uncertainty(samples):
+    """
+    Relative uncertainty of the quartiles of a cell, the standard error of a quantile decreasing as 1 / sqrt(n).
+    Returns: float
+    """
+    return 1 / math.sqrt(samples + 1)
+
+
+def get_sample_gain(samples, target_samples=COVERAGE_TARGET_SAMPLES):
+    """
+    Uncertainty removed from a cell by one more sample, 0 once the cell reaches the target.
+    Returns: float
+    """
+    if samples >= target_samples:
+        return 0.0
+    return get_quartile_uncertainty(samples) - get_quartile_uncertainty(samples + 1)
+
+
+class CoverageTracker:
+    """
+    Samples per (champion, position, win) cell of the referential, and champions played by each crawled player, stored in SQLite.
+    A player is scored by the quartile uncertainty one of its matches is expected to remove, from the champions and lanes it played
+    in the matches seen so far (or its champion for an OTP). Players never seen get the gain of an average match.
+    """
+    def __init__(self, db_path, target_samples=COVERAGE_TARGET_SAMPLES):
+        self.db_path = db_path
+        self.target_samples = target_samples
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS cell_samples (
+                champion TEXT NOT NULL,
+                position TEXT NOT NULL,
+                win INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                PRIMARY KEY (champion, position, win)
+            )
+        """)
+        # position is empty for a champion known without its lane (OTP file)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS player_champions (
+                puuid TEXT NOT NULL,
+                champion TEXT NOT NULL,
+                position TEXT NOT NULL,
+                games INTEGER NOT NULL,
+                PRIMARY KEY (puuid, champion, position)
+            )
+        """)
+        connection.execute("CREATE TABLE IF NOT EXISTS recorded_matches (match_id TEXT PRIMARY KEY)")
+        connection.commit()
+
+        self._cells = {(champion, position, bool(win)): samples for champion, position, win, samples
+                       in connection.execute("SELECT champion, position, win, samples FROM cell_samples")}
+        self._recorded_since_rescore = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA busy_timeout=60000")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def record_match(self, api_response):
+        """
+        Counts the participants of a match in their cell and in the champions of their player, once per match.
+        Returns: bool, False when the match was already recorded
+        """
+        participants = [participant for participant in api_response['info']['participants'] if participant.get('individualPosition') in POSITIONS]
+        connection = self._connection()
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = connection.execute("INSERT OR IGNORE INTO recorded_matches (match_id) VALUES (?)", (api_response['metadata']['matchId'],))
+                if cursor.rowcount == 0:
+                    connection.execute("COMMIT")
+                    return False
+                for participant in participants:
+                    cell = (participant['championName'], participant['individualPosition'], bool(participant['win']))
+                    connection.execute(
+                        "INSERT INTO cell_samples (champion, position, win, samples) VALUES (?, ?, ?, 1) "
+                        "ON CONFLICT (champion, position, win) DO UPDATE SET samples = samples + 1",
+                        (cell[0], cell[1], int(cell[2])))
+                    connection.execute(
+                        "INSERT INTO player_champions (puuid, champion, position, games) VALUES (?, ?, ?, 1) "
+                        "ON CONFLICT (puuid, champion, position) DO UPDATE SET games = games + 1",
+                        (participant['puuid'], cell[0], cell[1]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            for participant in participants:
+                cell = (participant['championName'], participant['individualPosition'], bool(participant['win']))
+                self._cells[cell] = self._cells.get(cell, 0) + 1
+            self._recorded_since_rescore += 1
+        return True
+
+    def is_rescore_due(self, every_matches):
+        """
+        Returns: bool, True once every every_matches recorded matches, for a single caller
+        """
+        with self._lock:
+            if self._recorded_since_rescore < every_matches:
+                return False
+            self._recorded_since_rescore = 0
+            return True
+
+    def declare_player_champions(self, player_champions):
+        """
+        Records the champion of players known before their matches, e.g. the OTPs of otps_puuid.txt.
+        """
+        self._connection().executemany(
+            "INSERT OR IGNORE INTO player_champions (puuid, champion, position, games) VALUES (?, ?, '', 1)",
+            player_champions)
+
+    def get_samples(self, champion, position, win):
+        with self._lock:
+            return self._cells.get((champion, position, win), 0)
+
+    def get_champion_lanes(self, champion):
+        """
+        Share of the games of a champion in each of its lanes, every lane being equally likely for a champion not seen yet.
+        Returns: dict[str, float]
+        """
+        with self._lock:
+            games = {position: self._cells.get((champion, position, True), 0) + self._cells.get((champion, position, False), 0)
+                     for position in POSITIONS}
+        total = sum(games.values())
+        if total == 0:
+            return {position: 1 / len(POSITIONS) for position in POSITIONS}
+        lanes = {position: count for position, count in games.items() if count / total >= CHAMPION_LANE_SHARE}
+        lanes = lanes or {max(games, key=games.get): 1}
+        return {position: count / sum(lanes.values()) for position, count in lanes.items()}
+
+    def get_cell_gain(self, champion, position):
+        """
+        Expected gain of one game of a champion in a lane, won or lost with the same odds.
+        Returns: float
+        """
+        return (get_sample_gain(self.get_samples(champion, position, True), self.target_samples)
+                + get_sample_gain(self.get_samples(champion, position, False), self.target_samples)) / 2
+
+    def get_average_gain(self):
+        """
+        Expected gain of the game of a player never seen, the champions and lanes being as frequent as in the matches seen so far.
+        Returns: float
+        """
+        with self._lock:
+            cells = dict(self._cells)
+        if not cells:
+            return get_sample_gain(0, self.target_samples)
+        return sum(samples * get_sample_gain(samples, self.target_samples) for samples in cells.values()) / sum(cells.values())
+
+    def get_player_cells(self, puuid):
+        """
+        Share of the games of a player on each champion and lane, the lanes of an OTP champion coming from the matches seen so far.
+        Returns: dict[tuple[str, str], float], empty for a player never seen
+        """
+        rows = self._connection().execute("SELECT champion, position, games FROM player_champions WHERE puuid = ?", (puuid,)).fetchall()
+        total_games = sum(games for _, _, games in rows)
+        cells = {}
+        for champion, position, games in rows:
+            lanes = {position: 1} if position else self.get_champion_lanes(champion)
+            for lane, share in lanes.items():
+                cells[(champion, lane)] = cells.get((champion, lane), 0) + games / total_games * share
+        return cells
+
+    def get_player_gain(self, puuid, average_gain=None):
+        """
+        Expected gain of one match of a player, from the champions and lanes it played.
+        Returns: float
+        """
+        cells = self.get_player_cells(puuid)
+        if not cells:
+            return self.get_average_gain() if average_gain is None else average_gain
+        return sum(share * self.get_cell_gain(champion, lane) for (champion, lane), share in cells.items())
+
+    def get_matches_to_target(self, puuid):
+        """
+        Matches of a player needed for its most missing cell to reach the target, won and lost games being equally likely.
+        Returns: int | None, None for a player never seen
+        """
+        cells = self.get_player_cells(puuid)
+        if not cells:
+            return None
+        return max(math.ceil(sum(max(0, self.target_samples - self.get_samples(champion, lane, win)) for win in (True, False)) / share)
+                   for (champion, lane), share in cells.items())
+
+    def score_players(self, puuids):
+        """
+        Returns: dict[str, float], the expected gain of one match of each player
+        """
+        average_gain = self.get_average_gain()
+        return {puuid: self.get_player_gain(puuid, average_gain) for puuid in puuids}
+
+    def get_under_sampled_cells(self):
+        """
+        Lists the cells seen below the target, least sampled first.
+        Returns: list[tuple[str, str, bool, int]]
+        """
+        with self._lock:
+            cells = [(champion, position, win, samples) for (champion, position, win), samples in self._cells.items()
+                     if samples < self.target_samples]
+        return sorted(cells, key=lambda cell: cell[3])
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def seed_from_archive(coverage, archive_root):
+    """
+    Counts the matches of the raw archive, so the coverage of a crawl started before the tracker is known.
+    """
+    from match_archive import iter_archived_matches
+
+    recorded = 0
+    for _, api_response in iter_archived_matches(archive_root):
+        recorded += coverage.record_match(api_response)
+    print(f"[INFO] - {datetime.now()} : {recorded} archived matches counted in the coverage")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows the samples per (champion, position, win) cell of the referential.")
+    parser.add_argument('--db', default="./checkpoints/coverage.db")
+    parser.add_argument('--seed-archive', help="Counts the matches of a raw match archive first, e.g. ./archive.")
+    parser.add_argument('--limit', type=int, default=30, help="Number of under-sampled cells shown.")
+    args = parser.parse_args()
+
+    coverage = CoverageTracker(args.db)
+    if args.seed_archive:
+        seed_from_archive(coverage, args.seed_archive)
+
+    under_sampled = coverage.get_under_sampled_cells()
+    print(f"{len(under_sampled)} cells under {coverage.target_samples} samples, average match gain {coverage.get_average_gain():.5f}")
+    for champion, position, win, samples in under_sampled[:args.limit]:
+        print(f"{champion:<16}| {position:<8}| {'Win' if win else 'Loose':<6}| {samples:>6}")
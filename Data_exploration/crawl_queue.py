@@ -0,0 +1,277 @@
+import sqlite3
+import threading
+import time
+
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+# Deepest work first : match details are drained before new pages and players are opened
+KIND_PRIORITIES = {'match': 0, 'page': 1, 'player': 2}
+
+# Routing cluster of the items enqueued before the queue knew clusters
+DEFAULT_CLUSTER = 'europe'
+
+
+class CrawlQueue:
+    """
+    Durable work queue of the crawler, stored in SQLite.
+    Every item (player, match ids page, match detail) goes through pending -> in_flight -> done / failed,
+    so a restarted crawler resumes exactly where it stopped. Each thread gets its own connection.
+    Items carry the routing cluster they are fetched from, so each cluster can be drained by its own workers,
+    and a score ordering the items of a kind, highest first (e.g. the coverage gain of a player, see crawl_coverage.py).
+    An item retried after a transient error stays pending but is not claimed before its not_before time.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS work_items (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                cluster TEXT NOT NULL DEFAULT '{DEFAULT_CLUSTER}',
+                score REAL NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(work_items)")]
+        if 'cluster' not in columns:
+            connection.execute(f"ALTER TABLE work_items ADD COLUMN cluster TEXT NOT NULL DEFAULT '{DEFAULT_CLUSTER}'")
+        if 'score' not in columns:
+            connection.execute("ALTER TABLE work_items ADD COLUMN score REAL NOT NULL DEFAULT 0")
+        if 'not_before' not in columns:
+            connection.execute("ALTER TABLE work_items ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+        connection.execute("DROP INDEX IF EXISTS work_items_state")
+        connection.execute("DROP INDEX IF EXISTS work_items_cluster_state")
+        connection.execute("CREATE INDEX IF NOT EXISTS work_items_state_score ON work_items (state, priority, score DESC, updated_at)")
+        connection.execute("CREATE INDEX IF NOT EXISTS work_items_cluster_state_score ON work_items (cluster, state, priority, score DESC, updated_at)")
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA busy_timeout=60000")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, kind: str, key: str, payload: str | None = None, state: str = PENDING, cluster: str = DEFAULT_CLUSTER) -> bool:
+        """
+        Adds an item unless it is already known, whatever its state.
+        Returns: bool, True when the item was added
+        """
+        return self.enqueue_many(kind, [(key, payload)], state, cluster) == 1
+
+    def enqueue_many(self, kind: str, items: list[tuple[str, str | None]], state: str = PENDING, cluster: str = DEFAULT_CLUSTER) -> int:
+        """
+        Adds several items of a kind in one transaction, skipping the known ones.
+        Returns: int, the number of items added
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            added = 0
+            for key, payload in items:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO work_items (kind, key, payload, priority, state, updated_at, cluster) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, key, payload, KIND_PRIORITIES[kind], state, now, cluster))
+                added += cursor.rowcount
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def filter_unknown(self, kind: str, keys: list[str]) -> list[str]:
+        """
+        Keeps the keys that are not in the queue yet, in their original order.
+        Returns: list[str]
+        """
+        known = set()
+        connection = self._connection()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            known.update(row[0] for row in connection.execute(
+                f"SELECT key FROM work_items WHERE kind = ? AND key IN ({placeholders})", [kind] + chunk))
+        return [key for key in keys if key not in known]
+
+    def claim(self, cluster: str | None = None) -> tuple[str, str, str | None, str] | None:
+        """
+        Atomically moves the next pending item (of the given cluster, of any when None) to in_flight, deepest kind first,
+        then highest score, then oldest. Items waiting for a retry are skipped until their not_before time.
+        Returns: tuple[str, str, str | None, str] | None with the kind, key, payload and cluster, None when nothing is pending
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if cluster is None:
+                row = connection.execute(
+                    "SELECT kind, key, payload, cluster FROM work_items WHERE state = ? AND not_before <= ? "
+                    "ORDER BY priority, score DESC, updated_at LIMIT 1",
+                    (PENDING, now)).fetchone()
+            else:
+                row = connection.execute(
+                    "SELECT kind, key, payload, cluster FROM work_items WHERE cluster = ? AND state = ? AND not_before <= ? "
+                    "ORDER BY priority, score DESC, updated_at LIMIT 1",
+                    (cluster, PENDING, now)).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE work_items SET state = ?, attempts = attempts + 1, updated_at = ? WHERE kind = ? AND key = ?",
+                    (IN_FLIGHT, time.time(), row[0], row[1]))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return row
+
+    def complete(self, kind: str, key: str, children: dict[str, list[tuple[str, str | None]]] | None = None) -> dict[str, int]:
+        """
+        Marks an item as done and enqueues the items it produced in the same transaction,
+        so a crash never loses children nor processes an item twice. Children belong to the cluster of their parent and inherit its score.
+        Returns: dict[str, int] with the number of children added per kind
+        """
+        connection = self._connection()
+        now = time.time()
+        added = {}
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            parent = connection.execute("SELECT cluster, score FROM work_items WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            cluster, score = parent if parent is not None else (DEFAULT_CLUSTER, 0)
+            for child_kind, items in (children or {}).items():
+                added[child_kind] = 0
+                for child_key, child_payload in items:
+                    cursor = connection.execute(
+                        "INSERT OR IGNORE INTO work_items (kind, key, payload, priority, state, updated_at, cluster, score) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (child_kind, child_key, child_payload, KIND_PRIORITIES[child_kind], PENDING, now, cluster, score))
+                    added[child_kind] += cursor.rowcount
+            connection.execute(
+                "UPDATE work_items SET state = ?, last_error = NULL, updated_at = ? WHERE kind = ? AND key = ?",
+                (DONE, now, kind, key))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return added
+
+    def fail(self, kind: str, key: str, error: str) -> None:
+        """
+        Marks an item as failed, keeping the error for later inspection.
+        Returns: None
+        """
+        self._connection().execute(
+            "UPDATE work_items SET state = ?, last_error = ?, updated_at = ? WHERE kind = ? AND key = ?",
+            (FAILED, error, time.time(), kind, key))
+
+    def get_attempts(self, kind: str, key: str) -> int:
+        """
+        Counts the claims of an item, the current one included.
+        Returns: int
+        """
+        row = self._connection().execute("SELECT attempts FROM work_items WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return row[0] if row is not None else 0
+
+    def retry(self, kind: str, key: str, error: str, delay_s: float) -> None:
+        """
+        Puts an item back to pending after a transient error, claimable again in delay_s seconds.
+        Returns: None
+        """
+        now = time.time()
+        self._connection().execute(
+            "UPDATE work_items SET state = ?, last_error = ?, not_before = ?, updated_at = ? WHERE kind = ? AND key = ?",
+            (PENDING, error, now + delay_s, now, kind, key))
+
+    def release(self, kind: str, key: str) -> None:
+        """
+        Puts an in_flight item back to pending, e.g. when the crawler stops before processing it.
+        Returns: None
+        """
+        self._connection().execute(
+            "UPDATE work_items SET state = ?, attempts = attempts - 1, updated_at = ? WHERE kind = ? AND key = ? AND state = ?",
+            (PENDING, time.time(), kind, key, IN_FLIGHT))
+
+    def recover_in_flight(self) -> int:
+        """
+        Puts back to pending the items left in_flight by a crashed run, to be called before the workers start.
+        Returns: int, the number of recovered items
+        """
+        cursor = self._connection().execute(
+            "UPDATE work_items SET state = ?, updated_at = ? WHERE state = ?",
+            (PENDING, time.time(), IN_FLIGHT))
+        return cursor.rowcount
+
+    def get_pending(self, kind: str) -> list[tuple[str, str | None]]:
+        """
+        Lists the pending items of a kind.
+        Returns: list[tuple[str, str | None]] of (key, payload)
+        """
+        return self._connection().execute("SELECT key, payload FROM work_items WHERE kind = ? AND state = ?", (kind, PENDING)).fetchall()
+
+    def set_scores(self, kind: str, scores: dict[str, float]) -> None:
+        """
+        Updates the score of pending items of a kind in one transaction.
+        Returns: None
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "UPDATE work_items SET score = ? WHERE kind = ? AND key = ? AND state = ?",
+                [(score, kind, key, PENDING) for key, score in scores.items()])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def count(self, state: str, kind: str | None = None, cluster: str | None = None) -> int:
+        """
+        Counts the items in a state, of every kind and cluster or of the given ones.
+        Returns: int
+        """
+        query = "SELECT COUNT(*) FROM work_items WHERE state = ?"
+        parameters = [state]
+        if kind is not None:
+            query += " AND kind = ?"
+            parameters.append(kind)
+        if cluster is not None:
+            query += " AND cluster = ?"
+            parameters.append(cluster)
+        return self._connection().execute(query, parameters).fetchone()[0]
+
+    def clusters(self) -> list[str]:
+        """
+        Lists the clusters having items.
+        Returns: list[str]
+        """
+        return [row[0] for row in self._connection().execute("SELECT DISTINCT cluster FROM work_items ORDER BY cluster")]
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """
+        Counts the items per kind and state.
+        Returns: dict[str, dict[str, int]]
+        """
+        summary = {}
+        for kind, state, total in self._connection().execute("SELECT kind, state, COUNT(*) FROM work_items GROUP BY kind, state"):
+            summary.setdefault(kind, {})[state] = total
+        return summary
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
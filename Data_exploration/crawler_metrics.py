@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+# Local port of the Prometheus text endpoint (http://127.0.0.1:PORT/metrics), 0 disables it
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+# Seconds between two summary lines, 0 disables them
+METRICS_SUMMARY_INTERVAL_S = float(os.getenv("METRICS_SUMMARY_INTERVAL_S", 60))
+# Window of the requests / s and matches / min rates
+RATE_WINDOW_S = 60
+
+
+def get_endpoint_name(url: str) -> str:
+    """
+    Groups the Riot URLs by API and resource, e.g. "match-v5/matches" for a match detail and "match-v5/matches/ids" for a match ids page.
+    Returns: str
+    """
+    path = urlparse(url).path
+    segments = [segment for segment in path.split("/") if segment]
+    if len(segments) < 4:
+        return path
+    endpoint = f"{segments[1]}-{segments[2]}/{segments[3]}"
+    return endpoint + "/ids" if segments[-1] == "ids" else endpoint
+
+
+class _RateWindow:
+    """
+    Events of the last RATE_WINDOW_S seconds, each with a count.
+    """
+    def __init__(self):
+        self._events = deque()
+        self._total = 0
+
+    def add(self, count=1):
+        self._events.append((time.monotonic(), count))
+        self._total += count
+
+    def get_total(self):
+        limit = time.monotonic() - RATE_WINDOW_S
+        while self._events and self._events[0][0] <= limit:
+            self._total -= self._events.popleft()[1]
+        return self._total
+
+
+class CrawlerMetrics:
+    """
+    Live counters of a crawl : requests per endpoint and status, time spent waiting for a quota slot or for Riot,
+    match ids deduplicated and matches persisted. Quota utilization and queue depth are read when the metrics are rendered.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._request_rates = {}
+        self._request_seconds = {}
+        self._quota_wait_seconds = {}
+        self._dedupe = {'hit': 0, 'miss': 0}
+        self._persisted = 0
+        self._persisted_rate = _RateWindow()
+        self._start = time.monotonic()
+        self.key_pool = None
+        self.queue = None
+
+    def record_request(self, url, status, seconds):
+        """
+        Counts a response, status being the HTTP status or "error" when no response came back.
+        """
+        endpoint = get_endpoint_name(url)
+        with self._lock:
+            self._requests[(endpoint, str(status))] = self._requests.get((endpoint, str(status)), 0) + 1
+            self._request_rates.setdefault(endpoint, _RateWindow()).add()
+            self._request_seconds[endpoint] = self._request_seconds.get(endpoint, 0.0) + seconds
+
+    def record_quota_wait(self, host, seconds):
+        with self._lock:
+            self._quota_wait_seconds[host] = self._quota_wait_seconds.get(host, 0.0) + seconds
+
+    def record_dedupe(self, hits, misses):
+        """
+        Counts the match ids already queued or downloaded (hits) and the new ones (misses).
+        """
+        with self._lock:
+            self._dedupe['hit'] += hits
+            self._dedupe['miss'] += misses
+
+    def record_persisted(self, matches):
+        with self._lock:
+            self._persisted += matches
+            self._persisted_rate.add(matches)
+
+    def get_request_rates(self):
+        """
+        Returns: dict[str, float], requests / s per endpoint over the last RATE_WINDOW_S seconds
+        """
+        window = min(RATE_WINDOW_S, max(time.monotonic() - self._start, 1))
+        with self._lock:
+            return {endpoint: rate.get_total() / window for endpoint, rate in self._request_rates.items()}
+
+    def get_status_count(self, status_class):
+        """
+        Counts the responses whose status starts with status_class, e.g. "429" or "5".
+        Returns: int
+        """
+        with self._lock:
+            return sum(total for (_, status), total in self._requests.items() if status.startswith(status_class))
+
+    def get_dedupe_hit_rate(self):
+        with self._lock:
+            seen = self._dedupe['hit'] + self._dedupe['miss']
+            return self._dedupe['hit'] / seen if seen > 0 else 0.0
+
+    def get_persisted_per_minute(self):
+        window = min(RATE_WINDOW_S, max(time.monotonic() - self._start, 1))
+        with self._lock:
+            return self._persisted_rate.get_total() * 60 / window
+
+    def get_quota_utilization(self):
+        return self.key_pool.get_utilization() if self.key_pool is not None else {}
+
+    def get_queue_depth(self):
+        return self.queue.summary() if self.queue is not None else {}
+
+    def render_prometheus(self):
+        """
+        Renders the metrics in the Prometheus text format.
+        Returns: str
+        """
+        lines = []
+
+        def add_metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            requests = dict(self._requests)
+            request_seconds = dict(self._request_seconds)
+            quota_wait_seconds = dict(self._quota_wait_seconds)
+            dedupe = dict(self._dedupe)
+            persisted = self._persisted
+
+        add_metric("riot_crawler_requests_total", "counter", "Riot API responses per endpoint and HTTP status.",
+                   [({'endpoint': endpoint, 'status': status}, total) for (endpoint, status), total in sorted(requests.items())])
+        add_metric("riot_crawler_requests_per_second", "gauge", f"Riot API requests per second over the last {RATE_WINDOW_S}s.",
+                   [({'endpoint': endpoint}, round(rate, 3)) for endpoint, rate in sorted(self.get_request_rates().items())])
+        add_metric("riot_crawler_request_seconds_total", "counter", "Time spent waiting for Riot responses.",
+                   [({'endpoint': endpoint}, round(seconds, 3)) for endpoint, seconds in sorted(request_seconds.items())])
+        add_metric("riot_crawler_quota_wait_seconds_total", "counter", "Time spent waiting for a free quota slot.",
+                   [({'host': host}, round(seconds, 3)) for host, seconds in sorted(quota_wait_seconds.items())])
+        add_metric("riot_crawler_quota_utilization", "gauge", "Share of the quota of the active keys used in each rate limit window.",
+                   [({'host': host, 'window': f"{calls}/{period}s"}, round(ratio, 4))
+                    for host, windows in sorted(self.get_quota_utilization().items()) for calls, period, ratio in windows])
+        add_metric("riot_crawler_match_ids_total", "counter", "Match ids of the history pages, already known (hit) or new (miss).",
+                   [({'result': result}, total) for result, total in dedupe.items()])
+        add_metric("riot_crawler_dedupe_hit_rate", "gauge", "Share of the match ids already queued or downloaded.",
+                   [({}, round(self.get_dedupe_hit_rate(), 4))])
+        add_metric("riot_crawler_matches_persisted_total", "counter", "Matches written to disk.", [({}, persisted)])
+        add_metric("riot_crawler_matches_persisted_per_minute", "gauge", f"Matches written per minute over the last {RATE_WINDOW_S}s.",
+                   [({}, round(self.get_persisted_per_minute(), 2))])
+        add_metric("riot_crawler_queue_items", "gauge", "Work queue items per kind and state.",
+                   [({'kind': kind, 'state': state}, total) for kind, states in sorted(self.get_queue_depth().items())
+                    for state, total in sorted(states.items())])
+        return "\n".join(lines) + "\n"
+
+    def get_summary_line(self):
+        """
+        One line summing up the crawl, e.g. to tell whether it is quota-bound (utilization close to 100%) or slowed down by errors.
+        Returns: str
+        """
+        request_rates = self.get_request_rates()
+        rates = ", ".join(f"{endpoint} {rate:.2f}" for endpoint, rate in sorted(request_rates.items()))
+        quotas = ", ".join(f"{host} " + " ".join(f"{ratio:.0%} of {calls}/{period}s" for calls, period, ratio in windows)
+                           for host, windows in sorted(self.get_quota_utilization().items()))
+        pending = {kind: states.get('pending', 0) for kind, states in self.get_queue_depth().items()}
+        return (f"{sum(request_rates.values()):.2f} req/s ({rates}) | quota {quotas or '-'} | "
+                f"429 : {self.get_status_count('429')}, 5xx : {self.get_status_count('5')} | "
+                f"dedupe hit rate {self.get_dedupe_hit_rate():.0%} | {self.get_persisted_per_minute():.1f} matches/min | "
+                f"pending {pending}")
+
+
+_metrics = CrawlerMetrics()
+
+
+def get_metrics() -> CrawlerMetrics:
+    return _metrics
+
+
+class MetricsReporter:
+    """
+    Serves the metrics on http://127.0.0.1:port/metrics and prints a summary line every summary_interval_s, both in daemon threads.
+    """
+    def __init__(self, metrics, port=METRICS_PORT, summary_interval_s=METRICS_SUMMARY_INTERVAL_S):
+        self.metrics = metrics
+        self.port = port
+        self.summary_interval_s = summary_interval_s
+        self._server = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self.port > 0:
+            metrics = self.metrics
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.render_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            try:
+                self._server = ThreadingHTTPServer(("127.0.0.1", self.port), MetricsHandler)
+            except OSError as e:
+                print(f"[WARNING] - {datetime.now()} : Metrics endpoint not started on port {self.port} : {e}")
+            else:
+                threading.Thread(target=self._server.serve_forever, daemon=True).start()
+                print(f"[INFO] - {datetime.now()} : Metrics served on http://127.0.0.1:{self.port}/metrics")
+
+        if self.summary_interval_s > 0:
+            threading.Thread(target=self._print_summaries, daemon=True).start()
+
+    def _print_summaries(self):
+        while not self._stop_event.wait(self.summary_interval_s):
+            print(f"[INFO] - {datetime.now()} : {self.metrics.get_summary_line()}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        print(f"[INFO] - {datetime.now()} : {self.metrics.get_summary_line()}")
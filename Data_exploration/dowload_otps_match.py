@@ -1,57 +1,226 @@
-import os
-import requests
-import urllib3
+import argparse
+import asyncio
+import hashlib
 import json
+import os
 import time
 
 from bs4 import BeautifulSoup
 from datetime import datetime
+from output_writers import write_bytes_atomically, write_file_atomically
+from urllib.parse import urlparse
+
+
+ONETRICKS_URL = "https://www.onetricks.gg/fr/champions/ranking/[CHAMPION]"
+OTPS_PER_CHAMPION = 3
+REGION = "EUW1"
+
+# Pages fetched at the same time, and requests per second allowed on a host
+MAX_CONCURRENCY = 8
+HOST_REQUESTS_PER_SECOND = 2
+# Pages and their ETag / Last-Modified, sent back as conditional headers on the next run
+CACHE_PATH = "./cache/onetricks"
+
+
+def get_champion_slug(champion):
+    return champion.replace(' ', '').replace('.', '').replace('\'', '')
+
+
+def get_parser_name():
+    """
+    lxml is several times faster than html.parser, which stays the fallback when lxml is not installed.
+    """
+    try:
+        import lxml
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+def parse_otps(html, champion, region=REGION, limit=OTPS_PER_CHAMPION, parser_name=None):
+    """
+    Reads the first players of the region in the ranking table of a champion page.
+    Returns: list[str] of "champion;name;tag" lines
+    """
+    soup = BeautifulSoup(html, parser_name or get_parser_name())
+    table = soup.find("table", class_="utils_tablePlayers__lh0ZH")
+    if table is None:
+        raise ValueError(f"No ranking table in the page of {champion}")
+
+    otps = []
+    for row in table.find_all("tr"):
+        if len(otps) == limit:
+            break
+        try:
+            values = [col.text.strip() for col in row.find_all("td")]
+            if region in values[4]:
+                name_tag_split = values[4].split("   ")
+                name = name_tag_split[0]
+                tag = name_tag_split[1].split(" ")[0].replace("#", "")
+                otps.append(f"{champion};{name};{tag}")
+        except Exception:
+            continue
+    return otps
+
+
+class HttpCache:
+    """
+    Disk cache of the pages, one body and one metadata file per URL. The ETag and Last-Modified of a cached page are sent
+    back, the body being reused when the server answers 304 Not Modified.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _get_paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{key}.html"), os.path.join(self.path, f"{key}.json")
+
+    def get_conditional_headers(self, url):
+        body_path, metadata_path = self._get_paths(url)
+        if not (os.path.exists(body_path) and os.path.exists(metadata_path)):
+            return {}
+        with open(metadata_path, "r", encoding="utf-8") as metadata_file:
+            metadata = json.load(metadata_file)
+        headers = {}
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+        return headers
 
+    def read(self, url):
+        with open(self._get_paths(url)[0], "rb") as body_file:
+            return body_file.read()
 
+    def write(self, url, body, etag, last_modified):
+        body_path, metadata_path = self._get_paths(url)
+        # The bytes received, so a cached page parses like a fetched one
+        write_bytes_atomically(body_path, body)
+        write_file_atomically(metadata_path, [json.dumps({'url': url, 'etag': etag, 'last_modified': last_modified})])
+
+
+class HostBudget:
+    """
+    Spaces the requests sent to a same host by at least 1 / requests_per_second seconds, whatever the concurrency.
+    """
+    def __init__(self, requests_per_second=HOST_REQUESTS_PER_SECOND):
+        self.interval = 1 / requests_per_second
+        self._next_slots = {}
+        self._locks = {}
+
+    async def acquire(self, url):
+        host = urlparse(url).hostname
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slots.get(host, now))
+            self._next_slots[host] = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+async def fetch_page(session, url, cache, host_budget, semaphore):
+    """
+    Fetches a page through the cache, a 304 answer reusing the cached body.
+    Returns: tuple[bytes, bool], the page and whether it came from the cache
+    """
+    async with semaphore:
+        await host_budget.acquire(url)
+        async with session.get(url, headers=cache.get_conditional_headers(url)) as response:
+            if response.status == 304:
+                return cache.read(url), True
+            if response.status != 200:
+                raise Exception(f"HTTP {response.status} for {url}")
+            body = await response.read()
+            cache.write(url, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            return body, False
+
+
+async def scrape_otps(champions, concurrency=MAX_CONCURRENCY, requests_per_second=HOST_REQUESTS_PER_SECOND, cache_path=CACHE_PATH):
+    """
+    Fetches and parses the champion pages concurrently, sharing one connection pool.
+    Returns: dict[str, list[str]], the OTPs of each champion whose page was read, failed champions being left out
+    """
+    import aiohttp
+
+    cache = HttpCache(cache_path)
+    host_budget = HostBudget(requests_per_second)
+    semaphore = asyncio.Semaphore(concurrency)
+    parser_name = get_parser_name()
+    results = {}
+
+    async def scrape_champion(session, champion):
+        url = ONETRICKS_URL.replace("[CHAMPION]", get_champion_slug(champion))
+        try:
+            html, cached = await fetch_page(session, url, cache, host_budget, semaphore)
+            results[champion] = parse_otps(html, champion, parser_name=parser_name)
+            print(f"[INFO] - {datetime.now()} : {champion} otps found{' (not modified)' if cached else ''}")
+        except Exception as e:
+            print(f"[ERROR] - {datetime.now()} : {champion} have found an error\n{e}")
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+        await asyncio.gather(*(scrape_champion(session, champion) for champion in champions))
+    return results
+
+
+def parse_fixtures(champions, fixtures_path):
+    """
+    Parses saved pages named {champion slug}.html instead of fetching them.
+    Returns: dict[str, list[str]]
+    """
+    parser_name = get_parser_name()
+    results = {}
+    for champion in champions:
+        fixture_path = os.path.join(fixtures_path, f"{get_champion_slug(champion)}.html")
+        if os.path.exists(fixture_path):
+            with open(fixture_path, "rb") as fixture_file:
+                results[champion] = parse_otps(fixture_file.read(), champion, parser_name=parser_name)
+    return results
+
+
+def write_otps_file(path, champions, results):
+    """
+    Rewrites the OTPs file in champion order without duplicates, keeping the previous lines of the champions not read this
+    time : running the scraper twice gives the same file.
+    """
+    previous = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-16") as otp_file:
+            for line in otp_file:
+                if line.strip():
+                    previous.setdefault(line.strip().split(";")[0], []).append(line.strip())
+
+    lines = []
+    for champion in champions:
+        for line in results.get(champion, previous.get(champion, [])):
+            if line not in lines:
+                lines.append(line)
+    write_file_atomically(path, lines, encoding="utf-16")
+    print(f"[INFO] - {datetime.now()} : {len(lines)} otps written to {path}")
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scrapes the best OTPs of each champion from onetricks.gg.")
+    parser.add_argument('--champions', default="./champions.txt")
+    parser.add_argument('--output', default="./players/best_otps_euw.txt")
+    parser.add_argument('--fixtures', help="Directory of saved pages ({champion slug}.html) parsed instead of fetching.")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    parser.add_argument('--requests-per-second', type=float, default=HOST_REQUESTS_PER_SECOND)
+    parser.add_argument('--cache', default=CACHE_PATH)
+    args = parser.parse_args()
+
     all_champs = []
-    with open("./champions.txt", "r") as f:
+    with open(args.champions, "r") as f:
         for line in f:
-            all_champs.append(line.strip())
-    url = "https://www.onetricks.gg/fr/champions/ranking/[CHAMPION]"
-
-    for champion in all_champs:
-        otps = []
-        response = requests.get(url.replace("[CHAMPION]", champion.replace(' ', '').replace('.', '').replace('\'', '')))
-
-        if response.status_code == 200:
-            try:
-                soup = BeautifulSoup(response.text, "html.parser")
-                table = soup.find("table", class_="utils_tablePlayers__lh0ZH")
-                rows = table.find_all("tr")
-                i = 0
-                for row in rows:
-                    if i == 3:
-                        break
-                    try:
-                        cols = row.find_all("td")
-                        values = [col.text.strip() for col in cols]
-                        if "EUW1" in values[4]:
-                            name_tag_split = values[4].split("   ")
-                            name = name_tag_split[0]
-                            tag = name_tag_split[1].split(" ")[0].replace("#", "")
-                            otps.append(f"{champion};{name};{tag}")
-                            i += 1
-                    except Exception as e:
-                        continue
-                if otps:
-                    with open(f"./players/best_otps_euw.txt", "a", encoding='utf-16') as f:
-                        for player_name in otps:
-                            f.write(str(player_name) + "\n")
-                    print(f"[INFO] - {datetime.now()} : {champion} otps found")
-            except Exception as e:
-                print(f"[ERROR] - {datetime.now()} : {champion} have found an error\n{e}")
-
-        else:
-            print(f"[WARNING] - {datetime.now()} : Error while retrieving info for {champion.upper()}")
-
-        time.sleep(1)
+            if line.strip():
+                all_champs.append(line.strip())
 
+    start = time.perf_counter()
+    if args.fixtures:
+        otps_by_champion = parse_fixtures(all_champs, args.fixtures)
+    else:
+        otps_by_champion = asyncio.run(scrape_otps(all_champs, args.concurrency, args.requests_per_second, args.cache))
+    print(f"[INFO] - {datetime.now()} : {len(otps_by_champion)} / {len(all_champs)} champions read in {time.perf_counter() - start:.1f}s")
 
+    write_otps_file(args.output, all_champs, otps_by_champion)
@@ -1,22 +1,68 @@
 import os
+import random
+import threading
+import time
 
 import urllib3
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+from crawl_coverage import CoverageTracker
+from crawl_queue import CrawlQueue, IN_FLIGHT, PENDING
+from crawler_metrics import MetricsReporter, get_metrics
 from format_match_api_response import generate_csv_line_from_match_api_response
+from match_id_index import MatchIdIndex
+from output_writers import AppendLog, RotatingLineWriter, write_file_atomically
+from key_pool import KeyPool, NoActiveKeyError
+from rate_limiter import get_url_host
 from datetime import datetime
 from dotenv import load_dotenv
-from ratelimit import limits, sleep_and_retry
 from urllib3 import PoolManager
-from pybloom_live import BloomFilter
 
 
 # API link : https://developer.riotgames.com/apis
 # Test link : https://riftrewind.devpost.com/
-# Rate Limits :
+# Rate Limits, per routing value (europe, americas, ...) and platform (euw1, na1, ...) :
 #   - 20 requests every 1 seconds(s)
 #   - 100 requests every 2 minutes(s)
 
+MATCH_HISTORY_URL = "https://[CLUSTER].api.riotgames.com/lol/match/v5/matches/by-puuid/[PUUID]/ids?startTime=1736409600&start=[PAGE]&count=100"
+MATCH_REPLAY_URL = "https://[CLUSTER].api.riotgames.com/lol/match/v5/matches/[MATCH_ID]"
+
+# Keys of RIOT_API_KEYS (comma separated) or RIOT_API_KEY, each key having its own limiter per host
+_key_pool = None
+_key_pool_lock = threading.Lock()
+
+PAGES_PER_PLAYER = 1
+MATCHS_PER_PLAYER = 40
+MATCH_FILE_LINES = 240
+
+# "coverage" crawls first the players whose matches fill the least sampled (champion, position, win) cells, "fifo" in file order
+CRAWL_SCHEDULER = os.getenv("CRAWL_SCHEDULER", "coverage")
+COVERAGE_DB_PATH = "./checkpoints/coverage.db"
+# Pending players and pages are scored again every RESCORE_EVERY_MATCHES matches
+RESCORE_EVERY_MATCHES = 100
+
+# "csv" for ./matchs/{tier}_match_N.csv, "parquet" for ./matchs_parquet/{tier}/patch=X/queue=Y/
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "csv")
+# Parquet only : "wide" (one row per match) in ./matchs_parquet/, "participants" (one row per player) in ./participants_parquet/
+PARQUET_LAYOUT = os.getenv("PARQUET_LAYOUT", "wide")
+
+# Raw match responses kept in a zstd archive, replayable by match_archive.py
+ARCHIVE_MATCHES = os.getenv("ARCHIVE_MATCHES", "true").lower() == "true"
+MATCH_ARCHIVE_PATH = "./archive"
+
+# Exact set of the match ids already downloaded, shared by every crawler
+MATCH_ID_INDEX_PATH = "./checkpoints/match_ids.idx"
+
+# Items failing with a transient error (429, 5xx, network) are retried after an exponential backoff with jitter
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_S = 5
+RETRY_MAX_DELAY_S = 600
+# Replays the matches of ./checkpoints/errors.txt with the crawl, written to ./matchs/retried_match_N.csv
+DRAIN_ERRORS = os.getenv("DRAIN_ERRORS", "false").lower() == "true"
+RETRIED_PREFIX = "retried"
+
 
 class UnauthorizedError(Exception):
     def __init__(self, message):
@@ -34,6 +80,7 @@ def get_routing_value(region):
         'eun1': 'europe',
         'tr1': 'europe',
         'ru': 'europe',
+        'me1': 'europe',
         'kr': 'asia',
         'jp1': 'asia',
         'oc1': 'sea',
@@ -47,10 +94,44 @@ def get_routing_value(region):
 
 
 
-@sleep_and_retry
-@limits(calls=99, period=120)
+def get_key_pool():
+    global _key_pool
+    with _key_pool_lock:
+        if _key_pool is None:
+            load_dotenv()
+            _key_pool = KeyPool((os.getenv("RIOT_API_KEYS") or os.getenv("RIOT_API_KEY") or "").split(","))
+            get_metrics().key_pool = _key_pool
+            print(f"[INFO] - {datetime.now()} : {len(_key_pool.api_keys)} Riot API keys in the pool")
+        return _key_pool
+
+
 def send_get_api_request(url: str, http_header: dict, http_object: PoolManager):
-    api_response = http_object.request('GET', url, headers=http_header)
+    """
+    Sends the request with the pool key having the earliest free slot on the URL host. A key refused with a 401 is
+    quarantined and the request sent again with another key, UnauthorizedError being raised once no key is left.
+    """
+    key_pool = get_key_pool()
+    metrics = get_metrics()
+    while True:
+        wait_start = time.perf_counter()
+        try:
+            api_key = key_pool.acquire(get_url_host(url))
+        except NoActiveKeyError as e:
+            raise UnauthorizedError(str(e))
+        metrics.record_quota_wait(get_url_host(url), time.perf_counter() - wait_start)
+
+        request_start = time.perf_counter()
+        try:
+            api_response = http_object.request('GET', url, headers=dict(http_header, **{'X-Riot-Token': api_key}))
+        except Exception:
+            metrics.record_request(url, "error", time.perf_counter() - request_start)
+            raise
+        metrics.record_request(url, api_response.status, time.perf_counter() - request_start)
+        if api_response.status != 401:
+            break
+        key_pool.quarantine(api_key)
+        print(f"[WARNING] - {datetime.now()} : Riot API key ending with {api_key[-4:]} refused, quarantined")
+
     api_response_decoded = json.loads(api_response.data.decode("utf-8"))
 
     if api_response.status == 404:
@@ -58,11 +139,10 @@ def send_get_api_request(url: str, http_header: dict, http_object: PoolManager):
             'statusCode': 404,
             'body': json.dumps({'error': 'Riot ID not found. Check spelling and region.'})
         })
-    elif api_response.status == 401:
-        raise UnauthorizedError(f'Auth token is Forbidden : {api_response.status} - {api_response_decoded["status"]["message"]}')
     elif api_response.status != 200:
         raise Exception({
             'statusCode': api_response.status,
+            'retryAfter': api_response.headers.get('Retry-After'),
             'body': json.dumps({
                 'error': f'Failed to fetch account: {api_response.status} - {api_response_decoded["status"]["message"]}'})
         })
@@ -72,34 +152,72 @@ def send_get_api_request(url: str, http_header: dict, http_object: PoolManager):
     return api_response_decoded
 
 
+def get_error_details(error):
+    """
+    Gets the dict raised by send_get_api_request, None for other errors.
+    """
+    return error.args[0] if error.args and type(error.args[0]) == dict and 'statusCode' in error.args[0] else None
+
+
+def is_transient_error(error):
+    """
+    Rate limited (429), server side (5xx) and network errors may succeed later, other errors (404, 400, 403, parsing) never do.
+    Returns: bool
+    """
+    details = get_error_details(error)
+    if details is not None:
+        return details['statusCode'] == 429 or details['statusCode'] >= 500
+    return isinstance(error, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError, json.JSONDecodeError))
+
+
+def get_retry_delay(attempts, error=None):
+    """
+    Exponential backoff from RETRY_BASE_DELAY_S with equal jitter, so the items failing together are not retried together,
+    never shorter than the Retry-After of a 429.
+    Returns: float, seconds
+    """
+    delay = min(RETRY_MAX_DELAY_S, RETRY_BASE_DELAY_S * 2 ** (attempts - 1))
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    details = get_error_details(error) if error is not None else None
+    if details is not None and details.get('retryAfter'):
+        delay = max(delay, float(details['retryAfter']))
+    return delay
+
+
 def append_line_to_file(line, file_path):
     with open(file_path, "a", encoding="utf-8") as f:
         f.write(str(line) + "\n")
 
 
 def write_checkpoint(file_name, checkpoint, open_mode):
-    if type(checkpoint) == str:
-        with open(file_name, open_mode, encoding="utf-8") as f:
-            f.write(str(checkpoint) + "\n")
-    elif type(checkpoint) == list:
+    """
+    Writes a checkpoint line or list of lines. A rewritten ("w") checkpoint is replaced atomically, never left half written.
+    """
+    lines = [checkpoint] if type(checkpoint) == str else checkpoint
+    if open_mode == "w":
+        write_file_atomically(file_name, lines)
+    else:
         with open(file_name, open_mode, encoding="utf-8") as f:
-            for line in checkpoint:
+            for line in lines:
                 f.write(str(line) + "\n")
 
 
 
-def get_players_in_elo():
+def get_players_in_elo(platform="euw1"):
     load_dotenv()
-    api_key = os.getenv("RIOT_API_KEY")
     http = urllib3.PoolManager()
-    headers = {'X-Riot-Token': api_key}
+    # The keys come from the key pool, per request
+    headers = {}
     reload = True
     players_puuid = []
 
     tier = "DIAMOND"
     division = "I"
     page = 1
-    elo_url = f"https://euw1.api.riotgames.com/lol/league-exp/v4/entries/RANKED_SOLO_5x5/{tier}/{division}?page={page}"
+    elo_url = f"https://{platform}.api.riotgames.com/lol/league-exp/v4/entries/RANKED_SOLO_5x5/{tier}/{division}?page={page}"
+
+    # Players of other platforms go to their own file, crawled in the cluster of the platform
+    players_file = f"players/{tier.lower()}_puuid.txt" if platform == "euw1" else f"players/{platform}-{tier.lower()}_puuid.txt"
 
     elo_response_decoded = None
     total_player_in_elo = 0
@@ -109,137 +227,340 @@ def get_players_in_elo():
 
         total_player_in_elo += len(elo_response_decoded)
 
-        if os.path.exists(f"players/{tier.lower()}_puuid.txt"):
+        if os.path.exists(players_file):
             open_mode = "a"
         else:
             open_mode = "w"
 
-        with open(f"players/{tier.lower()}_puuid.txt", open_mode, encoding="utf-8") as f:
+        with open(players_file, open_mode, encoding="utf-8") as f:
             for player in elo_response_decoded:
                 f.write(player["puuid"] + ";" + str(player["leaguePoints"]) + ";" + str(player["wins"]) + ";" + str(
                     player["losses"]) + "\n")
 
         print(f"Page {page} fetched.")
         page += 1
-        elo_url = f"https://euw1.api.riotgames.com/lol/league-exp/v4/entries/RANKED_SOLO_5x5/{tier}/{division}?page={page}"
+        elo_url = f"https://{platform}.api.riotgames.com/lol/league-exp/v4/entries/RANKED_SOLO_5x5/{tier}/{division}?page={page}"
 
     print(f"Total {tier.lower()} : {total_player_in_elo}")
 
 
-def get_player_in_high_elo():
-    load_dotenv()
-    api_key = os.getenv("RIOT_API_KEY")
-    http = urllib3.PoolManager()
-    headers = {'X-Riot-Token': api_key}
-    reload = True
-
-    #files_to_process = ["chall_puuid.txt", "grandmaster_puuid.txt", "master_puuid.txt", "diamand_puuid.txt"]
-    files_to_process = ["chall_puuid.txt"]
-
-    bloom_filter = BloomFilter(capacity=10_000_000)
-    file_iterator = 189
-
-    if reload:
-        with open("./checkpoints/all_matchs_ids.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                bloom_filter.add(line.strip())
+class MatchFileWriter:
+    """
+    Writes the match lines of a players file to ./matchs/{prefix}_match_N.csv, starting a new file every MATCH_FILE_LINES lines.
+    Files are only listed once complete. A match is persisted once its line is synced, on_persisted being then called with its id :
+    a crash can at worst write a match twice.
+    """
+    def __init__(self, prefix, on_persisted=None):
+        self.prefix = prefix
+        self._writer = RotatingLineWriter("./matchs", f"{prefix}_match", ".csv", max_lines=MATCH_FILE_LINES, on_persisted=on_persisted)
+
+    def write_match(self, match_id, api_response):
+        """
+        Buffers the line of a match.
+        Returns: bool, False as the match is only persisted by a later sync
+        """
+        self._writer.write(generate_csv_line_from_match_api_response(api_response), match_id)
+        return False
+
+    def flush(self):
+        self._writer.flush()
+
+    def close(self):
+        self._writer.close()
+
+
+def create_match_archive():
+    """
+    Opens the raw match archive, None when ARCHIVE_MATCHES is disabled.
+    """
+    if not ARCHIVE_MATCHES:
+        return None
+
+    from match_archive import MatchArchive
+    return MatchArchive(MATCH_ARCHIVE_PATH)
+
+
+def create_match_writer(prefix, queue, match_id_index):
+    """
+    Creates the writer of a players file for OUTPUT_FORMAT. Matches are marked done once their line or part file is on disk.
+    """
+    def on_persisted(match_ids):
+        match_id_index.add_many(match_ids)
+        for match_id in match_ids:
+            queue.complete('match', match_id)
+        get_metrics().record_persisted(len(match_ids))
+
+    if OUTPUT_FORMAT == "csv":
+        return MatchFileWriter(prefix, on_persisted)
+    if OUTPUT_FORMAT != "parquet":
+        raise ValueError(f"Unknown OUTPUT_FORMAT {OUTPUT_FORMAT}")
+
+    from parquet_writer import MatchParquetWriter
+
+    root = "./matchs_parquet" if PARQUET_LAYOUT == "wide" else "./participants_parquet"
+    return MatchParquetWriter(f"{root}/{prefix}", on_persisted, layout=PARQUET_LAYOUT)
+
+
+def import_legacy_match_ids(match_id_index, file_path):
+    """
+    Imports the match ids listed by the text checkpoints into an empty index, only done once.
+    """
+    if len(match_id_index) > 0 or not os.path.exists(file_path):
+        return
+
+    imported = 0
+    with open(file_path, "r", encoding="utf-8") as f:
+        batch = []
+        for line in f:
+            if line.strip():
+                batch.append(line.strip())
+            if len(batch) >= 100_000:
+                imported += match_id_index.add_many(batch)
+                batch = []
+        imported += match_id_index.add_many(batch)
+    match_id_index.flush()
+    print(f"[INFO] - {datetime.now()} : {imported} matches imported from {file_path}")
+
+
+def read_players_file(file):
+    """
+    Reads the players of a ./players/ file : "puuid;lp;wins;losses" lines for the ladder files, "champion;puuid" (utf-16) for otps_puuid.txt.
+    Returns: list[tuple[str, str | None]], (puuid, champion) with the champion of the OTPs only
+    """
+    if file == "otps_puuid.txt":
+        with open(f"./players/{file}", "r", encoding="utf-16") as player_file:
+            return [(line.strip().split(";")[1], line.strip().split(";")[0]) for line in player_file if line.strip()]
+    with open(f"./players/{file}", "r", encoding="utf-8") as player_file:
+        return [(line.split(";")[0].strip(), None) for line in player_file if line.strip()]
+
+
+def seed_crawl_queue(queue, files_to_process, match_id_index, coverage=None):
+    """
+    Enqueues the players of the given (file, platform) pairs in the routing cluster of their platform,
+    and on the first run imports the matches already downloaded by the text checkpoints.
+    """
+    import_legacy_match_ids(match_id_index, "./checkpoints/all_matchs_ids.txt")
+
+    for file, platform in files_to_process:
+        players = read_players_file(file)
+        if coverage is not None:
+            coverage.declare_player_champions([(puuid, champion) for puuid, champion in players if champion is not None])
+        added = queue.enqueue_many('player', [(puuid, file.split("_")[0]) for puuid, _ in players], cluster=get_routing_value(platform))
+        print(f"[INFO] - {datetime.now()} : {added} new players enqueued from ./players/{file} ({platform})")
+
+    if coverage is not None:
+        rescore_crawl_queue(queue, coverage)
+
+
+def rescore_crawl_queue(queue, coverage):
+    """
+    Scores the pending players and pages with the quartile uncertainty one of their matches is expected to remove,
+    the matches of a page inheriting its score.
+    """
+    pending_pages = queue.get_pending('page')
+    scores = coverage.score_players([key for key, _ in queue.get_pending('player')] + [key.split(";")[0] for key, _ in pending_pages])
+    queue.set_scores('player', {puuid: score for puuid, score in scores.items()})
+    queue.set_scores('page', {key: scores[key.split(";")[0]] for key, _ in pending_pages})
+    print(f"[INFO] - {datetime.now()} : {len(scores)} pending players scored, {len(coverage.get_under_sampled_cells())} cells under "
+          f"{coverage.target_samples} samples")
+
+
+def get_match_budget(coverage, puuid):
+    """
+    Number of new matches taken from a page. A player expected to fill under-sampled cells better than an average player gets
+    the matches its most missing cell needs to reach the target (up to the whole page), and none once its cells reached it.
+    """
+    if coverage is None:
+        return MATCHS_PER_PLAYER
+    gain = coverage.get_player_gain(puuid)
+    if gain == 0:
+        return 0
+    if gain > coverage.get_average_gain():
+        return min(100, coverage.get_matches_to_target(puuid))
+    return MATCHS_PER_PLAYER
+
+
+def drain_error_log(queue, match_id_index, file_path="./checkpoints/errors.txt"):
+    """
+    Enqueues the matches of the errors file neither downloaded nor known by the queue, in the cluster of their platform.
+    They are crawled with the other items of their cluster, sharing its quota, and written to ./matchs/retried_match_N.csv.
+    """
+    if not os.path.exists(file_path):
+        return
+
+    matches_by_cluster = {}
+    with open(file_path, "r", encoding="utf-8") as error_file:
+        for line in error_file:
+            match_id = line.strip()
+            if match_id and "_" in match_id and match_id not in match_id_index:
+                matches_by_cluster.setdefault(get_routing_value(match_id.split("_")[0].lower()), []).append((match_id, RETRIED_PREFIX))
+
+    for cluster, matches in matches_by_cluster.items():
+        added = queue.enqueue_many('match', list(dict.fromkeys(matches)), cluster=cluster)
+        print(f"[INFO] - {datetime.now()} : {added} failed matches of {file_path} enqueued again ({cluster})")
+
+
+def process_player(puuid, prefix):
+    """
+    A player only produces the first page of its match ids.
+    """
+    return {'page': [(f"{puuid};0", json.dumps({'puuid': puuid, 'start': 0, 'prefix': prefix}))]}
+
+
+def process_match_ids_page(queue, payload, cluster, headers, http, match_id_index, coverage=None):
+    """
+    Fetches a page of match ids, enqueuing the next page and up to the match budget of the player (MATCHS_PER_PLAYER without
+    coverage scheduler) matches neither queued nor downloaded.
+    """
+    page = json.loads(payload)
+    match_ids = send_get_api_request(
+        MATCH_HISTORY_URL.replace("[CLUSTER]", cluster).replace("[PUUID]", page['puuid']).replace("[PAGE]", str(page['start'])),
+        headers,
+        http)
+
+    children = {}
+    next_start = page['start'] + 100
+    if len(match_ids) == 100 and next_start < PAGES_PER_PLAYER * 100:
+        children['page'] = [(f"{page['puuid']};{next_start}", json.dumps(dict(page, start=next_start)))]
+
+    new_match_ids = [match_id for match_id in queue.filter_unknown('match', match_ids) if match_id not in match_id_index]
+    get_metrics().record_dedupe(len(match_ids) - len(new_match_ids), len(new_match_ids))
+    children['match'] = [(match_id, page['prefix']) for match_id in new_match_ids[:get_match_budget(coverage, page['puuid'])]]
+    return children
+
+
+def process_match(match_id, prefix, cluster, headers, http, writers, match_id_index, match_archive, coverage=None):
+    """
+    Downloads a match detail, archives the raw response and hands it to the writer of its players file.
+    Returns None when the writer buffers it, the match then staying in_flight until the writer persists it.
+    """
+    match_decoded = send_get_api_request(
+        MATCH_REPLAY_URL.replace("[CLUSTER]", cluster).replace("[MATCH_ID]", match_id),
+        headers,
+        http)
+
+    if match_archive is not None:
+        match_archive.append(match_id, match_decoded)
+    if coverage is not None:
+        coverage.record_match(match_decoded)
+    if not writers[prefix].write_match(match_id, match_decoded):
+        return None
+    match_id_index.add(match_id)
+    get_metrics().record_persisted(1)
+    return {}
+
+
+def crawl_worker(queue, cluster, headers, http, writers, match_id_index, match_archive, error_log, stop_event, coverage=None):
+    """
+    Claims and processes the items of a routing cluster until they are drained. Workers of a cluster share its rate limiter,
+    so they keep its API quota busy instead of waiting between the players, pages and matches phases.
+    """
+    while not stop_event.is_set():
+        item = queue.claim(cluster)
+        if item is None:
+            # Buffered matches stay in_flight until written, retried items stay pending until their backoff ends
+            for writer in writers.values():
+                writer.flush()
+            if queue.count(IN_FLIGHT, cluster=cluster) == 0 and queue.count(PENDING, cluster=cluster) == 0:
+                return
+            time.sleep(1)
+            continue
 
-    match_history_url = f"https://europe.api.riotgames.com/lol/match/v5/matches/by-puuid/[PUUID]/ids?startTime=1736409600&start=[PAGE]&count=100"
-    match_replay_url = f"https://europe.api.riotgames.com/lol/match/v5/matches/[MATCH_ID]"
+        kind, key, payload, _ = item
+        try:
+            if kind == 'player':
+                children = process_player(key, payload)
+            elif kind == 'page':
+                children = process_match_ids_page(queue, payload, cluster, headers, http, match_id_index, coverage)
+            else:
+                if payload not in writers:
+                    raise Exception(f"No players file known for match {key}")
+                children = process_match(key, payload, cluster, headers, http, writers, match_id_index, match_archive, coverage)
+                if coverage is not None and coverage.is_rescore_due(RESCORE_EVERY_MATCHES):
+                    rescore_crawl_queue(queue, coverage)
+            if children is not None:
+                queue.complete(kind, key, children)
+        except UnauthorizedError as u:
+            queue.release(kind, key)
+            stop_event.set()
+            raise UnauthorizedError(u)
+        except Exception as e:
+            attempts = queue.get_attempts(kind, key)
+            if is_transient_error(e) and attempts < RETRY_MAX_ATTEMPTS:
+                delay = get_retry_delay(attempts, e)
+                print(f"[WARNING] - {datetime.now()} : Transient error for {kind} {key} (attempt {attempts}), retried in {delay:.0f}s")
+                queue.retry(kind, key, str(e), delay)
+                continue
+            print(f"[INFO] - {datetime.now()} : Error found for {kind} {key}")
+            queue.fail(kind, key, str(e))
+            if kind == 'match':
+                error_log.write(key)
+        except BaseException:
+            # Interrupted (e.g. Ctrl+C) : the item is put back for the next run and the other workers stop
+            queue.release(kind, key)
+            stop_event.set()
+            raise
 
-    for file in files_to_process:
-        players_puuid = []
-        with open(f"./players/{file}", "r", encoding="utf-8") as player_file:
-            for line in player_file:
-                players_puuid.append(line.split(";")[0])
 
-        for player in players_puuid:
-            write_checkpoint("./checkpoints/players.txt", f"{file};{player}", open_mode="w")
-            print(f"[INFO] - {datetime.now()} : Checkpoint created at ./checkpoints/players.txt")
-
-            match_history = []
-
-            match_ids_decoded = None
-            page = 0
-            while match_ids_decoded != [] and page < 10:
-                try:
-                    match_ids_decoded = send_get_api_request(
-                        match_history_url.replace("[PUUID]", player).replace("[PAGE]", str(page)),
-                        headers,
-                        http)
-
-                    match_history.extend(match_ids_decoded)
-                    page += 100
-                    write_checkpoint("./checkpoints/players_match.txt", f"{player};{page}", open_mode="w")
-                except UnauthorizedError as u:
-                    raise UnauthorizedError(u)
-                except Exception as e:
-                    if len(match_history) == 0:
-                        continue
-
-            write_checkpoint("./checkpoints/match_history.txt", match_history, open_mode="w")
-            with open("./checkpoints/all_matchs_ids.txt", "a", encoding="utf-8") as match_id_file:
-                for match_id in match_history:
-                    match_id_file.write(str(match_id) + "\n")
-            print(f"[INFO] - {datetime.now()} : Checkpoint created at ./checkpoints/match_history.txt")
-
-            line_iterator = 0
-            match_group = []
-            match_iterator = 0
-            for match_id in match_history:
-                if match_id in bloom_filter:
-                    print(f"[INFO] - {datetime.now()} : Match already processed {match_id}")
-                    continue
-                bloom_filter.add(match_id)
-
-                try:
-                    match_decoded = send_get_api_request(
-                        match_replay_url.replace("[MATCH_ID]", match_id),
-                        headers,
-                        http)
-
-                    match_summary = generate_csv_line_from_match_api_response(match_decoded)
-                    match_group.append(match_summary)
-                    match_iterator += 1
-                    if match_iterator >= 40:
-                        break
-                except UnauthorizedError as u:
-                    raise UnauthorizedError(u)
-                except Exception as e:
-                    print(f"[INFO] - {datetime.now()} : Error found for match {match_id}")
-                    with open("./checkpoints/errors.txt", "a", encoding="utf-8") as error_file:
-                        error_file.write(str(match_id) + "\n")
-                    continue
-
-                if line_iterator >= 240:
-                    with open(f"./matchs/{file.split("_")[0]}_match_{file_iterator}.csv", "w",
-                              encoding="utf-8") as match_files:
-                        for line in match_group:
-                            match_files.write(line + "\n")
-                    line_iterator = 0
-                    file_iterator += 1
-                    match_group = []
-                    print(
-                        f"[INFO] - {datetime.now()} : Match file created at ./matchs/{file.split("_")[0]}_match_{file_iterator}.csv")
-                else:
-                    line_iterator += 1
-
-            if len(match_group) > 0:
-                with open(f"./matchs/{file.split("_")[0]}_match_{file_iterator}.csv", "w",
-                          encoding="utf-8") as match_files:
-                    for line in match_group:
-                        match_files.write(line + "\n")
-
-            print(f"[INFO] - {datetime.now()} : Ended retrieving players game {player}")
-        print(f"[INFO] - {datetime.now()} : Treatment ended for file {file}")
+def get_player_in_high_elo():
+    load_dotenv()
+    workers = int(os.getenv("CRAWLER_WORKERS", 4))
+    http = urllib3.PoolManager(maxsize=workers)
+    headers = {}
+
+    # (players file, platform) : each routing cluster is crawled by its own workers, e.g. ("na1-chall_puuid.txt", "na1")
+    # otps_puuid.txt players are scored from their champion by the coverage scheduler
+    #files_to_process = [("chall_puuid.txt", "euw1"), ("grandmaster_puuid.txt", "euw1"), ("master_puuid.txt", "euw1"), ("diamand_puuid.txt", "euw1"), ("otps_puuid.txt", "euw1")]
+    files_to_process = [("chall_puuid.txt", "euw1")]
+
+    queue = CrawlQueue("./checkpoints/crawl_queue.db")
+    recovered = queue.recover_in_flight()
+    if recovered > 0:
+        print(f"[INFO] - {datetime.now()} : {recovered} interrupted items put back in the queue")
+    match_id_index = MatchIdIndex(MATCH_ID_INDEX_PATH)
+    coverage = CoverageTracker(COVERAGE_DB_PATH) if CRAWL_SCHEDULER == "coverage" else None
+    seed_crawl_queue(queue, files_to_process, match_id_index, coverage)
+    if DRAIN_ERRORS:
+        drain_error_log(queue, match_id_index)
+
+    match_archive = create_match_archive()
+    writers = {file.split("_")[0]: create_match_writer(file.split("_")[0], queue, match_id_index) for file, _ in files_to_process}
+    if DRAIN_ERRORS:
+        writers[RETRIED_PREFIX] = create_match_writer(RETRIED_PREFIX, queue, match_id_index)
+    error_log = AppendLog("./checkpoints/errors.txt")
+    stop_event = threading.Event()
+    clusters = queue.clusters()
+
+    get_metrics().queue = queue
+    metrics_reporter = MetricsReporter(get_metrics())
+    metrics_reporter.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers * len(clusters)) as executor:
+            futures = [executor.submit(crawl_worker, queue, cluster, headers, http, writers, match_id_index, match_archive, error_log,
+                                       stop_event, coverage)
+                       for cluster in clusters for _ in range(workers)]
+            for future in futures:
+                future.result()
+    finally:
+        for writer in writers.values():
+            writer.close()
+        metrics_reporter.stop()
+        error_log.close()
+        match_id_index.close()
+        if match_archive is not None:
+            match_archive.close()
+        if coverage is not None:
+            coverage.close()
+
+    print(f"[INFO] - {datetime.now()} : Treatment ended, queue state {queue.summary()}")
 
 
 
 def get_otps_uuid():
     load_dotenv()
-    api_key = os.getenv("RIOT_API_KEY")
     http = urllib3.PoolManager()
-    headers = {'X-Riot-Token': api_key}
+    headers = {}
 
     puuid_url = "https://europe.api.riotgames.com/riot/account/v1/accounts/by-riot-id/[PLAYER_NAME]/[TAG]"
 
@@ -276,11 +597,12 @@ def get_otps_uuid():
 
 def get_otps_game():
     load_dotenv()
-    api_key = os.getenv("RIOT_API_KEY")
     http = urllib3.PoolManager()
-    headers = {'X-Riot-Token': api_key}
+    headers = {}
 
-    bloom_filter = BloomFilter(capacity=1_000_000)
+    match_id_index = MatchIdIndex(MATCH_ID_INDEX_PATH)
+    match_archive = create_match_archive()
+    error_log = AppendLog("./checkpoints/errors.txt")
     file_iterator = 0
 
     match_history_url = f"https://europe.api.riotgames.com/lol/match/v5/matches/by-puuid/[PUUID]/ids?startTime=1736409600&start=0&count=100"
@@ -320,16 +642,16 @@ def get_otps_game():
         print(f"[INFO] - {datetime.now()} : Checkpoint created at ./checkpoints/otps_match_history.txt")
 
         match_group = []
+        match_group_ids = []
 
         with open("./checkpoints/otps_all_matchs_ids.txt", "a", encoding="utf-8") as match_id_file:
             for match_id in match_history:
                 match_id_file.write(str(match_id) + "\n")
 
         for match_id in match_history:
-            if match_id in bloom_filter:
+            if match_id in match_id_index:
                 print(f"[INFO] - {datetime.now()} : Match already processed {match_id}")
                 continue
-            bloom_filter.add(match_id)
 
             try:
                 match_decoded = send_get_api_request(
@@ -337,26 +659,33 @@ def get_otps_game():
                     headers,
                     http)
 
+                if match_archive is not None:
+                    match_archive.append(match_id, match_decoded)
                 match_summary = generate_csv_line_from_match_api_response(match_decoded)
                 match_group.append(match_summary)
+                match_group_ids.append(match_id)
             except UnauthorizedError as u:
                 raise UnauthorizedError(u)
             except Exception as e:
                 print(f"[INFO] - {datetime.now()} : Error found for match {match_id}")
-                with open("./checkpoints/errors.txt", "a", encoding="utf-8") as error_file:
-                    error_file.write(str(match_id) + "\n")
+                error_log.write(match_id)
                 continue
 
-        with open(f"./otp_matchs/{champion.replace(' ', '').replace('.', '').replace('\'', '').lower()}_match_{file_iterator}.csv", "w",
-                  encoding="utf-8") as match_files:
-            for line in match_group:
-                match_files.write(line + "\n")
+        # The matches are only marked as processed once their file is written
+        write_file_atomically(f"./otp_matchs/{champion.replace(' ', '').replace('.', '').replace('\'', '').lower()}_match_{file_iterator}.csv",
+                              match_group)
+        match_id_index.add_many(match_group_ids)
         file_iterator += 1
         print(f"[INFO] - {datetime.now()} : Match file created at ./otp_matchs/{champion.replace(' ', '').replace('.', '').replace('\'', '').lower()}_match_{file_iterator}.csv")
 
 
         print(f"[INFO] - {datetime.now()} : Ended retrieving players game {champion}")
 
+    error_log.close()
+    match_id_index.close()
+    if match_archive is not None:
+        match_archive.close()
+
 
 
 
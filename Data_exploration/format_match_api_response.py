@@ -248,3 +248,186 @@ def generate_player_line(api_response: dict, player_puuid: str) -> list[str]:
     return general_info + teams + players_summary
 
 
+
+
+# Typed columns of the match rows, named as in the exploration notebooks
+GENERAL_COLUMN_NAMES = {
+    'gameCreation': 'game_creation_timestamp',
+    'gameDuration': 'game_duration',
+    'gameId': 'game_id',
+    'gameVersion': 'game_patch_version',
+    'platformId': 'region_id',
+    'queueId': 'queue_id',
+    'team_1_teamId': 'team_1_id',
+    'team_1_win': 'team_1_won',
+    'team_1_total_tower_killed': 'team_1_towers_killed',
+    'team_1_first_tower': 'team_1_first_tower',
+    'team_1_atakhan': 'team_1_atakhan',
+    'team_1_total_baron_killed': 'team_1_baron_killed',
+    'team_1_total_dragon_killed': 'team_1_dragon_killed',
+    'team_1_total_grubs_killed': 'team_1_grubs_killed',
+    'team_1_total_herald_killed': 'team_1_herald',
+    'team_2_teamId': 'team_2_id',
+    'team_2_win': 'team_2_won',
+    'team_2_total_tower_killed': 'team_2_towers_killed',
+    'team_2_first_tower': 'team_2_first_tower',
+    'team_2_atakhan': 'team_2_atakhan',
+    'team_2_total_baron_killed': 'team_2_baron_killed',
+    'team_2_total_dragon_killed': 'team_2_dragon_killed',
+    'team_2_total_grubs_killed': 'team_2_grubs_killed',
+    'team_2_total_herald_killed': 'team_2_herald'
+}
+
+PLAYER_COLUMN_NAMES = {
+    'puuid': 'puuid',
+    'riotIdGameName': 'riot_name',
+    'riotIdTagline': 'riot_tag',
+    'summonerId': 'summoner_id',
+    'summonerLevel': 'summoner_level',
+    'teamId': 'team_id',
+    'participantId': 'participant_id',
+    'win': 'win',
+    'allInPings': 'pings_all_in',
+    'assistMePings': 'pings_assist',
+    'commandPings': 'pings_command',
+    'enemyMissingPings': 'pings_missing',
+    'enemyVisionPings': 'pings_ennemy_vision',
+    'holdPings': 'pings_hold',
+    'getBackPings': 'pings_get_back',
+    'needVisionPings': 'pings_need_vision',
+    'onMyWayPings': 'pings_on_my_way',
+    'pushPings': 'pings_push',
+    'basicPings': 'pings_biasic',
+    'visionClearedPings': 'pings_vision_cleared',
+    'champExperience': 'champ_experience',
+    'champLevel': 'champ_level',
+    'championId': 'champ_id',
+    'championName': 'champ_name',
+    'kills': 'kills',
+    'deaths': 'death',
+    'assists': 'assist',
+    'individualPosition': 'individual_position',
+    'lane': 'lane',
+    'neutralMinionsKilled': 'neutral_minions',
+    'damageDealtToBuildings': 'damage_dealt_building',
+    'damageDealtToObjectives': 'damage_dealt_objectives',
+    'damageDealtToTurrets': 'damage_dealt_turrets',
+    'turretKills': 'turret_kills',
+    'inhibitorKills': 'inhibitor_kills',
+    'wardsPlaced': 'wards_placed',
+    'wardsKilled': 'wards_killed',
+    'visionWardsBoughtInGame': 'control_wards_bought',
+    'visionScore': 'vision_score',
+    'teamEarlySurrendered': 'remake_vote',
+    'gameEndedInSurrender': 'ended_surrender',
+    'gameEndedInEarlySurrender': 'ended_remake',
+    'doubleKills': 'double_kill',
+    'tripleKills': 'triple_kill',
+    'quadraKills': 'quadra_kill',
+    'pentaKills': 'penta_kill',
+    'spell1Casts': 'spell_1_casts',
+    'spell2Casts': 'spell_2_casts',
+    'spell3Casts': 'spell_3_casts',
+    'spell4Casts': 'spell_4_casts',
+    'summoner1Id': 'sum_1_id',
+    'summoner2Id': 'sum_2_id',
+    'summoner1Casts': 'sum_1_casts',
+    'summoner2Casts': 'sum_2_casts',
+    'physicalDamageDealtToChampions': 'physical_dmg_to_champions',
+    'magicDamageDealtToChampions': 'magical_dmg_to_champions',
+    'totalDamageDealtToChampions': 'total_dmg_to_champions',
+    'dragonKills': 'dragon_kills',
+    'totalAllyJungleMinionsKilled': 'ally_jungle_minions_kills',
+    'totalEnemyJungleMinionsKilled': 'ennemy_jungle_minions_kills',
+    'totalMinionsKilled': 'total_minion_kills'
+}
+
+# Column name -> python type of a wide match row, the 10 players following the general and team columns
+MATCH_ROW_SCHEMA = {
+    **{f"player_{i}_uuid": str for i in range(1, 11)},
+    **{column: PLAYER_LINE_SCHEMA[key] for key, column in GENERAL_COLUMN_NAMES.items()},
+    **{f"player_{i}_{column}": PLAYER_LINE_SCHEMA[key] for i in range(1, 11) for key, column in PLAYER_COLUMN_NAMES.items()}
+}
+
+# Column name -> python type of a participant row : the general and team columns then the columns of one player,
+# named as the exploded rows of the notebooks (player_champ_name, player_win, ...)
+PARTICIPANT_ROW_SCHEMA = {
+    **{column: PLAYER_LINE_SCHEMA[key] for key, column in GENERAL_COLUMN_NAMES.items()},
+    **{f"player_{column}": PLAYER_LINE_SCHEMA[key] for key, column in PLAYER_COLUMN_NAMES.items()}
+}
+
+
+def to_schema_type(value, value_type: type):
+    """
+    Converts an API value to the type of its column, missing values staying None.
+    Returns: str | int | bool | None
+    """
+    if value is None:
+        return None
+    if value_type is bool and isinstance(value, str):
+        return value == 'True'
+    return value_type(value)
+
+
+def get_typed_general_info(api_response: dict) -> dict:
+    """
+    Extracts the general match information and the team statistics as typed values, keyed by column name.
+    Returns: dict
+    """
+    info = api_response["info"]
+    values = [info['gameCreation'], info['gameDuration'], info['gameId'], info['gameVersion'], info['platformId'], info['queueId']]
+    for team in info['teams']:
+        objectives = team['objectives']
+        values += [
+                team['teamId'],
+                team['win'],
+                objectives['tower']['kills'],
+                objectives['tower']['first'],
+                objectives['atakhan']['first'],
+                objectives['baron']['kills'],
+                objectives['dragon']['kills'],
+                objectives['horde']['kills'],
+                objectives['riftHerald']['kills']
+        ]
+
+    return {column: to_schema_type(value, PLAYER_LINE_SCHEMA[key]) for (key, column), value in zip(GENERAL_COLUMN_NAMES.items(), values)}
+
+
+def get_typed_player_info(participant_api_response: dict, prefix: str) -> dict:
+    """
+    Extracts the statistics of a participant as typed values, keyed by prefix + column name.
+    Returns: dict
+    """
+    return {
+        f"{prefix}{column}": to_schema_type(participant_api_response.get(key), PLAYER_LINE_SCHEMA[key])
+        for key, column in PLAYER_COLUMN_NAMES.items()
+    }
+
+
+def generate_match_row_from_match_api_response(api_response: dict) -> dict:
+    """
+    Generates the typed wide row of a match, holding the same fields as generate_csv_line_from_match_api_response.
+    Returns: dict following MATCH_ROW_SCHEMA
+    """
+    row = {f"player_{i}_uuid": str(puuid) for i, puuid in enumerate(api_response["metadata"]['participants'], start=1)}
+    row.update(get_typed_general_info(api_response))
+    for i, player in enumerate(api_response["info"]['participants'], start=1):
+        row.update(get_typed_player_info(player, f"player_{i}_"))
+    return row
+
+
+def generate_participant_rows_from_match_api_response(api_response: dict) -> list[dict]:
+    """
+    Generates one typed row per participant, the general and team columns being repeated on each row.
+    Returns: list of dict following PARTICIPANT_ROW_SCHEMA
+    """
+    general_info = get_typed_general_info(api_response)
+    return [{**general_info, **get_typed_player_info(player, "player_")} for player in api_response["info"]['participants']]
+
+
+def get_match_patch(api_response: dict) -> str:
+    """
+    Extracts the patch of a match from its game version, e.g. "15.4" from "15.4.657.1245".
+    Returns: str
+    """
+    return ".".join(str(api_response["info"]['gameVersion']).split(".")[:2])
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from rate_limiter import RIOT_RATE_LIMITS, HostRateLimiters
+
+
+class NoActiveKeyError(Exception):
+    """
+    Raised when every key of the pool has been quarantined.
+    """
+    def __init__(self, message):
+        super().__init__(message)
+
+
+class KeyPool:
+    """
+    Pool of Riot API keys, each key having its own rate limiters per host, Riot limits applying per key.
+    A request takes the key whose next free slot comes first, so the throughput grows with the number of keys.
+    A key refused by Riot (401) is quarantined and never used again by the pool.
+    """
+    def __init__(self, api_keys: list[str], rate_limits: list[tuple[int, int]] = RIOT_RATE_LIMITS):
+        api_keys = list(dict.fromkeys(key.strip() for key in api_keys if key and key.strip()))
+        if len(api_keys) == 0:
+            raise NoActiveKeyError("No Riot API key given to the key pool")
+        self.api_keys = api_keys
+        self._limiters = {api_key: HostRateLimiters(rate_limits) for api_key in api_keys}
+        self._quarantined = set()
+        self._lock = threading.Lock()
+
+    def get_active_keys(self) -> list[str]:
+        with self._lock:
+            return [api_key for api_key in self.api_keys if api_key not in self._quarantined]
+
+    def reserve(self, host: str) -> tuple[str | None, float]:
+        """
+        Takes a slot on the host for the active key with the earliest free slot.
+        Returns: tuple[str | None, float], (key, 0) once a slot is taken, (None, seconds to wait) when every key has to wait
+        """
+        active_keys = self.get_active_keys()
+        if len(active_keys) == 0:
+            raise NoActiveKeyError(f"Every Riot API key of the pool is quarantined ({len(self.api_keys)} keys)")
+
+        delays = sorted((self._limiters[api_key].get(host).next_slot_delay(), index, api_key) for index, api_key in enumerate(active_keys))
+        shortest_wait = None
+        for _, _, api_key in delays:
+            wait = self._limiters[api_key].get(host).try_acquire()
+            if wait == 0:
+                return api_key, 0.0
+            shortest_wait = wait if shortest_wait is None else min(shortest_wait, wait)
+        return None, shortest_wait
+
+    def acquire(self, host: str) -> str:
+        """
+        Blocks until a key has a free slot on the host, then takes it.
+        Returns: str, the key to send the request with
+        """
+        while True:
+            api_key, wait = self.reserve(host)
+            if api_key is not None:
+                return api_key
+            time.sleep(wait)
+
+    def quarantine(self, api_key: str) -> None:
+        """
+        Stops using a key, e.g. revoked or expired.
+        """
+        with self._lock:
+            self._quarantined.add(api_key)
+
+    def get_utilization(self) -> dict[str, list[tuple[int, int, float]]]:
+        """
+        Share of the quota of the active keys used in each window, per host. A ratio close to 1 means the crawl is quota-bound.
+        Returns: dict[str, list[tuple[int, int, float]]], host -> (calls, period, ratio) per window
+        """
+        active_keys = self.get_active_keys()
+        usages = {}
+        for api_key in active_keys:
+            for host in self._limiters[api_key].get_hosts():
+                for i, (calls, period, used) in enumerate(self._limiters[api_key].get(host).get_usage()):
+                    host_usages = usages.setdefault(host, {})
+                    host_usages[i] = (calls, period, host_usages.get(i, (calls, period, 0))[2] + used)
+        return {
+            host: [(calls, period, used / (calls * len(active_keys))) for calls, period, used in host_usages.values()]
+            for host, host_usages in usages.items()
+        }
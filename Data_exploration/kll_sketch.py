@@ -0,0 +1,162 @@
+import math
+import random
+import struct
+
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+
+# Size of the top compactor : a larger k keeps more values and lowers the rank error, about 1.65% for k = 200 (see README)
+KLL_K = 200
+# Ratio between the capacity of a compactor and of the one above it
+CAPACITY_RATIO = 2 / 3
+# Smallest capacity of a compactor
+MIN_CAPACITY = 2
+
+
+def interpolate(lower_value, higher_value, position):
+    """
+    Value at a fractional rank between the values of its floor and ceil ranks, with the operations of the Spark percentile function
+    so that the float is the same.
+    Returns: float
+    """
+    lower_rank = math.floor(position)
+    higher_rank = math.ceil(position)
+    if higher_rank == lower_rank:
+        return lower_value
+    return (higher_rank - position) * lower_value + (position - lower_rank) * higher_value
+
+
+class KllSketch:
+    """
+    KLL quantile sketch of a stream of floats (Karnin, Lang, Liberty). A compactor of level h keeps values of weight 2^h : once full,
+    it is sorted and every other value, starting at the first or the second one, moves up a level. The sketch keeps a few times k
+    values whatever the stream length, and two sketches merge by concatenating their levels, so that a sketch can be stored,
+    reloaded and completed with the new values only.
+    While less than the capacity of the first compactor were added (at least k values), the sketch holds every value and its
+    quantiles are exact. The coin of each compaction is seeded by the number of values seen, so that a same stream of updates
+    and merges always gives the same sketch.
+    """
+    def __init__(self, k=KLL_K):
+        self.k = k
+        self.count = 0
+        self.compactors = [[]]
+        self._max_size = self._get_capacity(0)
+        self._size = 0
+
+    def _get_capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(MIN_CAPACITY, int(math.ceil(self.k * CAPACITY_RATIO ** depth)))
+
+    def _grow(self):
+        self.compactors.append([])
+        self._max_size = sum(self._get_capacity(level) for level in range(len(self.compactors)))
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def update_many(self, values):
+        """
+        Adds the values by chunks filling the sketch up to its next compaction, which gives the same sketch as one update per value.
+        """
+        start = 0
+        while start < len(values):
+            chunk = values[start:start + max(1, self._max_size - self._size)]
+            self.compactors[0].extend(chunk)
+            self.count += len(chunk)
+            self._size += len(chunk)
+            start += len(chunk)
+            if self._size >= self._max_size:
+                self._compress()
+
+    def merge(self, other):
+        """
+        Adds the values of another sketch to this one.
+        """
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.count += other.count
+        self._size = sum(len(compactor) for compactor in self.compactors)
+        while self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            if len(self.compactors[level]) >= self._get_capacity(level):
+                if level + 1 == len(self.compactors):
+                    self._grow()
+                compactor = sorted(self.compactors[level])
+                # An odd value out stays in the compactor
+                kept = [compactor.pop()] if len(compactor) % 2 else []
+                offset = random.Random(self.count * 64 + level).random() < 0.5
+                self.compactors[level + 1].extend(compactor[offset::2])
+                self.compactors[level] = kept
+                self._size = sum(len(compactor) for compactor in self.compactors)
+                if self._size < self._max_size:
+                    break
+
+    def is_exact(self):
+        return len(self.compactors) == 1 or all(not compactor for compactor in self.compactors[1:])
+
+    def get_weighted_values(self):
+        """
+        Returns: list[tuple[float, int]], the kept values sorted with their weight
+        """
+        return sorted((value, 1 << level) for level, compactor in enumerate(self.compactors) for value in compactor)
+
+    def get_quantiles(self, quantiles):
+        """
+        Quantiles interpolated between the two closest ranks, as the Spark percentile function : exact while is_exact().
+        Returns: list[float | None], None for an empty sketch
+        """
+        weighted_values = self.get_weighted_values()
+        if not weighted_values:
+            return [None for _ in quantiles]
+        cumulated_weights = list(accumulate(weight for _, weight in weighted_values))
+        total_weight = cumulated_weights[-1]
+
+        def get_value(rank):
+            # Value of the rank-th (0 based) value of the stream, the values of weight w counting for w ranks
+            return weighted_values[min(bisect_right(cumulated_weights, rank), len(weighted_values) - 1)][0]
+
+        results = []
+        for quantile in quantiles:
+            position = (total_weight - 1) * quantile
+            results.append(interpolate(get_value(math.floor(position)), get_value(math.ceil(position)), position))
+        return results
+
+    def to_bytes(self):
+        """
+        Serializes the sketch : k, count and the number of levels, then the size of each level and its values as doubles.
+        Returns: bytes
+        """
+        values = array('d', [value for compactor in self.compactors for value in compactor])
+        header = struct.pack(f"<IQI{len(self.compactors)}I", self.k, self.count, len(self.compactors),
+                             *[len(compactor) for compactor in self.compactors])
+        return header + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        k, count, levels = struct.unpack_from("<IQI", data)
+        offset = struct.calcsize("<IQI")
+        sizes = struct.unpack_from(f"<{levels}I", data, offset)
+        values = array('d')
+        values.frombytes(data[offset + 4 * levels:])
+
+        sketch = cls(k)
+        sketch.count = count
+        sketch.compactors = []
+        start = 0
+        for size in sizes:
+            sketch.compactors.append(values[start:start + size].tolist())
+            start += size
+        sketch._max_size = sum(sketch._get_capacity(level) for level in range(len(sketch.compactors)))
+        sketch._size = len(values)
+        return sketch
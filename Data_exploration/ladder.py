@@ -0,0 +1,273 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import urllib3
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from download_players_matchs_history import UnauthorizedError, send_get_api_request
+from output_writers import write_file_atomically
+
+
+QUEUE = "RANKED_SOLO_5x5"
+TIERS = ['IRON', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'EMERALD', 'DIAMOND', 'MASTER', 'GRANDMASTER', 'CHALLENGER']
+DIVISIONS = ['IV', 'III', 'II', 'I']
+# Tiers of a single league, fetched at once instead of by pages
+APEX_LEAGUES = {'MASTER': "masterleagues", 'GRANDMASTER': "grandmasterleagues", 'CHALLENGER': "challengerleagues"}
+
+LEAGUE_EXP_URL = "https://[PLATFORM].api.riotgames.com/lol/league-exp/v4/entries/[QUEUE]/[TIER]/[DIVISION]?page=[PAGE]"
+APEX_LEAGUE_URL = "https://[PLATFORM].api.riotgames.com/lol/league/v4/[LEAGUE]/by-queue/[QUEUE]"
+# Entries of a full league-exp page, a shorter page being the last one
+LEAGUE_EXP_PAGE_SIZE = 205
+# Pages of a division requested ahead, at most PAGES_AHEAD - 1 requests being spent past its last page
+PAGES_AHEAD = 4
+
+# Names of the players files read by the crawlers, e.g. ./players/chall_puuid.txt
+PLAYERS_FILE_NAMES = {'CHALLENGER': "chall"}
+
+LADDER_DB_PATH = "./players/ladder.db"
+
+
+def get_rank_value(tier, division):
+    """
+    Orders the ranks, IRON IV being 0. Apex tiers have the single division I.
+    Returns: int
+    """
+    return TIERS.index(tier) * len(DIVISIONS) + DIVISIONS.index(division)
+
+
+def get_player_row(entry, tier):
+    """
+    Typed row of a league entry.
+    Returns: dict
+    """
+    return {
+        'puuid': entry['puuid'],
+        'tier': tier,
+        'division': entry.get('rank', 'I'),
+        'league_points': int(entry['leaguePoints']),
+        'wins': int(entry['wins']),
+        'losses': int(entry['losses']),
+        'hot_streak': bool(entry.get('hotStreak', False)),
+        'veteran': bool(entry.get('veteran', False)),
+        'inactive': bool(entry.get('inactive', False))
+    }
+
+
+def fetch_ladder(platform, tiers, headers, http, workers):
+    """
+    Enumerates the players of the given tiers of a platform. The pages of every division are fetched concurrently,
+    PAGES_AHEAD at a time, a division stopping as soon as one of its pages is short. Requests go through the shared
+    key pool, so the platform quota is respected whatever the number of workers.
+    Returns: tuple[dict[str, dict], bool], the players by puuid (highest rank kept for a player seen twice) and whether every request succeeded
+    """
+    players = {}
+    complete = True
+    tasks = {}
+    next_pages = {}
+    # First short page of each division, pages completing out of order
+    last_pages = {}
+
+    def add_player(row):
+        known = players.get(row['puuid'])
+        if known is None or (get_rank_value(row['tier'], row['division']), row['league_points']) > \
+                (get_rank_value(known['tier'], known['division']), known['league_points']):
+            players[row['puuid']] = row
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def submit_page(tier, division, page):
+            url = LEAGUE_EXP_URL.replace("[PLATFORM]", platform).replace("[QUEUE]", QUEUE).replace("[TIER]", tier)\
+                .replace("[DIVISION]", division).replace("[PAGE]", str(page))
+            tasks[executor.submit(send_get_api_request, url, headers, http)] = (tier, division, page)
+
+        for tier in tiers:
+            if tier in APEX_LEAGUES:
+                url = APEX_LEAGUE_URL.replace("[PLATFORM]", platform).replace("[LEAGUE]", APEX_LEAGUES[tier]).replace("[QUEUE]", QUEUE)
+                tasks[executor.submit(send_get_api_request, url, headers, http)] = (tier, 'I', None)
+                continue
+            for division in DIVISIONS:
+                for page in range(1, PAGES_AHEAD + 1):
+                    submit_page(tier, division, page)
+                next_pages[(tier, division)] = PAGES_AHEAD + 1
+
+        while tasks:
+            done, _ = wait(list(tasks), return_when=FIRST_COMPLETED)
+            for future in done:
+                tier, division, page = tasks.pop(future)
+                try:
+                    response = future.result()
+                except UnauthorizedError as u:
+                    executor.shutdown(cancel_futures=True)
+                    raise UnauthorizedError(u)
+                except Exception as e:
+                    print(f"[ERROR] - {datetime.now()} : {tier} {division} page {page} faced an issue : {e}")
+                    complete = False
+                    continue
+
+                entries = response['entries'] if page is None else response
+                for entry in entries:
+                    add_player(get_player_row(entry, tier))
+
+                if page is None:
+                    print(f"[INFO] - {datetime.now()} : {tier} fetched, {len(entries)} players")
+                elif len(entries) < LEAGUE_EXP_PAGE_SIZE:
+                    last_pages[(tier, division)] = min(page, last_pages.get((tier, division), page))
+                elif (tier, division) not in last_pages:
+                    submit_page(tier, division, next_pages[(tier, division)])
+                    next_pages[(tier, division)] += 1
+
+    for (tier, division), page in sorted(last_pages.items()):
+        print(f"[INFO] - {datetime.now()} : {tier} {division} fetched, last page {page}, {next_pages[(tier, division)] - 1 - page} pages past it")
+    return players, complete
+
+
+class LadderStore:
+    """
+    Typed table of the ladder players of each platform, in SQLite, with the time of the snapshot that last changed each player.
+    Applying a snapshot only writes its differences with the table : new players, promotions, demotions, players gone,
+    each change being kept in ladder_changes.
+    """
+    COLUMNS = ['puuid', 'tier', 'division', 'league_points', 'wins', 'losses', 'hot_streak', 'veteran', 'inactive']
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS ladder_players (
+                platform TEXT NOT NULL,
+                puuid TEXT NOT NULL,
+                tier TEXT NOT NULL,
+                division TEXT NOT NULL,
+                league_points INTEGER NOT NULL,
+                wins INTEGER NOT NULL,
+                losses INTEGER NOT NULL,
+                hot_streak INTEGER NOT NULL,
+                veteran INTEGER NOT NULL,
+                inactive INTEGER NOT NULL,
+                snapshot_at REAL NOT NULL,
+                PRIMARY KEY (platform, puuid)
+            )
+        """)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS ladder_changes (
+                platform TEXT NOT NULL,
+                puuid TEXT NOT NULL,
+                change TEXT NOT NULL,
+                old_tier TEXT,
+                old_division TEXT,
+                new_tier TEXT,
+                new_division TEXT,
+                snapshot_at REAL NOT NULL
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ladder_players_tier ON ladder_players (platform, tier, division)")
+        self._lock = threading.Lock()
+
+    def get_players(self, platform, tiers=None):
+        """
+        Returns: dict[str, dict], the players of a platform by puuid, of the given tiers or of every tier
+        """
+        rows = self._connection.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM ladder_players WHERE platform = ?", (platform,)).fetchall()
+        players = {row[0]: dict(zip(self.COLUMNS, row)) for row in rows}
+        if tiers is not None:
+            players = {puuid: player for puuid, player in players.items() if player['tier'] in tiers}
+        return players
+
+    def apply_snapshot(self, platform, players, tiers, complete):
+        """
+        Writes the differences between a snapshot of the given tiers and the table. Players missing from the snapshot are
+        only removed when it is complete, a failed page not meaning they left the ladder.
+        Returns: dict[str, int], the number of changes per kind
+        """
+        snapshot_at = time.time()
+        previous_players = self.get_players(platform)
+        changes = []
+        upserts = []
+
+        for puuid, player in players.items():
+            previous = previous_players.get(puuid)
+            if previous is None:
+                changes.append((platform, puuid, 'new', None, None, player['tier'], player['division'], snapshot_at))
+            else:
+                old_rank = get_rank_value(previous['tier'], previous['division'])
+                new_rank = get_rank_value(player['tier'], player['division'])
+                if new_rank != old_rank:
+                    changes.append((platform, puuid, 'promotion' if new_rank > old_rank else 'demotion',
+                                    previous['tier'], previous['division'], player['tier'], player['division'], snapshot_at))
+                elif all(previous[column] == player[column] for column in self.COLUMNS):
+                    continue
+            upserts.append(tuple(player[column] for column in self.COLUMNS) + (platform, snapshot_at))
+
+        removed = []
+        if complete:
+            for puuid, previous in previous_players.items():
+                if puuid not in players and previous['tier'] in tiers:
+                    removed.append(puuid)
+                    changes.append((platform, puuid, 'left', previous['tier'], previous['division'], None, None, snapshot_at))
+
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(
+                    f"INSERT OR REPLACE INTO ladder_players ({', '.join(self.COLUMNS)}, platform, snapshot_at) "
+                    f"VALUES ({', '.join('?' * (len(self.COLUMNS) + 2))})", upserts)
+                self._connection.executemany("DELETE FROM ladder_players WHERE platform = ? AND puuid = ?",
+                                             [(platform, puuid) for puuid in removed])
+                self._connection.executemany("INSERT INTO ladder_changes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", changes)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        summary = {'unchanged': len(players) - len(upserts), 'updated': len(upserts)}
+        for change in changes:
+            summary[change[2]] = summary.get(change[2], 0) + 1
+        return summary
+
+    def close(self):
+        self._connection.close()
+
+
+def export_players_files(store, platform, tiers):
+    """
+    Rewrites the "puuid;lp;wins;losses" players files read by the crawlers, e.g. ./players/chall_puuid.txt,
+    ./players/na1-diamond_puuid.txt for other platforms than euw1.
+    """
+    players = store.get_players(platform, tiers)
+    for tier in tiers:
+        tier_players = sorted((player for player in players.values() if player['tier'] == tier),
+                              key=lambda player: (-get_rank_value(player['tier'], player['division']), -player['league_points']))
+        file_name = f"{PLAYERS_FILE_NAMES.get(tier, tier.lower())}_puuid.txt"
+        path = f"./players/{file_name}" if platform == "euw1" else f"./players/{platform}-{file_name}"
+        write_file_atomically(path, [f"{player['puuid']};{player['league_points']};{player['wins']};{player['losses']}" for player in tier_players])
+        print(f"[INFO] - {datetime.now()} : {len(tier_players)} players written to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enumerates the ranked solo ladder of a platform and stores its changes.")
+    parser.add_argument('--platform', default="euw1")
+    parser.add_argument('--tiers', default=",".join(TIERS), help="Comma separated tiers, e.g. DIAMOND,MASTER,GRANDMASTER,CHALLENGER.")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--db', default=LADDER_DB_PATH)
+    parser.add_argument('--export', action='store_true', help="Rewrites the players files of the crawlers from the table.")
+    args = parser.parse_args()
+
+    tiers = [tier.strip().upper() for tier in args.tiers.split(",")]
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    http = urllib3.PoolManager(maxsize=args.workers)
+
+    start = time.perf_counter()
+    players, complete = fetch_ladder(args.platform, tiers, {}, http, args.workers)
+    print(f"[INFO] - {datetime.now()} : {len(players)} players fetched in {time.perf_counter() - start:.1f}s"
+          f"{'' if complete else ', some pages failed'}")
+
+    store = LadderStore(args.db)
+    print(f"[INFO] - {datetime.now()} : Snapshot applied {store.apply_snapshot(args.platform, players, tiers, complete)}")
+    if args.export:
+        export_players_files(store, args.platform, tiers)
+    store.close()
@@ -0,0 +1,223 @@
+import argparse
+import importlib
+import json
+import os
+import threading
+
+import zstandard as zstd
+
+from datetime import datetime
+
+
+# A new segment is started once the current one reaches this size
+SEGMENT_BYTES = 256 * 1024 * 1024
+COMPRESSION_LEVEL = 9
+# The dictionary is trained on the first matches, which are compressed without it
+DICTIONARY_SAMPLES = 1000
+DICTIONARY_SIZE = 112_640
+
+
+def get_segment_numbers(root):
+    """
+    Lists the numbers of the segments of an archive, in writing order.
+    """
+    numbers = []
+    for file_name in os.listdir(root):
+        if file_name.startswith("segment_") and file_name.endswith(".zst"):
+            numbers.append(int(file_name[len("segment_"):-len(".zst")]))
+    return sorted(numbers)
+
+
+def read_segment_index(index_path):
+    """
+    Reads the "match_id;offset;length" lines of a segment index.
+    Returns: list[tuple[str, int, int]]
+    """
+    entries = []
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                parts = line.strip().split(";")
+                if len(parts) == 3:
+                    entries.append((parts[0], int(parts[1]), int(parts[2])))
+    return entries
+
+
+def truncate_partial_line(path):
+    """
+    Cuts a file after its last newline, dropping the line a crash left half written.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as text_file:
+        size = text_file.seek(0, os.SEEK_END)
+        end = 0
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            text_file.seek(position - step)
+            newline = text_file.read(step).rfind(b"\n")
+            if newline >= 0:
+                end = position - step + newline + 1
+                break
+            position -= step
+        if end < size:
+            text_file.truncate(end)
+
+
+def load_decompressors(root):
+    """
+    Builds a decompressor per trained dictionary, keyed by dictionary id. Frames written without dictionary have the id 0.
+    Returns: dict[int, zstd.ZstdDecompressor]
+    """
+    decompressors = {0: zstd.ZstdDecompressor()}
+    dictionaries_path = os.path.join(root, "dictionaries")
+    if os.path.exists(dictionaries_path):
+        for file_name in os.listdir(dictionaries_path):
+            with open(os.path.join(dictionaries_path, file_name), "rb") as dictionary_file:
+                dictionary = zstd.ZstdCompressionDict(dictionary_file.read())
+            decompressors[dictionary.dict_id()] = zstd.ZstdDecompressor(dict_data=dictionary)
+    return decompressors
+
+
+def decompress_frame(frame, decompressors):
+    return json.loads(decompressors[zstd.get_frame_parameters(frame).dict_id].decompress(frame))
+
+
+class MatchArchive:
+    """
+    Append-only archive of the raw match-v5 responses, so new stats can be extracted without crawling again.
+    Each match is an independent zstd frame appended to {root}/segment_N.zst, then indexed by a "match_id;offset;length" line in segment_N.idx.
+    Frames are compressed with a dictionary trained on the first DICTIONARY_SAMPLES matches, the match JSON keys being the same in every response.
+    A frame written without its index line (crash) is truncated when the archive is opened again, as is a half written index line.
+    """
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._samples = []
+        os.makedirs(os.path.join(root, "dictionaries"), exist_ok=True)
+
+        dictionaries = sorted(os.listdir(os.path.join(root, "dictionaries")))
+        if dictionaries:
+            with open(os.path.join(root, "dictionaries", dictionaries[-1]), "rb") as dictionary_file:
+                self._compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=zstd.ZstdCompressionDict(dictionary_file.read()))
+            self._dictionary_trained = True
+        else:
+            self._compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL)
+            self._dictionary_trained = False
+
+        segment_numbers = get_segment_numbers(root)
+        self._open_segment(segment_numbers[-1] if segment_numbers else 0)
+
+    def _open_segment(self, number):
+        self.segment_number = number
+        segment_path = os.path.join(self.root, f"segment_{number:05d}.zst")
+        index_path = os.path.join(self.root, f"segment_{number:05d}.idx")
+        # Before reading it : a half written "match_id;offset;len" line may still split in 3 parts
+        truncate_partial_line(index_path)
+        entries = read_segment_index(index_path)
+        indexed_end = entries[-1][1] + entries[-1][2] if entries else 0
+
+        self._segment_file = open(segment_path, "ab")
+        if self._segment_file.tell() > indexed_end:
+            self._segment_file.truncate(indexed_end)
+            self._segment_file.seek(indexed_end)
+        self._index_file = open(index_path, "a", encoding="utf-8")
+
+    def _train_dictionary(self):
+        dictionary = zstd.train_dictionary(DICTIONARY_SIZE, self._samples, level=COMPRESSION_LEVEL)
+        with open(os.path.join(self.root, "dictionaries", f"{dictionary.dict_id()}.dict"), "wb") as dictionary_file:
+            dictionary_file.write(dictionary.as_bytes())
+        self._compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary)
+        self._dictionary_trained = True
+        self._samples = []
+        print(f"[INFO] - {datetime.now()} : Archive dictionary {dictionary.dict_id()} trained")
+
+    def append(self, match_id, api_response):
+        """
+        Compresses and appends the raw response of a match, then indexes it.
+        """
+        data = json.dumps(api_response, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            if not self._dictionary_trained:
+                self._samples.append(data)
+                if len(self._samples) >= DICTIONARY_SAMPLES:
+                    self._train_dictionary()
+
+            frame = self._compressor.compress(data)
+            offset = self._segment_file.tell()
+            self._segment_file.write(frame)
+            self._segment_file.flush()
+            self._index_file.write(f"{match_id};{offset};{len(frame)}\n")
+            self._index_file.flush()
+
+            if offset + len(frame) >= SEGMENT_BYTES:
+                self.close()
+                self._open_segment(self.segment_number + 1)
+
+    def close(self):
+        self._segment_file.close()
+        self._index_file.close()
+
+
+def iter_archived_matches(root):
+    """
+    Streams the archived responses segment after segment, reading each segment sequentially.
+    A match archived twice (crash before its queue item was done) is only yielded once.
+    Returns: generator of (match_id, api_response)
+    """
+    decompressors = load_decompressors(root)
+    seen_match_ids = set()
+    for number in get_segment_numbers(root):
+        entries = read_segment_index(os.path.join(root, f"segment_{number:05d}.idx"))
+        with open(os.path.join(root, f"segment_{number:05d}.zst"), "rb") as segment_file:
+            for match_id, offset, length in entries:
+                if match_id in seen_match_ids:
+                    continue
+                seen_match_ids.add(match_id)
+                segment_file.seek(offset)
+                yield match_id, decompress_frame(segment_file.read(length), decompressors)
+
+
+def read_archived_match(root, match_id):
+    """
+    Reads the response of a single match through the segment indexes.
+    Returns: dict | None
+    """
+    for number in get_segment_numbers(root):
+        for indexed_match_id, offset, length in read_segment_index(os.path.join(root, f"segment_{number:05d}.idx")):
+            if indexed_match_id == match_id:
+                with open(os.path.join(root, f"segment_{number:05d}.zst"), "rb") as segment_file:
+                    segment_file.seek(offset)
+                    return decompress_frame(segment_file.read(length), load_decompressors(root))
+    return None
+
+
+def load_extractor(path):
+    """
+    Loads an extractor given as "module:function", called with each match response and returning a line.
+    """
+    module_name, function_name = path.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays the raw match archive through an extractor.")
+    parser.add_argument('--archive', default="./archive")
+    parser.add_argument('--extractor', default="format_match_api_response:generate_csv_line_from_match_api_response",
+                        help="Function called on each match response, as module:function.")
+    parser.add_argument('--output', default="./matchs_replay/replay_match.csv")
+    parser.add_argument('--match-id', help="Prints the raw response of a single match instead.")
+    args = parser.parse_args()
+
+    if args.match_id:
+        print(json.dumps(read_archived_match(args.archive, args.match_id), indent=2))
+    else:
+        extractor = load_extractor(args.extractor)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        replayed = 0
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            for _, api_response in iter_archived_matches(args.archive):
+                output_file.write(extractor(api_response) + "\n")
+                replayed += 1
+        print(f"[INFO] - {datetime.now()} : {replayed} matches replayed to {args.output}")
@@ -0,0 +1,150 @@
+import mmap
+import os
+import struct
+import threading
+
+
+# Header : magic, number of slots (a power of 2), number of stored ids
+INDEX_MAGIC = b'MATCHIDX'
+INDEX_HEADER = struct.Struct('<8sQQ')
+INDEX_SLOT = struct.Struct('<Q')
+
+INITIAL_CAPACITY = 1 << 20
+MAX_LOAD_FACTOR = 0.7
+
+# The platform of a match id is kept in the top byte, so "EUW1_123" and "NA1_123" never collide.
+# A code is never 0, an empty slot being stored as 0.
+PLATFORMS = ['BR1', 'EUN1', 'EUW1', 'JP1', 'KR', 'LA1', 'LA2', 'ME1', 'NA1', 'OC1', 'PH2', 'RU', 'SG2', 'TH2', 'TR1', 'TW2', 'VN2']
+PLATFORM_CODES = {platform: code + 1 for code, platform in enumerate(PLATFORMS)}
+
+
+def encode_match_id(match_id):
+    """
+    Packs a match id such as "EUW1_7591052254" into a 64 bits integer : platform code in the top byte, numeric part below.
+    """
+    platform, _, number = str(match_id).strip().rpartition('_')
+    if platform.upper() not in PLATFORM_CODES:
+        raise ValueError(f"Unknown platform for match id {match_id}")
+    return (PLATFORM_CODES[platform.upper()] << 56) | int(number)
+
+
+def get_home_slot(key, mask):
+    """
+    Fibonacci hashing of a packed id, the low bits of the ids being sequential.
+    """
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 20 & mask
+
+
+class MatchIdIndex:
+    """
+    Exact set of match ids stored as an open addressing hash table in a memory-mapped file.
+    Opening only maps the file, lookups probe a few slots of the mapping : the set is never loaded into Python objects.
+    Ids can only be added, the table being rebuilt with twice the slots once it is 70% full.
+    Shared by the crawler threads, every access holds a lock.
+    """
+    def __init__(self, path, initial_capacity=INITIAL_CAPACITY):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if not os.path.exists(path):
+            self._create_file(path, initial_capacity)
+        self._open_file()
+
+    @staticmethod
+    def _create_file(path, capacity):
+        with open(path, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, capacity, 0))
+            f.truncate(INDEX_HEADER.size + capacity * INDEX_SLOT.size)
+
+    def _open_file(self):
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.count = INDEX_HEADER.unpack_from(self._map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{self.path} is not a match id index")
+        self._mask = self.capacity - 1
+
+    def _slot_of(self, key):
+        """
+        Probes from the hashed slot until the key or an empty slot is found.
+        Returns (slot, found)
+        """
+        slot = get_home_slot(key, self._mask)
+        while True:
+            stored = INDEX_SLOT.unpack_from(self._map, INDEX_HEADER.size + slot * INDEX_SLOT.size)[0]
+            if stored == key:
+                return slot, True
+            if stored == 0:
+                return slot, False
+            slot = (slot + 1) & self._mask
+
+    def __contains__(self, match_id):
+        key = encode_match_id(match_id)
+        with self._lock:
+            return self._slot_of(key)[1]
+
+    def __len__(self):
+        return self.count
+
+    def add(self, match_id):
+        """
+        Adds a match id, returns False when it was already in the set.
+        """
+        return self.add_many([match_id]) == 1
+
+    def add_many(self, match_ids):
+        """
+        Adds several match ids under a single lock, returns the number of new ones.
+        """
+        added = 0
+        with self._lock:
+            for match_id in match_ids:
+                key = encode_match_id(match_id)
+                if (self.count + 1) > self.capacity * MAX_LOAD_FACTOR:
+                    self._grow()
+                slot, found = self._slot_of(key)
+                if found:
+                    continue
+                INDEX_SLOT.pack_into(self._map, INDEX_HEADER.size + slot * INDEX_SLOT.size, key)
+                self.count += 1
+                added += 1
+            INDEX_HEADER.pack_into(self._map, 0, INDEX_MAGIC, self.capacity, self.count)
+        return added
+
+    def _grow(self):
+        """
+        Rehashes every id into a table twice as large, written aside then renamed over the index.
+        """
+        new_path = self.path + ".grow"
+        new_capacity = self.capacity * 2
+        self._create_file(new_path, new_capacity)
+
+        with open(new_path, "r+b") as new_file:
+            new_map = mmap.mmap(new_file.fileno(), 0)
+            new_mask = new_capacity - 1
+            for slot in range(self.capacity):
+                key = INDEX_SLOT.unpack_from(self._map, INDEX_HEADER.size + slot * INDEX_SLOT.size)[0]
+                if key == 0:
+                    continue
+                new_slot = get_home_slot(key, new_mask)
+                while INDEX_SLOT.unpack_from(new_map, INDEX_HEADER.size + new_slot * INDEX_SLOT.size)[0] != 0:
+                    new_slot = (new_slot + 1) & new_mask
+                INDEX_SLOT.pack_into(new_map, INDEX_HEADER.size + new_slot * INDEX_SLOT.size, key)
+            INDEX_HEADER.pack_into(new_map, 0, INDEX_MAGIC, new_capacity, self.count)
+            new_map.flush()
+            new_map.close()
+
+        self._map.close()
+        self._file.close()
+        os.replace(new_path, self.path)
+        self._open_file()
+
+    def flush(self):
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
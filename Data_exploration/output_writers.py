@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+from datetime import datetime
+
+
+# Longest time written lines stay in the OS cache before an fsync
+FSYNC_INTERVAL_S = float(os.getenv("WRITER_FSYNC_INTERVAL_S", 5))
+
+
+def get_temp_path(path):
+    """
+    Hidden temporary path next to a file, Spark and the file listings skipping the names starting with a dot.
+    """
+    directory, file_name = os.path.split(path)
+    return os.path.join(directory, f".{file_name}.tmp")
+
+
+def write_file_atomically(path, lines, encoding="utf-8"):
+    """
+    Writes the lines in a temporary file renamed over the target once synced, so the target is either the old or the new content.
+    """
+    temp_path = get_temp_path(path)
+    with open(temp_path, "w", encoding=encoding) as f:
+        for line in lines:
+            f.write(str(line) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def write_bytes_atomically(path, data):
+    """
+    Same as write_file_atomically for a content written as is, without encoding nor added newline.
+    """
+    temp_path = get_temp_path(path)
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class AppendLog:
+    """
+    Append-only text file kept open. Lines are buffered and synced at most every fsync_interval_s, and on flush / close.
+    """
+    def __init__(self, path, fsync_interval_s=FSYNC_INTERVAL_S, encoding="utf-8"):
+        self.path = path
+        self.fsync_interval_s = fsync_interval_s
+        self._file = open(path, "a", encoding=encoding)
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, line):
+        with self._lock:
+            self._file.write(str(line) + "\n")
+            if time.monotonic() - self._last_sync >= self.fsync_interval_s:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+
+class RotatingLineWriter:
+    """
+    Writes lines to {directory}/{prefix}_N{suffix} files, starting a new file after max_lines lines or max_bytes bytes.
+    The current file is written hidden, then renamed once complete : a listed file is never partially written.
+    Lines are synced at most every fsync_interval_s and on flush, on_persisted being then called with the item ids of the synced lines.
+    Hidden files left by a crash are cut after their last complete line and renamed when the writer starts again.
+    """
+    def __init__(self, directory, prefix, suffix=".csv", max_lines=None, max_bytes=None, fsync_interval_s=FSYNC_INTERVAL_S,
+                 on_persisted=None, encoding="utf-8"):
+        self.directory = directory
+        self.prefix = prefix
+        self.suffix = suffix
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.fsync_interval_s = fsync_interval_s
+        self.on_persisted = on_persisted
+        self.encoding = encoding
+        self._lock = threading.Lock()
+        self._pending_ids = []
+        self._file = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover_temp_files()
+        self.file_iterator = self._get_next_file_iterator()
+
+    def get_path(self, file_iterator):
+        return os.path.join(self.directory, f"{self.prefix}_{file_iterator}{self.suffix}")
+
+    def _get_file_iterator(self, file_name):
+        name = file_name[1:-len(".tmp")] if file_name.startswith(".") and file_name.endswith(".tmp") else file_name
+        if name.startswith(f"{self.prefix}_") and name.endswith(self.suffix) and name[len(self.prefix) + 1:-len(self.suffix)].isdigit():
+            return int(name[len(self.prefix) + 1:-len(self.suffix)])
+        return None
+
+    def _get_next_file_iterator(self):
+        file_iterators = [self._get_file_iterator(file_name) for file_name in os.listdir(self.directory)]
+        return max([file_iterator for file_iterator in file_iterators if file_iterator is not None], default=-1) + 1
+
+    def _recover_temp_files(self):
+        for file_name in os.listdir(self.directory):
+            file_iterator = self._get_file_iterator(file_name)
+            if file_iterator is None or not file_name.startswith("."):
+                continue
+            temp_path = os.path.join(self.directory, file_name)
+            with open(temp_path, "r+b") as f:
+                content = f.read()
+                f.truncate(content.rfind(b"\n") + 1)
+            if os.path.getsize(temp_path) > 0:
+                os.replace(temp_path, self.get_path(file_iterator))
+                print(f"[INFO] - {datetime.now()} : Interrupted file recovered at {self.get_path(file_iterator)}")
+            else:
+                os.remove(temp_path)
+
+    def _open_file(self):
+        self._file = open(get_temp_path(self.get_path(self.file_iterator)), "a", encoding=self.encoding)
+        self._lines = 0
+        self._bytes = 0
+        self._last_sync = time.monotonic()
+
+    def write(self, line, item_id=None):
+        with self._lock:
+            if self._file is None:
+                self._open_file()
+            data = str(line) + "\n"
+            self._file.write(data)
+            self._lines += 1
+            self._bytes += len(data.encode(self.encoding))
+            if item_id is not None:
+                self._pending_ids.append(item_id)
+
+            if (self.max_lines is not None and self._lines >= self.max_lines) or (self.max_bytes is not None and self._bytes >= self.max_bytes):
+                self._rotate()
+            elif time.monotonic() - self._last_sync >= self.fsync_interval_s:
+                self._sync()
+
+    def _sync(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+        if self.on_persisted is not None and self._pending_ids:
+            self.on_persisted(self._pending_ids)
+        self._pending_ids = []
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self._file = None
+        os.replace(get_temp_path(self.get_path(self.file_iterator)), self.get_path(self.file_iterator))
+        print(f"[INFO] - {datetime.now()} : File created at {self.get_path(self.file_iterator)}")
+        self.file_iterator += 1
+
+    def flush(self):
+        """
+        Syncs the lines written so far, the current file staying open.
+        """
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """
+        Syncs and publishes the current file.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._rotate()
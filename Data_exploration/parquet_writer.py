@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from datetime import datetime
+from format_match_api_response import (MATCH_ROW_SCHEMA, PARTICIPANT_ROW_SCHEMA, generate_match_row_from_match_api_response,
+                                       generate_participant_rows_from_match_api_response, get_match_patch)
+
+
+# Matches buffered per partition before a part file is written, each part file holding a single row group
+ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", 2000))
+COMPRESSION = "zstd"
+
+ARROW_TYPES = {str: pa.string(), int: pa.int64(), bool: pa.bool_()}
+
+# "wide" : one row per match, 10 groups of player columns. "participants" : one row per player, read without explode.
+LAYOUTS = {
+    'wide': (MATCH_ROW_SCHEMA, lambda api_response: [generate_match_row_from_match_api_response(api_response)]),
+    'participants': (PARTICIPANT_ROW_SCHEMA, generate_participant_rows_from_match_api_response)
+}
+
+
+def get_arrow_schema(row_schema: dict) -> pa.Schema:
+    """
+    Converts a column name -> python type schema to an Arrow schema.
+    Returns: pa.Schema
+    """
+    return pa.schema([(column, ARROW_TYPES[value_type]) for column, value_type in row_schema.items()])
+
+
+class MatchParquetWriter:
+    """
+    Writes the matches of a players file as Parquet under {root}/patch={patch}/queue={queue}/part-*.parquet.
+    Rows are buffered per partition and written as one zstd row group holding ROW_GROUP_ROWS matches, in a temporary file renamed once complete.
+    A match is only persisted once its part file exists : on_persisted is then called with the match ids of the file.
+    The layout chooses between one row per match and one row per participant, see LAYOUTS.
+    """
+    def __init__(self, root, on_persisted=None, row_group_rows=ROW_GROUP_ROWS, layout='wide'):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown Parquet layout {layout}")
+        self.root = root
+        self.on_persisted = on_persisted
+        self.row_group_rows = row_group_rows
+        row_schema, self._row_generator = LAYOUTS[layout]
+        self.schema = get_arrow_schema(row_schema)
+        self._buffers = {}
+        self._file_iterator = 0
+        self._lock = threading.Lock()
+
+    def write_match(self, match_id, api_response):
+        """
+        Buffers the rows of a match, writing its partition once it holds row_group_rows matches.
+        Returns: bool, False as the match is only persisted by a later flush
+        """
+        rows = self._row_generator(api_response)
+        partition = (get_match_patch(api_response), api_response["info"]['queueId'])
+
+        with self._lock:
+            buffer = self._buffers.setdefault(partition, {'match_ids': [], 'columns': {column: [] for column in self.schema.names}})
+            buffer['match_ids'].append(match_id)
+            for column, values in buffer['columns'].items():
+                values.extend(row.get(column) for row in rows)
+            if len(buffer['match_ids']) >= self.row_group_rows:
+                self._write_partition(partition)
+        return False
+
+    def _write_partition(self, partition):
+        buffer = self._buffers.pop(partition, None)
+        if buffer is None:
+            return
+
+        patch, queue = partition
+        directory = os.path.join(self.root, f"patch={patch}", f"queue={queue}")
+        os.makedirs(directory, exist_ok=True)
+        self._file_iterator += 1
+        file_name = f"part-{time.time_ns()}-{self._file_iterator}.parquet"
+        file_path = os.path.join(directory, file_name)
+        # Hidden while written, Spark skipping the files starting with a dot
+        temp_path = os.path.join(directory, f".{file_name}.tmp")
+
+        table = pa.table(buffer['columns'], schema=self.schema)
+        pq.write_table(table, temp_path, compression=COMPRESSION, row_group_size=table.num_rows)
+        os.replace(temp_path, file_path)
+        print(f"[INFO] - {datetime.now()} : {len(buffer['match_ids'])} matches written at {file_path}")
+
+        if self.on_persisted is not None:
+            self.on_persisted(buffer['match_ids'])
+
+    def flush(self):
+        """
+        Writes every buffered partition, e.g. once the queue is drained or before stopping.
+        """
+        with self._lock:
+            for partition in list(self._buffers):
+                self._write_partition(partition)
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shutil
+
+from build_referential import ARTIFACTS, get_file_hash, get_patch_key
+from datetime import datetime
+from output_writers import get_temp_path, write_file_atomically
+
+
+INDEX_FILE = "index.json"
+# Versions kept per patch range, the older ones being removed from the index and the store
+KEPT_VERSIONS = 3
+# Endpoint of an S3-compatible store (MinIO, localstack, ...), AWS S3 when empty
+S3_ENDPOINT_URL = os.getenv("REFERENTIAL_S3_ENDPOINT_URL") or None
+
+
+def get_s3_location(store):
+    """
+    Returns: tuple[str, str] | None, the bucket and key prefix of an s3://bucket/prefix store, None for a local directory
+    """
+    if not store.startswith("s3://"):
+        return None
+    bucket, _, prefix = store[len("s3://"):].partition("/")
+    return bucket, prefix.strip("/")
+
+
+def get_s3_client():
+    import boto3
+
+    return boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+
+
+def read_store_file(store, key):
+    """
+    Returns: bytes | None, the content of a file of the store, None if it does not exist
+    """
+    s3_location = get_s3_location(store)
+    if s3_location is None:
+        path = os.path.join(store, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as store_file:
+            return store_file.read()
+
+    bucket, prefix = s3_location
+    client = get_s3_client()
+    try:
+        return client.get_object(Bucket=bucket, Key=f"{prefix}/{key}".lstrip("/"))["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
+
+
+def upload_store_file(store, key, source_path):
+    """
+    Copies a file into the store, a local copy being renamed over the target once complete.
+    """
+    s3_location = get_s3_location(store)
+    if s3_location is None:
+        path = os.path.join(store, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = get_temp_path(path)
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, path)
+        return
+
+    bucket, prefix = s3_location
+    get_s3_client().upload_file(source_path, bucket, f"{prefix}/{key}".lstrip("/"))
+
+
+def delete_store_version(store, version_id):
+    s3_location = get_s3_location(store)
+    if s3_location is None:
+        shutil.rmtree(os.path.join(store, version_id), ignore_errors=True)
+        return
+
+    bucket, prefix = s3_location
+    client = get_s3_client()
+    for name in ARTIFACTS + ["manifest.json"]:
+        client.delete_object(Bucket=bucket, Key=f"{prefix}/{version_id}/{name}".lstrip("/"))
+
+
+def write_index(store, index):
+    """
+    Replaces the index of the store in one write, so that a back end reads either the previous or the new list of versions.
+    """
+    content = json.dumps(index, indent=2)
+    s3_location = get_s3_location(store)
+    if s3_location is None:
+        write_file_atomically(os.path.join(store, INDEX_FILE), [content])
+        return
+
+    bucket, prefix = s3_location
+    get_s3_client().put_object(Bucket=bucket, Key=f"{prefix}/{INDEX_FILE}".lstrip("/"), Body=content.encode("utf-8"),
+                               ContentType="application/json")
+
+
+def get_version_id(manifest):
+    """
+    Id of a version, its patch range and build time, e.g. "15.1-15.4_20251019T101500".
+    Returns: str
+    """
+    patches = manifest.get('patches')
+    patch_range = f"{patches['first']}-{patches['last']}" if patches else "all"
+    return f"{patch_range}_{datetime.fromisoformat(manifest['created_at']).strftime('%Y%m%dT%H%M%S')}"
+
+
+def publish_referential(output, store, kept_versions=KEPT_VERSIONS):
+    """
+    Publishes a referential build (the output of build_referential.py or referential_state.py) as a new version of the store :
+    its files under {store}/{version id}/, then the version added to {store}/index.json, the back end never seeing a version
+    before its files. The versions of the same patch range beyond kept_versions are removed.
+    Returns: dict, the version entry of the index
+    """
+    with open(os.path.join(output, "manifest.json"), "r") as manifest_file:
+        manifest = json.load(manifest_file)
+    for name, artifact in manifest['artifacts'].items():
+        if get_file_hash(os.path.join(output, name)) != artifact['sha256']:
+            raise ValueError(f"{name} of {output} does not match its manifest, the build is incomplete")
+
+    version_id = get_version_id(manifest)
+    for name in list(manifest['artifacts']) + ["manifest.json"]:
+        upload_store_file(store, f"{version_id}/{name}", os.path.join(output, name))
+
+    index = json.loads(read_store_file(store, INDEX_FILE) or b'{"versions": []}')
+    version = {
+        'id': version_id,
+        'patches': manifest.get('patches'),
+        'created_at': manifest['created_at'],
+        'published_at': datetime.now().isoformat(timespec="seconds"),
+        'artifacts': {name: artifact['sha256'] for name, artifact in manifest['artifacts'].items()}
+    }
+    versions = [entry for entry in index['versions'] if entry['id'] != version_id] + [version]
+    versions.sort(key=lambda entry: entry['created_at'], reverse=True)
+
+    kept, removed, range_counts = [], [], {}
+    for entry in versions:
+        patches = entry['patches']
+        patch_range = (patches['first'], patches['last']) if patches else None
+        range_counts[patch_range] = range_counts.get(patch_range, 0) + 1
+        (kept if range_counts[patch_range] <= kept_versions else removed).append(entry)
+    kept.sort(key=lambda entry: (get_patch_key(entry['patches']['first']) if entry['patches'] else -1, entry['created_at']))
+    write_index(store, {'updated_at': version['published_at'], 'versions': kept})
+
+    for entry in removed:
+        delete_store_version(store, entry['id'])
+        print(f"[INFO] - {datetime.now()} : Version {entry['id']} removed from {store}")
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publishes a referential build as a version of the store read by the back end.")
+    parser.add_argument('--output', default="./results/referential", help="Directory of the build, with its manifest.json.")
+    parser.add_argument('--store', required=True, help="Local directory or s3://bucket/prefix, REFERENTIAL_S3_ENDPOINT_URL for an S3-compatible store.")
+    parser.add_argument('--keep', type=int, default=KEPT_VERSIONS, help="Versions kept per patch range.")
+    args = parser.parse_args()
+
+    published = publish_referential(args.output, args.store, args.keep)
+    print(f"[INFO] - {datetime.now()} : Version {published['id']} published to {args.store}")
@@ -0,0 +1,398 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+
+from build_referential import (ALL_POSITIONS, ALL_TIERS, CDF_KNOTS, CHAMPION_LANE_PERCENT, MIN_GAME_DURATION_S, PATCH_KEY_BASE, PER_MINUTE_DIGITS, PING_COLUMNS,
+                               TIERS, WIN_EFFECT_PAIRS, WIN_EFFECT_STATS, describe_input, get_input_files, get_moments, get_patch_key, get_tier_files, get_tier_order,
+                               parse_patch_range)
+from datetime import datetime
+from format_match_api_response import MATCH_ROW_SCHEMA
+from kll_sketch import interpolate
+from output_writers import write_file_atomically
+from referential_state import (GAME_COLUMNS, GLOBAL_CHAMPION, MULTI_KILL_STATS, PLAYER_COLUMNS, REFERENTIAL_STAT_LIST, get_ff_artifact_rows,
+                               order_champion_rows, order_tier_rows, round_half_up, write_artifacts)
+
+
+# Memory of the DuckDB process, beyond which the joins, aggregations and tables spill to TEMP_DIRECTORY
+MEMORY_LIMIT_MB = int(os.getenv("REFERENTIAL_MEMORY_LIMIT_MB", 2048))
+TEMP_DIRECTORY = "./cache/duckdb_tmp"
+# The quartiles of a group are read from the sorted list of its values, held in memory : bytes counted per value, and share of the
+# memory limit they may take
+QUANTILE_BYTES_PER_VALUE = 64
+QUANTILE_MEMORY_SHARE = 0.5
+
+QUARTILES = [0.25, 0.5, 0.75]
+PER_MINUTE_STATS = {stat_name for stat_name, _, per_minute, _, _ in REFERENTIAL_STAT_LIST if per_minute}
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def read_csv_file(path):
+    """
+    Reads the columns of the participant rows from a crawler CSV file, pyarrow parsing only them where the CSV reader of DuckDB
+    would convert the whole rows.
+    Returns: pyarrow.Table
+    """
+    import pyarrow.csv as pv
+    from parquet_writer import ARROW_TYPES
+
+    columns = GAME_COLUMNS + [f"player_{i}_{column}" for i in range(1, 11) for column in PLAYER_COLUMNS if column != 'participant_id']
+    return pv.read_csv(path,
+                       read_options=pv.ReadOptions(column_names=list(MATCH_ROW_SCHEMA)),
+                       parse_options=pv.ParseOptions(delimiter=";", invalid_row_handler=lambda row: 'skip'),
+                       convert_options=pv.ConvertOptions(include_columns=columns,
+                                                         column_types={column: ARROW_TYPES[MATCH_ROW_SCHEMA[column]] for column in columns},
+                                                         null_values=['', 'None'], strings_can_be_null=True,
+                                                         true_values=['True', 'true'], false_values=['False', 'false']))
+
+
+def get_source_sql(files, input_format, is_ladder, relation=None, tier=None):
+    """
+    Participant rows of a source, one per player of each game with its slot (the participant id in the participants layout),
+    and the rank of the tier of the files in TIERS : -1 for the ladder files of no tier, NULL for the OTP files.
+    relation: name of the registered read_csv_file table, for the csv format
+    Returns: str
+    """
+    tier_rank = (get_tier_order(tier) if tier else -1) if is_ladder else 'NULL::INTEGER'
+    file_list = "[" + ", ".join("'" + path.replace("'", "''") + "'" for path in files) + "]"
+    player_columns = [column for column in PLAYER_COLUMNS if column != 'participant_id']
+    if input_format == 'participants':
+        return f"""
+            SELECT game_id, game_duration, game_patch_version, player_participant_id AS slot, {'true' if is_ladder else 'false'} AS is_ladder,
+                   {tier_rank} AS tier_rank, {', '.join(f'player_{column}' for column in player_columns)}
+            FROM read_parquet({file_list}, union_by_name = true)
+        """
+    games = relation if input_format == 'csv' else f"read_parquet({file_list}, union_by_name = true)"
+    players = ", ".join(
+        "struct_pack(slot := " + str(i) + ", " + ", ".join(f"{column} := player_{i}_{column}" for column in player_columns) + ")"
+        for i in range(1, 11))
+    return f"""
+        SELECT game_id, game_duration, game_patch_version, player.slot AS slot, {'true' if is_ladder else 'false'} AS is_ladder,
+               {tier_rank} AS tier_rank, {', '.join(f'player.{column} AS player_{column}' for column in player_columns)}
+        FROM (SELECT game_id, game_duration, game_patch_version, unnest([{players}]) AS player FROM {games})
+    """
+
+
+def get_quartiles_sql(values):
+    """
+    Count of a sorted list of values, and its values at the floor and ceil ranks of each quartile, see get_quartiles.
+    Returns: str
+    """
+    bounds = [f"{values}[{rounding}({quartile} * (len({values}) - 1))::BIGINT + 1]" for quartile in QUARTILES for rounding in ("floor", "ceil")]
+    return f"len({values}), {', '.join(bounds)}"
+
+
+def get_quartiles(count, *bounds):
+    """
+    Quartiles interpolated as the Spark percentile function from the output of get_quartiles_sql.
+    Returns: list[float | None]
+    """
+    if not count:
+        return [None for _ in QUARTILES]
+    return [interpolate(bounds[2 * i], bounds[2 * i + 1], (count - 1) * quartile) for i, quartile in enumerate(QUARTILES)]
+
+
+def get_knots_sql(values):
+    """
+    CDF knots of a sorted list of values, each one interpolated between its floor and ceil ranks as get_quartiles.
+    Returns: str
+    """
+    position = f"((len({values}) - 1) * (knot / {CDF_KNOTS - 1}))"
+    return (f"CASE WHEN len({values}) > 0 THEN list_transform(range({CDF_KNOTS}), knot -> CASE WHEN floor({position}) = ceil({position}) "
+            f"THEN {values}[floor({position})::BIGINT + 1] "
+            f"ELSE (ceil({position}) - {position}) * {values}[floor({position})::BIGINT + 1] + ({position} - floor({position})) * {values}[ceil({position})::BIGINT + 1] END) END")
+
+
+def get_stat_sql():
+    """
+    Expressions of the stats of average_percentiles.csv, named by stat, computed as add_stat_columns of build_referential.
+    Returns: list[str]
+    """
+    derived = {
+        'player_pings_total': " + ".join(PING_COLUMNS[1:]),
+        'kda': "CASE WHEN player_death = 0 OR player_death IS NULL THEN player_kills + player_assist "
+               "ELSE (player_kills + player_assist) / player_death END"
+    }
+    expressions = []
+    for stat_name, column, per_minute, _, _ in REFERENTIAL_STAT_LIST:
+        value = f"({derived.get(column, column)})"
+        expressions.append(f"{f'round({value} / (game_duration / 60), {PER_MINUTE_DIGITS})' if per_minute else f'{value}::DOUBLE'} AS {quote(stat_name)}")
+    return expressions
+
+
+def get_average_sql(stat_name):
+    """
+    Average of a stat as get_average of build_referential, the per minute values summed as integers of their last decimal, so that
+    it does not depend on the order of the rows.
+    Returns: str
+    """
+    if stat_name not in PER_MINUTE_STATS:
+        return f"favg({quote(stat_name)})"
+    scale = 10 ** PER_MINUTE_DIGITS
+    return f"sum(round({quote(stat_name)} * {scale})::BIGINT) / (count({quote(stat_name)}) * {scale})"
+
+
+class DuckDBReferential:
+    """
+    Referential computed by DuckDB out of core, without Spark : the match files are read and exploded in one pass into a participants
+    table of the stat values, stored in a database file spilled to disk past memory_limit_mb. The quartiles and CDF knots are exact,
+    computed as the Spark percentile function, by batches of stats and groups sized to hold in memory.
+    It exposes the get_*_rows methods of ReferentialState, so that the CSV files are written by write_artifacts.
+    """
+    def __init__(self, memory_limit_mb=MEMORY_LIMIT_MB, threads=None, temp_directory=TEMP_DIRECTORY):
+        import duckdb
+
+        os.makedirs(temp_directory, exist_ok=True)
+        self.memory_limit_mb = memory_limit_mb
+        self.work_directory = tempfile.mkdtemp(prefix="referential_", dir=temp_directory)
+        self.connection = duckdb.connect(os.path.join(self.work_directory, "referential.duckdb"))
+        self.connection.execute(f"SET memory_limit = '{memory_limit_mb}MB'")
+        self.connection.execute(f"SET temp_directory = '{self.work_directory}'")
+        self.connection.execute("SET preserve_insertion_order = false")
+        if threads:
+            self.connection.execute(f"SET threads = {int(threads)}")
+        self.version = duckdb.__version__
+        self.participant_rows = 0
+
+    def load(self, ladder_path, otps_path, input_format='csv', patch_range=None):
+        """
+        Creates the participants table : each participant once, in a ladder game if the game is in both sources, filtered as
+        match_df_exploded (patch_range included), with the highest tier of its ladder files. Then the main lanes of each champion and the ladder games with their duration and surrender.
+        Returns: int, the participant rows
+        """
+        statements = []
+        for path, is_ladder in [(ladder_path, True), (otps_path, False)]:
+            tier_files = (get_tier_files(path) if is_ladder else {None: get_input_files(path)}) if path else {}
+            for tier, files in tier_files.items():
+                if input_format != 'csv' and files:
+                    statements.append((get_source_sql(files, input_format, is_ladder, tier=tier), None))
+                elif input_format == 'csv':
+                    statements.extend((get_source_sql([file_path], input_format, is_ladder, 'match_file', tier), file_path) for file_path in files)
+
+        # Participant rows of every file, then each participant once
+        for i, (source_sql, file_path) in enumerate(statements):
+            if file_path:
+                self.connection.register('match_file', read_csv_file(file_path))
+            self.connection.execute(f"{'CREATE TABLE raw_participants AS' if i == 0 else 'INSERT INTO raw_participants'} {source_sql}")
+            if file_path:
+                self.connection.unregister('match_file')
+        player_columns = [f"player_{column}" for column in PLAYER_COLUMNS if column != 'participant_id']
+        tiers = "[" + ", ".join(f"'{tier}'" for tier in TIERS) + "]"
+        patch_filter = ""
+        if patch_range:
+            patch_key = f"TRY_CAST(split_part(game_patch_version, '.', 1) AS INTEGER) * {PATCH_KEY_BASE} + TRY_CAST(split_part(game_patch_version, '.', 2) AS INTEGER)"
+            patch_filter = f"AND {patch_key} BETWEEN {get_patch_key(patch_range['first'])} AND {get_patch_key(patch_range['last'])}"
+        self.connection.execute(f"""
+            CREATE TABLE participants AS
+            SELECT * EXCLUDE (tier_rank), CASE WHEN tier_rank >= 0 THEN {tiers}[tier_rank + 1] END AS tier, {', '.join(get_stat_sql())}
+            FROM (
+                SELECT game_id, slot, bool_or(is_ladder) AS is_ladder, max(tier_rank) AS tier_rank, any_value(game_duration) AS game_duration,
+                       {', '.join(f'any_value({column}) AS {column}' for column in player_columns)}
+                FROM raw_participants
+                WHERE game_id IS NOT NULL AND game_patch_version IS NOT NULL AND player_champ_name IS NOT NULL
+                      AND player_individual_position != 'Invalid' AND game_duration >= {MIN_GAME_DURATION_S} {patch_filter}
+                GROUP BY game_id, slot
+            )
+        """)
+        self.connection.execute("DROP TABLE raw_participants")
+        self.connection.execute(f"""
+            CREATE TABLE main_lanes AS
+            SELECT player_champ_name, player_individual_position
+            FROM (SELECT player_champ_name, player_individual_position, count(*) AS games,
+                         sum(count(*)) OVER (PARTITION BY player_champ_name) AS champion_games
+                  FROM participants GROUP BY player_champ_name, player_individual_position)
+            WHERE games / champion_games * 100 > {CHAMPION_LANE_PERCENT}
+        """)
+        self.connection.execute("""
+            CREATE TABLE ladder_games AS
+            SELECT game_id, any_value(game_duration) AS game_duration, bool_or(coalesce(player_ended_surrender, false)) AS ff
+            FROM participants WHERE is_ladder GROUP BY game_id
+        """)
+        self.participant_rows = self.connection.execute("SELECT count(*) FROM participants").fetchone()[0]
+        return self.participant_rows
+
+    def _get_batches(self, stats, rows):
+        """
+        Splits the stats and the groups so that the values of a batch hold in QUANTILE_MEMORY_SHARE of the memory limit.
+        Returns: tuple[list[list], int], the stat batches and the number of group buckets
+        """
+        budget_values = self.memory_limit_mb * 2 ** 20 * QUANTILE_MEMORY_SHARE / QUANTILE_BYTES_PER_VALUE
+        stats_per_batch = max(1, int(budget_values // max(rows, 1)))
+        buckets = max(1, math.ceil(rows / budget_values))
+        return [stats[i:i + stats_per_batch] for i in range(0, len(stats), stats_per_batch)], buckets
+
+    def _compute_stats(self, relation, group_columns, stats):
+        """
+        Average, quartiles, count and CDF knots of each stat per group of a relation.
+        group_columns: list[str], the expressions of the group, e.g. champion, position and win
+        stats: list[tuple[str, int]] of (stat name, stat index)
+        Returns: list[tuple], the group, stat index, stat, AVG, Q1, Q2, Q3, count and knots
+        """
+        rows = self.connection.execute(f"SELECT count(*) FROM {relation}").fetchone()[0]
+        stat_batches, buckets = self._get_batches(stats, rows)
+        group = ", ".join(group_columns)
+        group_names = ", ".join(f"group_{i}" for i in range(len(group_columns)))
+        results = []
+        for batch in stat_batches:
+            aggregations = ", ".join(f"{get_average_sql(stat_name)} AS average_{i}, list_sort(list({quote(stat_name)}) FILTER (WHERE {quote(stat_name)} IS NOT NULL)) AS values_{i}"
+                                     for i, (stat_name, _) in enumerate(batch))
+            outputs = ", ".join(f"average_{i}, {get_quartiles_sql(f'values_{i}')}, {get_knots_sql(f'values_{i}')}" for i in range(len(batch)))
+            for bucket in range(buckets):
+                where = f"WHERE hash({group}) % {buckets} = {bucket}" if buckets > 1 else ""
+                query = f"""
+                    SELECT {group_names}, {outputs}
+                    FROM (SELECT {', '.join(f'{column} AS group_{i}' for i, column in enumerate(group_columns))}, {aggregations}
+                          FROM {relation} {where} GROUP BY ALL)
+                """
+                for row in self.connection.execute(query).fetchall():
+                    values = row[len(group_columns):]
+                    for i, (stat_name, stat_index) in enumerate(batch):
+                        average, *bounds, knots = values[i * 9:(i + 1) * 9]
+                        results.append((*row[:len(group_columns)], stat_index, stat_name, round_half_up(average, 4),
+                                        *[round_half_up(value, 4) for value in get_quartiles(*bounds)], bounds[0], knots))
+        return results
+
+    def _get_stat_lists(self):
+        """
+        Returns: tuple[list[tuple[str, int]], list[tuple[str, int]]], the stats of the main lanes only and of every lane
+        """
+        return ([(stat_name, stat_index) for stat_name, _, _, main_lanes_only, stat_index in REFERENTIAL_STAT_LIST if main_lanes_only],
+                [(stat_name, stat_index) for stat_name, _, _, main_lanes_only, stat_index in REFERENTIAL_STAT_LIST if not main_lanes_only])
+
+    def get_average_percentiles_rows(self):
+        """
+        Returns: list[tuple], the rows of average_percentiles.csv, with the CDF knots of each row last
+        """
+        main_lanes_stats, all_lanes_stats = self._get_stat_lists()
+        champion_group = ["player_champ_name", "player_individual_position", "player_win"]
+        global_group = [f"'{GLOBAL_CHAMPION}'", "player_individual_position", "player_win"]
+        rows = self._compute_stats("participants JOIN main_lanes USING (player_champ_name, player_individual_position)", champion_group, main_lanes_stats)\
+            + self._compute_stats("participants", champion_group, all_lanes_stats)\
+            + self._compute_stats("(SELECT * FROM participants WHERE is_ladder)", global_group, main_lanes_stats + all_lanes_stats)
+        return [row[:3] + row[4:9] + row[-1:] for row in order_champion_rows(rows, 3)]
+
+    def get_tier_percentiles_rows(self):
+        """
+        Returns: list[tuple], the rows of tier_percentiles.csv, with the CDF knots of each row last
+        """
+        main_lanes_stats, all_lanes_stats = self._get_stat_lists()
+        tier_group = ["tier", "player_champ_name", "player_individual_position", "player_win"]
+        tier_global_group = ["tier", f"'{GLOBAL_CHAMPION}'", "player_individual_position", "player_win"]
+        tier_participants = "(SELECT * FROM participants WHERE tier IS NOT NULL)"
+        rows = self._compute_stats(f"{tier_participants} JOIN main_lanes USING (player_champ_name, player_individual_position)", tier_group, main_lanes_stats)\
+            + self._compute_stats(tier_participants, tier_group, all_lanes_stats)\
+            + self._compute_stats(tier_participants, tier_global_group, main_lanes_stats + all_lanes_stats)\
+            + self._compute_stats("(SELECT * FROM participants WHERE is_ladder)", [f"'{ALL_TIERS}'", f"'{GLOBAL_CHAMPION}'", f"'{ALL_POSITIONS}'", "player_win"],
+                                  main_lanes_stats + all_lanes_stats)
+        return [row[:4] + row[5:] for row in order_tier_rows(rows)]
+
+    def get_win_moments(self):
+        """
+        Returns: dict[tuple[str, str, bool], list], the moments of the stats of WIN_EFFECT_STATS of each champion on its main lanes
+        and of each lane over the ladder games (GLOBAL), the participants missing a stat being skipped
+        """
+        stats = [quote(stat_name) for stat_name, _ in WIN_EFFECT_STATS]
+        aggregations = ", ".join(["count(*)", *[f"sum({stat})" for stat in stats], *[f"sum({stats[i]} * {stats[j]})" for i, j in WIN_EFFECT_PAIRS]])
+        complete = " AND ".join(f"{stat} IS NOT NULL" for stat in stats)
+        rows = self.connection.execute(f"""
+            SELECT player_champ_name, player_individual_position, player_win, {aggregations}
+            FROM participants JOIN main_lanes USING (player_champ_name, player_individual_position) WHERE {complete} GROUP BY ALL
+            UNION ALL
+            SELECT '{GLOBAL_CHAMPION}', player_individual_position, player_win, {aggregations} FROM participants WHERE is_ladder AND {complete} GROUP BY ALL
+        """).fetchall()
+        return {tuple(row[:3]): get_moments(row[3], row[4:4 + len(stats)], row[4 + len(stats):]) for row in rows}
+
+    def get_multi_kills_rows(self):
+        averages = ", ".join(f"avg({column})" for _, column in MULTI_KILL_STATS)
+        rows = self.connection.execute(f"""
+            SELECT player_champ_name, player_individual_position, player_win, {averages}
+            FROM participants JOIN main_lanes USING (player_champ_name, player_individual_position) GROUP BY ALL
+            UNION ALL
+            SELECT '{GLOBAL_CHAMPION}', player_individual_position, player_win, {averages} FROM participants WHERE is_ladder GROUP BY ALL
+        """).fetchall()
+        return order_champion_rows(rows)
+
+    def get_duration_row(self):
+        average, *bounds = self.connection.execute(f"""
+            SELECT average, {get_quartiles_sql('durations')}
+            FROM (SELECT avg(game_duration) AS average, list_sort(list(game_duration::DOUBLE)) AS durations FROM ladder_games)
+        """).fetchone()
+        if not bounds[0]:
+            return None
+        return tuple(round_half_up(value / 60, 2) for value in [average, *get_quartiles(*bounds)])
+
+    def get_ff_rows(self):
+        """
+        Returns: tuple[list[tuple[int, float]], tuple[float, float, float]], the rows of ff_per_mins.csv and ff_stats.csv
+        """
+        ff_minutes = dict(self.connection.execute("SELECT floor(game_duration / 60)::BIGINT, count(*) FROM ladder_games WHERE ff GROUP BY ALL").fetchall())
+        return get_ff_artifact_rows(ff_minutes, self.connection.execute("SELECT count(*) FROM ladder_games").fetchone()[0])
+
+    def close(self):
+        self.connection.close()
+        shutil.rmtree(self.work_directory, ignore_errors=True)
+
+
+def build_referential_duckdb(ladder_path, otps_path, output, input_format='csv', memory_limit_mb=MEMORY_LIMIT_MB, threads=None,
+                             temp_directory=TEMP_DIRECTORY, patch_range=None):
+    """
+    Builds the artifacts of build_referential with DuckDB, then writes manifest.json.
+    Returns: dict, the manifest
+    """
+    os.makedirs(output, exist_ok=True)
+    durations = {}
+    referential = DuckDBReferential(memory_limit_mb, threads, temp_directory)
+    try:
+        start = time.perf_counter()
+        participant_rows = referential.load(ladder_path, otps_path, input_format, patch_range)
+        durations['participants'] = time.perf_counter() - start
+        print(f"[INFO] - {datetime.now()} : {participant_rows} participant rows loaded in {durations['participants']:.1f}s")
+
+        start = time.perf_counter()
+        artifacts = write_artifacts(referential, output)
+        durations['artifacts'] = time.perf_counter() - start
+        print(f"[INFO] - {datetime.now()} : Artifacts written in {durations['artifacts']:.1f}s")
+    finally:
+        referential.close()
+
+    inputs = {'ladder': describe_input(ladder_path)}
+    if otps_path:
+        inputs['otps'] = describe_input(otps_path)
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec="seconds"),
+        'engine': 'duckdb',
+        'duckdb_version': referential.version,
+        'memory_limit_mb': memory_limit_mb,
+        'input_format': input_format,
+        'patches': patch_range,
+        'inputs': inputs,
+        'participant_rows': participant_rows,
+        'artifacts': artifacts,
+        'durations_s': {name: round(seconds, 3) for name, seconds in durations.items()}
+    }
+    write_file_atomically(os.path.join(output, "manifest.json"), [json.dumps(manifest, indent=2)])
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the referential CSV files of the back end with DuckDB, without Spark.")
+    parser.add_argument('--ladder', default="./data/matchs/")
+    parser.add_argument('--otps', default="./data/otp_matchs/", help="Empty to skip.")
+    parser.add_argument('--input-format', choices=['csv', 'parquet', 'participants'], default='csv')
+    parser.add_argument('--output', default="./results/referential")
+    parser.add_argument('--memory-limit-mb', type=int, default=MEMORY_LIMIT_MB)
+    parser.add_argument('--threads', type=int)
+    parser.add_argument('--temp-directory', default=TEMP_DIRECTORY)
+    parser.add_argument('--patches', help="Patch range of the games, e.g. 15.1-15.4 or 15.4, every patch when empty.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_referential_duckdb(args.ladder, args.otps or None, args.output, args.input_format, args.memory_limit_mb, args.threads, args.temp_directory,
+                             parse_patch_range(args.patches) if args.patches else None)
+    print(f"[INFO] - {datetime.now()} : Referential built in {args.output} in {time.perf_counter() - start:.1f}s")
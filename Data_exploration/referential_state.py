@@ -0,0 +1,814 @@
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+
+from build_referential import (ALL_POSITIONS, ALL_TIERS, ARTIFACTS, BUILDING_COLUMNS, CDF_ARTIFACTS, CDF_QUANTILES, CHAMPION_LANE_PERCENT,
+                               DAMAGE_COLUMNS, EARLY_SURRENDER_S, FF_MINUTE_BINS_LIMIT, MIN_GAME_DURATION_S, MULTI_KILL_COLUMNS, PING_COLUMNS,
+                               REFERENTIAL_STATS, TIERS, WARD_COLUMNS, WIN_EFFECT_STATS, add_moments, get_csv_value, get_file_hash, get_file_tier, get_input_files, get_patch_key,
+                               QUARTILE_KNOTS, get_stat_name, get_tier_order, new_moments, parse_patch_range, write_cdf_artifact,
+                               write_win_effect_artifacts)
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from format_match_api_response import MATCH_ROW_SCHEMA
+from kll_sketch import KLL_K, KllSketch
+from output_writers import write_file_atomically
+
+
+GLOBAL_CHAMPION = 'GLOBAL'
+GAME_DURATION_STAT = 'gameDuration'
+# Version of the tables, a state of an older version being dropped and built again from the match files
+STATE_VERSION = 5
+# Games folded in between two commits of the state, the sketches of the cells touched meanwhile being kept in memory
+COMMIT_EVERY_GAMES = int(os.getenv("REFERENTIAL_COMMIT_EVERY_GAMES", 20000))
+
+
+def round_half_up(value, digits):
+    """
+    Rounds as the Spark round function, half away from zero on the shortest representation of the value.
+    Returns: float | None
+    """
+    if value is None:
+        return None
+    scaled = value * 10 ** digits
+    if abs(scaled - math.floor(scaled) - 0.5) > 1e-6:
+        # Far from a tie, the nearest value is the same whatever the rounding mode
+        return round(value, digits)
+    return float(Decimal(repr(value)).quantize(Decimal(1).scaleb(-digits), rounding=ROUND_HALF_UP))
+
+
+def get_referential_stats():
+    """
+    Returns: list[tuple[str, str, bool, bool, int]], the (stat name, column, per minute, main lanes only, position in the file)
+    of each stat of average_percentiles.csv
+    """
+    return [(get_stat_name(column, per_minute), column, per_minute, main_lanes_only, i) for i, (column, per_minute, main_lanes_only) in
+            enumerate((column, per_minute, main_lanes_only) for columns, per_minute, main_lanes_only in REFERENTIAL_STATS for column in columns)]
+
+
+REFERENTIAL_STAT_LIST = get_referential_stats()
+MULTI_KILL_STATS = [(get_stat_name(column, False), column) for column in MULTI_KILL_COLUMNS]
+
+
+# Columns of the participant rows read from the match files, the others being skipped
+GAME_COLUMNS = ['game_id', 'game_duration', 'game_patch_version']
+PLAYER_COLUMNS = ['participant_id', 'champ_name', 'individual_position', 'win', 'ended_surrender', 'kills', 'death', 'assist',
+                  *[column[len("player_"):] for column in PING_COLUMNS[1:] + DAMAGE_COLUMNS + BUILDING_COLUMNS + WARD_COLUMNS + MULTI_KILL_COLUMNS]]
+
+
+def read_participants(path, input_format):
+    """
+    Reads the participant rows of a match file, a crawler CSV or a wide or participants Parquet file, as columns.
+    Returns: dict[str, numpy.ndarray], the numeric columns as floats with NaN for a missing value
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+    from parquet_writer import ARROW_TYPES
+
+    player_columns = [f"player_{column}" for column in PLAYER_COLUMNS]
+    if input_format == 'participants':
+        table = pq.read_table(path, columns=GAME_COLUMNS + player_columns)
+    else:
+        wide_columns = GAME_COLUMNS + [f"player_{i}_{column}" for i in range(1, 11) for column in PLAYER_COLUMNS]
+        if input_format == 'csv':
+            table = pv.read_csv(path,
+                                read_options=pv.ReadOptions(column_names=list(MATCH_ROW_SCHEMA)),
+                                parse_options=pv.ParseOptions(delimiter=";", invalid_row_handler=lambda row: 'skip'),
+                                convert_options=pv.ConvertOptions(include_columns=wide_columns,
+                                                                  column_types={column: ARROW_TYPES[MATCH_ROW_SCHEMA[column]] for column in wide_columns},
+                                                                  null_values=['', 'None'], strings_can_be_null=True,
+                                                                  true_values=['True', 'true'], false_values=['False', 'false']))
+        else:
+            table = pq.read_table(path, columns=wide_columns)
+        table = pa.concat_tables([table.select(GAME_COLUMNS + [f"player_{i}_{column}" for column in PLAYER_COLUMNS])
+                                  .rename_columns(GAME_COLUMNS + player_columns) for i in range(1, 11)])
+
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if name == 'game_id':
+            column = column.fill_null(0)
+        elif pa.types.is_integer(column.type):
+            column = pc.cast(column, pa.float64())
+        elif pa.types.is_boolean(column.type):
+            column = column.fill_null(False)
+        columns[name] = column.to_numpy(zero_copy_only=False)
+    return columns
+
+
+def round_half_up_array(values, digits):
+    """
+    round_half_up of each value, the rounding of numpy being only replaced near a tie.
+    Returns: numpy.ndarray
+    """
+    import numpy as np
+
+    scaled = values * 10 ** digits
+    rounded = np.round(values, digits)
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) <= 1e-6):
+        rounded[i] = round_half_up(float(values[i]), digits)
+    return rounded
+
+
+def get_stat_columns(columns):
+    """
+    Values of the stats of average_percentiles.csv for each participant row, computed as add_stat_columns of build_referential.
+    Returns: dict[str, numpy.ndarray], NaN for a missing value
+    """
+    import numpy as np
+
+    derived = {'player_pings_total': sum(columns[column] for column in PING_COLUMNS[1:])}
+    kills_assists = columns['player_kills'] + columns['player_assist']
+    deaths = columns['player_death']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        derived['kda'] = np.where((deaths == 0) | np.isnan(deaths), kills_assists, kills_assists / deaths)
+
+    minutes = columns['game_duration'] / 60
+    stat_columns = {}
+    for stat_name, column, per_minute, _, _ in REFERENTIAL_STAT_LIST:
+        values = derived[column] if column in derived else columns[column]
+        stat_columns[stat_name] = round_half_up_array(values / minutes, 3) if per_minute else values
+    return stat_columns
+
+
+def get_kept_rows(columns, patch_range=None):
+    """
+    Filters of match_df_exploded : patch known (and in patch_range if given), valid lane and no remake, and each participant of a game once.
+    Returns: numpy.ndarray of the kept row indexes
+    """
+    import numpy as np
+
+    patch_keys = (get_patch_key(patch_range['first']), get_patch_key(patch_range['last'])) if patch_range else None
+    kept = np.array([patch is not None and champion is not None and position is not None and position != "Invalid"
+                     and (patch_keys is None or patch_keys[0] <= (get_patch_key(patch) or -1) <= patch_keys[1])
+                     for patch, champion, position
+                     in zip(columns['game_patch_version'], columns['player_champ_name'], columns['player_individual_position'])], dtype=bool)
+    kept &= (columns['game_id'] != 0) & (columns['game_duration'] >= MIN_GAME_DURATION_S)
+    seen = set()
+    for i in np.flatnonzero(kept):
+        participant = (columns['game_id'][i], columns['player_participant_id'][i])
+        if participant in seen:
+            kept[i] = False
+        seen.add(participant)
+    return np.flatnonzero(kept)
+
+
+class ReferentialState:
+    """
+    Mergeable state of the referential, stored in SQLite : per (tier, champion, position, win, stat) cell the count, sum and KLL sketch
+    of the values, with the quartiles and float32 CDF knots of the sketch kept next to it, the moments of the stats of each
+    (champion, position, win) for the win effects, the games of each cell for the lane filter, the game durations
+    and surrenders of the ladder games, and the games and files already folded in.
+    A new match file only updates the cells of its games, and the CSV files are written from the stored counts, sums and quartiles.
+    The GLOBAL cells, durations and surrenders count the ladder games only, as in build_referential. The cells over every tier have
+    an empty tier; a game of several tiers is counted in the highest one, its tier cells moving when a higher tier file comes later.
+    A state only holds the games of the patch range it was created with, every patch by default.
+    """
+    def __init__(self, db_path, k=KLL_K, patch_range=None):
+        self.db_path = db_path
+        self.k = k
+        self.patch_range = patch_range
+        self.connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != STATE_VERSION:
+            tables = [name for name, in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            if tables:
+                print(f"[INFO] - {datetime.now()} : State {db_path} of version {version} dropped, built again from the match files")
+            for table in tables:
+                self.connection.execute(f"DROP TABLE {table}")
+            self.connection.execute(f"PRAGMA user_version = {STATE_VERSION}")
+        # sketch is NULL for the stats only averaged (multi kills)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS cell_stats (
+                tier TEXT NOT NULL,
+                champion TEXT NOT NULL,
+                position TEXT NOT NULL,
+                win INTEGER NOT NULL,
+                stat TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                sum REAL NOT NULL,
+                q1 REAL,
+                q2 REAL,
+                q3 REAL,
+                knots BLOB,
+                sketch BLOB,
+                PRIMARY KEY (tier, champion, position, win, stat)
+            )
+        """)
+        # sums and products : float64 arrays of the sums and cross products of the stats of WIN_EFFECT_STATS
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS cell_moments (
+                champion TEXT NOT NULL,
+                position TEXT NOT NULL,
+                win INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                sums BLOB NOT NULL,
+                products BLOB NOT NULL,
+                PRIMARY KEY (champion, position, win)
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS cell_games (
+                champion TEXT NOT NULL,
+                position TEXT NOT NULL,
+                win INTEGER NOT NULL,
+                games INTEGER NOT NULL,
+                PRIMARY KEY (champion, position, win)
+            )
+        """)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS ff_minutes (minute_bin INTEGER PRIMARY KEY, games INTEGER NOT NULL)")
+        # tier_rank : get_tier_order of the highest tier holding the game, -1 for no tier (OTP matches, retried matches)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS ingested_games (game_id INTEGER PRIMARY KEY, is_ladder INTEGER NOT NULL, tier_rank INTEGER NOT NULL)")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS ingested_files (
+                path TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                games INTEGER NOT NULL,
+                ingested_at TEXT NOT NULL
+            )
+        """)
+
+        self.connection.execute("CREATE TABLE IF NOT EXISTS state_settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = self.connection.execute("SELECT value FROM state_settings WHERE name = 'patches'").fetchone()
+        if row is None:
+            # A state holding files before its settings holds every patch
+            stored_range = None if self.connection.execute("SELECT 1 FROM ingested_files LIMIT 1").fetchone() else patch_range
+            self.connection.execute("INSERT INTO state_settings (name, value) VALUES ('patches', ?)", (json.dumps(stored_range),))
+        else:
+            stored_range = json.loads(row[0])
+        if stored_range != patch_range:
+            raise ValueError(f"State {db_path} holds the patches {stored_range}, not {patch_range} : use a state per patch range")
+
+        self._games = {game_id: (is_ladder, tier_rank) for game_id, is_ladder, tier_rank in
+                       self.connection.execute("SELECT game_id, is_ladder, tier_rank FROM ingested_games")}
+        self._groups = {}
+        self._moments = {}
+        self._cell_games = {}
+        self._ff_minutes = {}
+        self._new_games = {}
+        self._new_files = []
+
+    def get_new_files(self, source, path):
+        """
+        Lists the files of an input not folded in yet, or changed since (a CSV still appended to), the games already counted being skipped.
+        Returns: list[str]
+        """
+        known = {file_path: (size, mtime_ns) for file_path, size, mtime_ns in
+                 self.connection.execute("SELECT path, bytes, mtime_ns FROM ingested_files WHERE source = ?", (source,))}
+        new_files = []
+        for file_path in get_input_files(path):
+            file_stat = os.stat(file_path)
+            if known.get(os.path.abspath(file_path)) != (file_stat.st_size, file_stat.st_mtime_ns):
+                new_files.append(file_path)
+        return new_files
+
+    def _get_group(self, key):
+        """
+        Cells of a (tier, champion, position, win) group, loaded on first use : stat -> [count, sum, sketch, values not in the sketch yet, stored count].
+        Returns: dict[str, list]
+        """
+        group = self._groups.get(key)
+        if group is None:
+            group = {stat: [count, total, KllSketch.from_bytes(sketch) if sketch is not None else None, [] if sketch is not None else None, count]
+                     for stat, count, total, sketch in self.connection.execute(
+                         "SELECT stat, count, sum, sketch FROM cell_stats WHERE tier = ? AND champion = ? AND position = ? AND win = ?",
+                         (key[0], key[1], key[2], int(key[3])))}
+            self._groups[key] = group
+        return group
+
+    def _add_moments(self, values, groups):
+        """
+        Adds the stat values of the rows of each (tier, champion, position, win) group to the moments of its (champion, position, win),
+        loaded on first use.
+        values: numpy.ndarray, the stats of WIN_EFFECT_STATS of every row of the file
+        """
+        import numpy as np
+
+        for (_, champion, position, win), indexes in groups.items():
+            key = (champion, position, win)
+            if key not in self._moments:
+                row = self.connection.execute("SELECT count, sums, products FROM cell_moments WHERE champion = ? AND position = ? AND win = ?",
+                                              (champion, position, int(win))).fetchone()
+                self._moments[key] = new_moments() if row is None else \
+                    [row[0], np.frombuffer(row[1]).copy(), np.frombuffer(row[2]).reshape(len(WIN_EFFECT_STATS), -1).copy()]
+            add_moments(self._moments[key], values[indexes])
+
+    def _add_columns(self, columns, value_columns, rows, sketched, tier='', champion=None, position=None):
+        """
+        Adds the values of the rows to the cells of their (tier, champion, position, win) group, champion and position being the ones
+        of each row when None.
+        Returns: dict[tuple[str, str, str, bool], numpy.ndarray], the rows of each group
+        """
+        import numpy as np
+
+        champions, positions, wins = columns['player_champ_name'], columns['player_individual_position'], columns['player_win']
+        groups = {}
+        for i in rows.tolist():
+            groups.setdefault((tier, champions[i] if champion is None else champion, positions[i] if position is None else position, bool(wins[i])), []).append(i)
+
+        for key, indexes in groups.items():
+            group = self._get_group(key)
+            indexes = groups[key] = np.array(indexes)
+            for stat, column in value_columns.items():
+                values = column[indexes]
+                values = values[~np.isnan(values)]
+                if len(values) == 0:
+                    continue
+                cell = group.get(stat)
+                if cell is None:
+                    cell = group[stat] = [0, 0.0, KllSketch(self.k), [], 0] if sketched else [0, 0.0, None, None, 0]
+                cell[0] += len(values)
+                cell[1] += float(values.sum())
+                if sketched:
+                    cell[3].extend(values.tolist())
+        return groups
+
+    def _remove_columns(self, columns, value_columns, rows, tier, champion=None):
+        """
+        Takes the values of the rows out of the count and sum of their cells of the tier. The KLL sketches cannot forget a value :
+        the quartiles and CDF knots of these cells keep them until the state is built again.
+        """
+        import numpy as np
+
+        champions, positions, wins = columns['player_champ_name'], columns['player_individual_position'], columns['player_win']
+        groups = {}
+        for i in rows.tolist():
+            groups.setdefault((tier, champions[i] if champion is None else champion, positions[i], bool(wins[i])), []).append(i)
+
+        for key, indexes in groups.items():
+            group = self._get_group(key)
+            for stat, column in value_columns.items():
+                values = column[np.array(indexes)]
+                values = values[~np.isnan(values)]
+                cell = group.get(stat)
+                if cell is None or len(values) == 0:
+                    continue
+                cell[0] -= len(values)
+                cell[1] -= float(values.sum())
+
+    def ingest_file(self, source, path, input_format, is_ladder, tier=None):
+        """
+        Folds the games of a file into the state, each game once : a game first seen in the OTP matches then in the ladder ones
+        only adds its ladder part (GLOBAL cells, tier cells, duration and surrender), and a ladder game seen in a lower tier
+        only moves its tier cells. The state is committed once COMMIT_EVERY_GAMES games are pending, the games already counted
+        being skipped if the file is read again after a crash.
+        tier: tier of the games of a ladder file, see get_file_tier
+        Returns: int, the games added
+        """
+        import numpy as np
+
+        columns = read_participants(path, input_format)
+        rows = get_kept_rows(columns, self.patch_range)
+        game_ids = columns['game_id'][rows].tolist()
+        tier_rank = get_tier_order(tier) if tier else -1
+        # promoted_games : the lower tier rank of the ladder games counted before
+        new_games, ladder_games, promoted_games = set(), set(), {}
+        for game_id in dict.fromkeys(game_ids):
+            known_ladder, known_rank = self._games.get(game_id, (None, -1))
+            if known_ladder is None:
+                new_games.add(game_id)
+            if is_ladder and not known_ladder:
+                ladder_games.add(game_id)
+            elif is_ladder and tier_rank > known_rank:
+                promoted_games[game_id] = known_rank
+            if game_id in new_games or game_id in ladder_games or game_id in promoted_games:
+                self._games[game_id] = self._new_games[game_id] = (int(bool(is_ladder or known_ladder)), tier_rank if is_ladder else -1)
+
+        stat_columns = get_stat_columns(columns)
+        multi_kill_columns = {stat: columns[column] for stat, column in MULTI_KILL_STATS}
+        new_rows = rows[np.array([game_id in new_games for game_id in game_ids], dtype=bool)]
+        ladder_rows = rows[np.array([game_id in ladder_games for game_id in game_ids], dtype=bool)]
+
+        groups = self._add_columns(columns, stat_columns, new_rows, True)
+        self._add_columns(columns, multi_kill_columns, new_rows, False)
+        for key, indexes in groups.items():
+            self._cell_games[key[1:]] = self._cell_games.get(key[1:], 0) + len(indexes)
+        win_effect_values = np.column_stack([stat_columns[stat_name] for stat_name, _ in WIN_EFFECT_STATS])
+        self._add_moments(win_effect_values, groups)
+        self._add_moments(win_effect_values, self._add_columns(columns, stat_columns, ladder_rows, True, champion=GLOBAL_CHAMPION))
+        self._add_columns(columns, multi_kill_columns, ladder_rows, False, champion=GLOBAL_CHAMPION)
+        self._add_columns(columns, stat_columns, ladder_rows, True, ALL_TIERS, GLOBAL_CHAMPION, ALL_POSITIONS)
+        if tier:
+            tier_rows = rows[np.array([game_id in ladder_games or game_id in promoted_games for game_id in game_ids], dtype=bool)]
+            self._add_columns(columns, stat_columns, tier_rows, True, tier)
+            self._add_columns(columns, stat_columns, tier_rows, True, tier, GLOBAL_CHAMPION)
+        for lower_rank in set(promoted_games.values()) - {-1}:
+            lower_rows = rows[np.array([promoted_games.get(game_id) == lower_rank for game_id in game_ids], dtype=bool)]
+            self._remove_columns(columns, stat_columns, lower_rows, TIERS[lower_rank])
+            self._remove_columns(columns, stat_columns, lower_rows, TIERS[lower_rank], GLOBAL_CHAMPION)
+
+        durations, surrenders = {}, {}
+        for i in ladder_rows.tolist():
+            game_id = columns['game_id'][i]
+            durations.setdefault(game_id, columns['game_duration'][i])
+            surrenders[game_id] = surrenders.get(game_id, False) or bool(columns['player_ended_surrender'][i])
+        self._add_columns({'player_champ_name': [''] * len(durations), 'player_individual_position': [''] * len(durations),
+                           'player_win': [False] * len(durations)},
+                          {GAME_DURATION_STAT: np.array(list(durations.values()), dtype=float)}, np.arange(len(durations)), True)
+        for game_id, surrendered in surrenders.items():
+            if surrendered:
+                minute_bin = int(durations[game_id] // 60)
+                self._ff_minutes[minute_bin] = self._ff_minutes.get(minute_bin, 0) + 1
+
+        file_stat = os.stat(path)
+        self._new_files.append((os.path.abspath(path), source, file_stat.st_size, file_stat.st_mtime_ns, get_file_hash(path), len(new_games | ladder_games),
+                                datetime.now().isoformat(timespec="seconds")))
+        if len(self._new_games) >= COMMIT_EVERY_GAMES:
+            self.commit()
+        return len(new_games | ladder_games)
+
+    def commit(self):
+        """
+        Writes the touched cells with their quartiles and CDF knots, the moments, the games and the files folded in since the last commit.
+        """
+        import numpy as np
+
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for (tier, champion, position, win), group in self._groups.items():
+                for stat, (count, total, sketch, values, stored_count) in group.items():
+                    if count == stored_count:
+                        continue
+                    quartiles, knots = [None, None, None], None
+                    if sketch is not None:
+                        sketch.update_many(values)
+                        knots = sketch.get_quantiles(CDF_QUANTILES)
+                        quartiles = [knots[knot] for knot in QUARTILE_KNOTS]
+                        knots = np.array(knots, dtype=np.float32).tobytes()
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO cell_stats (tier, champion, position, win, stat, count, sum, q1, q2, q3, knots, sketch) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (tier, champion, position, int(win), stat, count, total, *quartiles, knots, sketch.to_bytes() if sketch is not None else None))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cell_moments (champion, position, win, count, sums, products) VALUES (?, ?, ?, ?, ?, ?)",
+                [(champion, position, int(win), count, sums.tobytes(), products.tobytes()) for (champion, position, win), (count, sums, products) in self._moments.items()])
+            self.connection.executemany(
+                "INSERT INTO cell_games (champion, position, win, games) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (champion, position, win) DO UPDATE SET games = games + excluded.games",
+                [(champion, position, int(win), games) for (champion, position, win), games in self._cell_games.items()])
+            self.connection.executemany(
+                "INSERT INTO ff_minutes (minute_bin, games) VALUES (?, ?) ON CONFLICT (minute_bin) DO UPDATE SET games = games + excluded.games",
+                list(self._ff_minutes.items()))
+            self.connection.executemany("INSERT OR REPLACE INTO ingested_games (game_id, is_ladder, tier_rank) VALUES (?, ?, ?)",
+                                        [(game_id, is_ladder, tier_rank) for game_id, (is_ladder, tier_rank) in self._new_games.items()])
+            self.connection.executemany("INSERT OR REPLACE INTO ingested_files (path, source, bytes, mtime_ns, sha256, games, ingested_at) "
+                                        "VALUES (?, ?, ?, ?, ?, ?, ?)", self._new_files)
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        self._groups = {}
+        self._moments = {}
+        self._cell_games = {}
+        self._ff_minutes = {}
+        self._new_games = {}
+        self._new_files = []
+
+    def get_main_lanes(self):
+        """
+        Returns: set[tuple[str, str]], the (champion, position) holding more than CHAMPION_LANE_PERCENT % of the games of their champion
+        """
+        lane_games = {}
+        for champion, position, games in self.connection.execute("SELECT champion, position, SUM(games) FROM cell_games GROUP BY champion, position"):
+            lane_games.setdefault(champion, {})[position] = games
+        return {(champion, position) for champion, lanes in lane_games.items() for position, games in lanes.items()
+                if (games / sum(lanes.values())) * 100 > CHAMPION_LANE_PERCENT}
+
+    def _get_stats_rows(self, where):
+        """
+        Rows of the sketched cells selected by where, the main lanes only stats being kept on the main lanes of the champion.
+        Returns: list[tuple], (tier, champion, position, win, stat index, stat, AVG, Q1, Q2, Q3, count, knots)
+        """
+        import numpy as np
+
+        main_lanes = self.get_main_lanes()
+        stats = {stat_name: (main_lanes_only, stat_index) for stat_name, _, _, main_lanes_only, stat_index in REFERENTIAL_STAT_LIST}
+        rows = []
+        for tier, champion, position, win, stat, count, total, q1, q2, q3, knots in self.connection.execute(
+                f"SELECT tier, champion, position, win, stat, count, sum, q1, q2, q3, knots FROM cell_stats "
+                f"WHERE champion != '' AND sketch IS NOT NULL AND count > 0 AND {where}"):
+            main_lanes_only, stat_index = stats[stat]
+            if main_lanes_only and champion != GLOBAL_CHAMPION and (champion, position) not in main_lanes:
+                continue
+            rows.append((tier, champion, position, bool(win), stat_index, stat, round_half_up(total / count, 4),
+                         *[round_half_up(value, 4) for value in (q1, q2, q3)], count, np.frombuffer(knots, dtype=np.float32)))
+        return rows
+
+    def get_average_percentiles_rows(self):
+        """
+        Returns: list[tuple], the rows of average_percentiles.csv, with the CDF knots of each row last
+        """
+        return [row[:3] + row[4:9] + row[-1:] for row in order_champion_rows([row[1:] for row in self._get_stats_rows("tier = ''")], 3)]
+
+    def get_tier_percentiles_rows(self):
+        """
+        Returns: list[tuple], the rows of tier_percentiles.csv, with the CDF knots of each row last
+        """
+        return [row[:4] + row[5:] for row in order_tier_rows(self._get_stats_rows("tier != ''"))]
+
+    def get_win_moments(self):
+        """
+        Returns: dict[tuple[str, str, bool], list], the moments of each champion on its main lanes and of each lane (GLOBAL)
+        """
+        import numpy as np
+
+        main_lanes = self.get_main_lanes()
+        return {(champion, position, bool(win)): [count, np.frombuffer(sums), np.frombuffer(products).reshape(len(WIN_EFFECT_STATS), -1)]
+                for champion, position, win, count, sums, products in self.connection.execute("SELECT * FROM cell_moments")
+                if champion == GLOBAL_CHAMPION or (champion, position) in main_lanes}
+
+    def get_multi_kills_rows(self):
+        main_lanes = self.get_main_lanes()
+        cells = {}
+        for champion, position, win, stat, count, total in self.connection.execute(
+                "SELECT champion, position, win, stat, count, sum FROM cell_stats WHERE tier = '' AND sketch IS NULL"):
+            if champion == GLOBAL_CHAMPION or (champion, position) in main_lanes:
+                cells.setdefault((champion, position, bool(win)), {})[stat] = total / count
+        return order_champion_rows([key + tuple(means.get(stat_name) for stat_name, _ in MULTI_KILL_STATS) for key, means in cells.items()])
+
+    def get_duration_row(self):
+        row = self.connection.execute("SELECT count, sum, q1, q2, q3 FROM cell_stats WHERE tier = '' AND champion = '' AND stat = ?",
+                                      (GAME_DURATION_STAT,)).fetchone()
+        if row is None:
+            return None
+        count, total, *quartiles = row
+        return tuple(round_half_up(value / 60, 2) for value in [total / count, *quartiles])
+
+    def get_ff_rows(self):
+        """
+        Returns: tuple[list[tuple[int, float]], tuple[float, float, float]], the rows of ff_per_mins.csv and ff_stats.csv
+        """
+        row = self.connection.execute("SELECT count FROM cell_stats WHERE tier = '' AND champion = '' AND stat = ?", (GAME_DURATION_STAT,)).fetchone()
+        return get_ff_artifact_rows(dict(self.connection.execute("SELECT minute_bin, games FROM ff_minutes")), row[0] if row else 0)
+
+    def get_ingested_files(self, source):
+        return [{'path': path, 'bytes': size, 'sha256': sha256} for path, size, sha256 in
+                self.connection.execute("SELECT path, bytes, sha256 FROM ingested_files WHERE source = ? ORDER BY path", (source,))]
+
+    def get_games_count(self):
+        return len(self._games)
+
+    def close(self):
+        self.connection.close()
+
+
+def get_ff_artifact_rows(ff_minutes, games):
+    """
+    Rows of ff_per_mins.csv and ff_stats.csv from the surrendered games per minute and the count of games.
+    Returns: tuple[list[tuple[int, float]], tuple[float, float, float]]
+    """
+    ff_games = sum(ff_minutes.values())
+    early_ff_games = sum(count for minute_bin, count in ff_minutes.items() if minute_bin * 60 < EARLY_SURRENDER_S)
+    if ff_games == 0:
+        return [], (0.0, None, None)
+    per_minutes = [(minute_bin, round_half_up(count / ff_games * 100, 2)) for minute_bin, count in sorted(ff_minutes.items())
+                   if minute_bin < FF_MINUTE_BINS_LIMIT]
+    return per_minutes, (round_half_up(ff_games / games * 100, 2), round_half_up(early_ff_games / ff_games * 100, 2),
+                         round_half_up((ff_games - early_ff_games) / ff_games * 100, 2))
+
+
+def order_champion_rows(rows, *key_indexes):
+    """
+    Orders (champion, position, win, ...) rows as build_referential : champion with GLOBAL last, lane and result descending, then the key_indexes.
+    Returns: list[tuple]
+    """
+    rows = sorted(rows, key=lambda row: tuple(row[i] for i in key_indexes))
+    rows = sorted(rows, key=lambda row: row[2], reverse=True)
+    rows = sorted(rows, key=lambda row: row[1], reverse=True)
+    return sorted(rows, key=lambda row: (row[0] == GLOBAL_CHAMPION, row[0]))
+
+
+def order_tier_rows(rows):
+    """
+    Orders (tier, champion, position, win, stat index, ...) rows as build_tier_percentiles : tier lowest first with ALL_TIERS last, then as order_champion_rows.
+    Returns: list[tuple]
+    """
+    rows = order_champion_rows([row[1:] + row[:1] for row in rows], 3)
+    return sorted([row[-1:] + row[:-1] for row in rows], key=lambda row: get_tier_order(row[0]))
+
+
+def write_artifacts(state, output):
+    """
+    Writes the files of ARTIFACTS from the state, each one replacing the previous file, the knots ending the rows of the percentile
+    files going to their CDF file and the win effect files coming from the moments.
+    Returns: dict[str, dict], the rows count and sha256 of each file
+    """
+    ff_per_mins, ff_stats = state.get_ff_rows()
+    duration = state.get_duration_row()
+    rows = {
+        'average_percentiles.csv': state.get_average_percentiles_rows(),
+        'multi_kills.csv': state.get_multi_kills_rows(),
+        'duration.csv': [duration] if duration else [],
+        'ff_per_mins.csv': ff_per_mins,
+        'ff_stats.csv': [ff_stats],
+        'tier_percentiles.csv': state.get_tier_percentiles_rows()
+    }
+    for name, cdf_name in CDF_ARTIFACTS.items():
+        rows[cdf_name] = [row[-1] for row in rows[name]]
+        rows[name] = [row[:-1] for row in rows[name]]
+    win_effect_artifacts = write_win_effect_artifacts(state.get_win_moments(), output)
+    artifacts = {}
+    for name in ARTIFACTS:
+        path = os.path.join(output, name)
+        if name in win_effect_artifacts:
+            artifacts[name] = win_effect_artifacts[name]
+            continue
+        if name in CDF_ARTIFACTS.values():
+            artifacts[name] = write_cdf_artifact(rows[name], path)
+            continue
+        write_file_atomically(path, [",".join(get_csv_value(value) for value in row) for row in rows[name]])
+        artifacts[name] = {'rows': len(rows[name]), 'sha256': get_file_hash(path)}
+    return artifacts
+
+
+def update_referential(state, ladder_path, otps_path, output, input_format='csv'):
+    """
+    Folds the new match files into the state, ladder files first so that a game of both sources counts as a ladder game, highest
+    tier first so that a game of several tiers is counted in its highest one without moving, then rewrites the CSV files and manifest.json.
+    Returns: dict, the manifest
+    """
+    os.makedirs(output, exist_ok=True)
+    durations = {}
+    start = time.perf_counter()
+    sources = [('ladder', ladder_path, True)] + ([('otps', otps_path, False)] if otps_path else [])
+    ingested = []
+    for source, path, is_ladder in sources:
+        file_tiers = {file_path: get_file_tier(file_path, path) if is_ladder else None for file_path in state.get_new_files(source, path)}
+        for file_path in sorted(file_tiers, key=lambda file_path: -get_tier_order(file_tiers[file_path]) if file_tiers[file_path] else 1):
+            games = state.ingest_file(source, file_path, input_format, is_ladder, file_tiers[file_path])
+            ingested.append({'source': source, 'path': file_path, 'games': games})
+            print(f"[INFO] - {datetime.now()} : {file_path} folded in, {games} new games")
+    state.commit()
+    durations['ingest'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    artifacts = write_artifacts(state, output)
+    durations['artifacts'] = time.perf_counter() - start
+
+    inputs = {}
+    for source, path, _ in sources:
+        files = state.get_ingested_files(source)
+        input_hash = hashlib.sha256("\n".join(f"{file['path']}:{file['sha256']}" for file in files).encode("utf-8")).hexdigest()
+        inputs[source] = {'path': path, 'files': files, 'sha256': input_hash}
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec="seconds"),
+        'mode': 'incremental',
+        'input_format': input_format,
+        'patches': state.patch_range,
+        'sketch': {'type': 'kll', 'k': state.k},
+        'inputs': inputs,
+        'files_ingested': ingested,
+        'games': state.get_games_count(),
+        'artifacts': artifacts,
+        'durations_s': {name: round(seconds, 3) for name, seconds in durations.items()}
+    }
+    write_file_atomically(os.path.join(output, "manifest.json"), [json.dumps(manifest, indent=2)])
+    return manifest
+
+
+def read_artifact(path):
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        return [row for row in csv.reader(csv_file) if row]
+
+
+def compare_referentials(approx_output, exact_output):
+    """
+    Compares the files built from the sketches with the ones of the exact build (build_referential.py). The quartile differences of
+    the percentile files are given as a share of the exact interquartile range of their cell, the CDF knot ones in percentile points.
+    Returns: dict[str, dict]
+    """
+    import numpy as np
+
+    key_lengths = {'average_percentiles.csv': 4, 'multi_kills.csv': 3, 'duration.csv': 0, 'ff_per_mins.csv': 1, 'ff_stats.csv': 0, 'tier_percentiles.csv': 5,
+                   'win_effects.csv': 3}
+    report = {}
+    for name, key_length in key_lengths.items():
+        approx = {tuple(row[:key_length]): row[key_length:] for row in read_artifact(os.path.join(approx_output, name))}
+        exact = {tuple(row[:key_length]): row[key_length:] for row in read_artifact(os.path.join(exact_output, name))}
+        common = approx.keys() & exact.keys()
+        differences = [abs(float(a) - float(e)) for key in common for a, e in zip(approx[key], exact[key]) if a and e]
+        result = {'rows': len(exact), 'missing': len(exact.keys() - approx.keys()), 'extra': len(approx.keys() - exact.keys()),
+                  'max_difference': max(differences, default=0.0)}
+        if name in ('average_percentiles.csv', 'tier_percentiles.csv'):
+            iqr_differences = []
+            exact_cells = 0
+            for key in common:
+                _, q1, q2, q3 = [float(value) if value else None for value in exact[key][:4]]
+                approx_quartiles = [float(value) if value else None for value in approx[key][1:4]]
+                if None in (q1, q3) or None in approx_quartiles:
+                    continue
+                cell_differences = [abs(a - e) for a, e in zip(approx_quartiles, (q1, q2, q3))]
+                exact_cells += max(cell_differences) == 0
+                if q3 > q1:
+                    iqr_differences.append(max(cell_differences) / (q3 - q1))
+            iqr_differences.sort()
+            result['exact_cells'] = exact_cells
+            result['max_iqr_difference'] = iqr_differences[-1] if iqr_differences else 0.0
+            result['p99_iqr_difference'] = iqr_differences[int(len(iqr_differences) * 0.99)] if iqr_differences else 0.0
+        report[name] = result
+    for name, cdf_name in CDF_ARTIFACTS.items():
+        report[cdf_name] = compare_cdfs(*[read_cdf_artifact(output, name, cdf_name, key_lengths[name]) for output in (approx_output, exact_output)])
+    approx, exact = [read_correlation_artifact(output) for output in (approx_output, exact_output)]
+    common = approx.keys() & exact.keys()
+    report['stat_correlations.npy'] = {'rows': len(exact), 'missing': len(exact.keys() - approx.keys()), 'extra': len(approx.keys() - exact.keys()),
+                                       'max_difference': max((float(np.nanmax(np.abs(approx[key] - exact[key]), initial=0.0)) for key in common), default=0.0)}
+    return report
+
+
+def read_correlation_artifact(output):
+    """
+    Returns: dict[tuple[str, str], numpy.ndarray], the correlation matrix of each (champion, lane) of win_effects.csv, empty without file
+    """
+    import numpy as np
+
+    path = os.path.join(output, "stat_correlations.npy")
+    if not os.path.exists(path):
+        return {}
+    groups = list(dict.fromkeys(tuple(row[:2]) for row in read_artifact(os.path.join(output, "win_effects.csv"))))
+    return dict(zip(groups, np.load(path, allow_pickle=False)))
+
+
+def read_cdf_artifact(output, name, cdf_name, key_length):
+    """
+    Returns: dict[tuple, numpy.ndarray], the CDF knots of each key of a percentile file, empty without CDF file
+    """
+    import numpy as np
+
+    path = os.path.join(output, cdf_name)
+    if not os.path.exists(path):
+        return {}
+    knots = np.load(path, allow_pickle=False)
+    return {tuple(row[:key_length]): row_knots for row, row_knots in zip(read_artifact(os.path.join(output, name)), knots)}
+
+
+def get_knot_rank_difference(approx_knots, exact_knots):
+    """
+    Largest distance, in percentile points, between the level of a knot and the ranks of its approximate value in the exact knots,
+    0 when the value falls on exact knots holding the level.
+    Returns: float
+    """
+    import numpy as np
+
+    last_knot = len(exact_knots) - 1
+    lower = np.searchsorted(exact_knots, approx_knots, side='left')
+    upper = np.searchsorted(exact_knots, approx_knots, side='right') - 1
+    # Fractional rank of a value falling between two exact knots, the first or last rank out of them
+    inside = (lower > 0) & (lower <= last_knot)
+    below = exact_knots[np.clip(lower - 1, 0, last_knot)]
+    above = exact_knots[np.clip(lower, 0, last_knot)]
+    position = np.where(inside, lower - 1 + np.divide(approx_knots - below, above - below, out=np.zeros(len(approx_knots)), where=inside & (above > below)),
+                        np.where(lower == 0, 0.0, float(last_knot)))
+    is_equal = lower <= upper
+    first, last = np.where(is_equal, lower, position), np.where(is_equal, upper, position)
+    levels = np.arange(len(exact_knots))
+    differences = np.maximum(first - levels, 0) + np.maximum(levels - last, 0)
+    return float(differences.max()) * 100 / last_knot
+
+
+def compare_cdfs(approx, exact):
+    """
+    Compares the CDF knots of each key, as values and as the rank difference (percentile points) of get_knot_rank_difference.
+    Returns: dict
+    """
+    import numpy as np
+
+    common = sorted(approx.keys() & exact.keys())
+    differences = [float(np.abs(approx[key].astype(np.float64) - exact[key]).max(initial=0.0)) for key in common]
+    rank_differences = sorted(get_knot_rank_difference(approx[key].astype(np.float64), exact[key].astype(np.float64)) for key in common)
+    return {'rows': len(exact), 'missing': len(exact.keys() - approx.keys()), 'extra': len(approx.keys() - exact.keys()),
+            'max_difference': max(differences, default=0.0), 'exact_cells': sum(difference == 0 for difference in differences),
+            'max_rank_difference': rank_differences[-1] if rank_differences else 0.0,
+            'p99_rank_difference': rank_differences[int(len(rank_differences) * 0.99)] if rank_differences else 0.0}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Folds the new match files into the referential sketches and rewrites the referential CSV files.")
+    parser.add_argument('--ladder', default="./data/matchs/")
+    parser.add_argument('--otps', default="./data/otp_matchs/", help="Empty to skip.")
+    parser.add_argument('--input-format', choices=['csv', 'parquet', 'participants'], default='csv')
+    parser.add_argument('--state', default="./checkpoints/referential.db")
+    parser.add_argument('--output', default="./results/referential")
+    parser.add_argument('--compare', help="Output of build_referential.py on the same matches, compared with the files written.")
+    parser.add_argument('--patches', help="Patch range of the games, e.g. 15.1-15.4 or 15.4, every patch when empty. A state holds a single range.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    state = ReferentialState(args.state, patch_range=parse_patch_range(args.patches) if args.patches else None)
+    manifest = update_referential(state, args.ladder, args.otps or None, args.output, args.input_format)
+    state.close()
+    print(f"[INFO] - {datetime.now()} : {len(manifest['files_ingested'])} files folded in, referential written to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    if args.compare:
+        for name, result in compare_referentials(args.output, args.compare).items():
+            print(f"{name:<24}| " + ", ".join(f"{key} {value:.4g}" if isinstance(value, float) else f"{key} {value}" for key, value in result.items()))
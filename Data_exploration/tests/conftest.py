@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# The scripts of Data_exploration import each other by module name, as when run from that directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from dowload_otps_match import HttpCache, parse_fixtures, parse_otps
+
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "onetricks")
+# The first 3 EUW1 rows of the saved Ahri ranking, the KR and NA1 ones being skipped
+AHRI_OTPS = ["Ahri;Mörkö;EUW", "Ahri;Ahri Only;9999", "Ahri;Kitsune;FOX"]
+
+
+def read_fixture(slug):
+    with open(os.path.join(FIXTURES_PATH, f"{slug}.html"), "rb") as fixture_file:
+        return fixture_file.read()
+
+
+@pytest.mark.parametrize("parser_name", ["lxml", "html.parser"])
+def test_parse_otps(parser_name):
+    if parser_name == "lxml":
+        pytest.importorskip("lxml")
+    assert parse_otps(read_fixture("Ahri"), "Ahri", parser_name=parser_name) == AHRI_OTPS
+
+
+def test_parse_otps_region_and_limit():
+    html = read_fixture("Ahri")
+    assert parse_otps(html, "Ahri", region="BR1") == []
+    assert parse_otps(html, "Ahri", region="KR") == ["Ahri;Hide on bush;KR1"]
+    assert parse_otps(html, "Ahri", limit=4) == AHRI_OTPS + ["Ahri;Charm Me;EUW"]
+
+
+def test_parse_otps_without_table():
+    with pytest.raises(ValueError):
+        parse_otps(b"<html><body></body></html>", "Ahri")
+
+
+def test_parse_fixtures_skips_missing_pages():
+    assert parse_fixtures(["Ahri", "Zed"], FIXTURES_PATH) == {"Ahri": AHRI_OTPS}
+
+
+def test_http_cache_keeps_the_body_as_is(tmp_path):
+    cache = HttpCache(str(tmp_path))
+    url = "https://www.onetricks.gg/fr/champions/ranking/Ahri"
+    body = read_fixture("Ahri")
+    cache.write(url, body, '"etag"', None)
+
+    assert cache.read(url) == body
+    assert cache.get_conditional_headers(url) == {'If-None-Match': '"etag"'}
+    assert parse_otps(cache.read(url), "Ahri") == AHRI_OTPS
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from build_referential import ARTIFACTS
+
+
+MATCHS_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "matchs")
+# 60 ladder games, 5 of them in both tier files, and 28 OTP games, 3 of them also in the ladder files
+LADDER_PATH = os.path.join(MATCHS_PATH, "ladder")
+OTPS_PATH = os.path.join(MATCHS_PATH, "otps")
+
+
+@pytest.fixture(scope="module")
+def duckdb_output(tmp_path_factory):
+    pytest.importorskip("duckdb")
+    from referential_duckdb import build_referential_duckdb
+
+    output = tmp_path_factory.mktemp("duckdb")
+    build_referential_duckdb(LADDER_PATH, OTPS_PATH, str(output), temp_directory=str(tmp_path_factory.mktemp("duckdb_tmp")))
+    return output
+
+
+@pytest.fixture(scope="module")
+def spark_output(tmp_path_factory):
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+    from build_referential import build_referential
+
+    spark = SparkSession.builder\
+            .master("local[2]")\
+            .appName("Referential engines test")\
+            .config("spark.sql.shuffle.partitions", 4)\
+            .config("spark.ui.enabled", "false")\
+            .config("spark.ui.showConsoleProgress", "false")\
+            .getOrCreate()
+    output = tmp_path_factory.mktemp("spark")
+    try:
+        build_referential(spark, LADDER_PATH, OTPS_PATH, str(output), partitions=4)
+    finally:
+        spark.stop()
+    return output
+
+
+@pytest.mark.parametrize("name", [name for name in ARTIFACTS if name.endswith(".csv")])
+def test_engines_write_the_same_csv(spark_output, duckdb_output, name):
+    with open(spark_output / name, "rb") as spark_file, open(duckdb_output / name, "rb") as duckdb_file:
+        assert spark_file.read() == duckdb_file.read()
+
+
+@pytest.mark.parametrize("name", [name for name in ARTIFACTS if name.endswith(".npy")])
+def test_engines_write_close_arrays(spark_output, duckdb_output, name):
+    spark_array, duckdb_array = np.load(spark_output / name), np.load(duckdb_output / name)
+    assert spark_array.shape == duckdb_array.shape
+    assert np.allclose(spark_array, duckdb_array, equal_nan=True)
@@ -96,6 +96,47 @@ def split_multi_col_to_save_format(columns: list[str], df: pd.DataFrame, group_b
 
 
 
+def compute_confidence_intervals(columns: list[str], df: pd.DataFrame, group_by_champ: bool = False,
+                                 sampling_fraction: float = 0.0, z: float = 1.96) -> pd.DataFrame:
+    """
+    Computes confidence interval bounds of the average and quartiles (Q1, Q2, Q3) for given columns, grouped like compute_avg_percentile.
+    The average uses the normal approximation and the quartiles the distribution-free order statistics interval,
+    both narrowed by the finite population correction of the sampling fraction.
+    Returns: pd.DataFrame in long format with <stat>_low and <stat>_high columns per column_stats
+    """
+    if group_by_champ:
+        group_cols = ["championName", "individualPosition", "win"]
+    else:
+        group_cols = ["individualPosition", "win"]
+
+    finite_population_correction = np.sqrt(max(0.0, 1 - sampling_fraction))
+
+    rows = []
+    for group_key, group_df in df.groupby(group_cols):
+        for col in columns:
+            values = np.sort(group_df[col].to_numpy(dtype='float64'))
+            n = len(values)
+            std = values.std(ddof=1) if n > 1 else 0.0
+            avg_margin = z * std / np.sqrt(n) * finite_population_correction
+
+            row = dict(zip(group_cols, group_key))
+            row["column_stats"] = col
+            row["AVG_low"] = round(values.mean() - avg_margin, 4)
+            row["AVG_high"] = round(values.mean() + avg_margin, 4)
+
+            for stat, quantile in [("Q1", 0.25), ("Q2", 0.5), ("Q3", 0.75)]:
+                rank_margin = z * np.sqrt(n * quantile * (1 - quantile)) * finite_population_correction
+                low_rank = int(np.clip(np.floor(n * quantile - rank_margin), 1, n))
+                high_rank = int(np.clip(np.ceil(n * quantile + rank_margin), 1, n))
+                row[f"{stat}_low"] = round(values[low_rank - 1], 4)
+                row[f"{stat}_high"] = round(values[high_rank - 1], 4)
+
+            rows.append(row)
+
+    ci_cols = ["AVG_low", "AVG_high", "Q1_low", "Q1_high", "Q2_low", "Q2_high", "Q3_low", "Q3_high"]
+    return pd.DataFrame(rows, columns=group_cols + ["column_stats"] + ci_cols)
+
+
 def filter_player_by_playrate(df: pd.DataFrame, playrate_col: str, threshold_percent: int = 7) -> pd.DataFrame:
     """
     Filters player data to keep only rows where playrate for a given column exceeds the threshold percentage.
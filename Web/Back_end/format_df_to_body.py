@@ -44,7 +44,7 @@ def transform_df_to_body(df: pd.DataFrame, group_by_cols: list[str], stats_col_m
         has_nan = False
 
         for _, row in group.iterrows():
-            if row.isna().any():
+            if row.drop(['percentile_rank', 'win_impact'], errors='ignore').isna().any():
                 has_nan = True
                 continue
 
@@ -57,6 +57,20 @@ def transform_df_to_body(df: pd.DataFrame, group_by_cols: list[str], stats_col_m
                 }
             }
 
+            if f'{ref_prefix}level' in row.index:
+                stats["referentialLevel"] = row[f'{ref_prefix}level']
+
+            if 'percentile_rank' in row.index and not pd.isna(row['percentile_rank']):
+                stats["percentileRank"] = round(float(row['percentile_rank']), 1)
+
+            if 'win_impact' in row.index and not pd.isna(row['win_impact']):
+                stats["winImpact"] = round(float(row['win_impact']), 3)
+
+            if all(f'{value}_low' in row.index for value in stats_col_mapping.values()):
+                stats["playerStats"]["confidenceIntervals"] = {
+                    key : [row[f'{value}_low'], row[f'{value}_high']] for key, value in stats_col_mapping.items()
+                }
+
             if row['win']:
                 obj['win'] = stats
             else:
@@ -214,20 +228,27 @@ def format_duration(df: pd.DataFrame, duration_df: pd.DataFrame) -> dict[str, di
 
 def transform_row_to_string(row: pd.Series) -> str:
     """
-    Transforms a row of player and challenger stats into a formatted string representation.
+    Transforms a row of player and referential stats into a formatted string representation, the referential values being
+    labelled by the fallback level they come from (champion_tier, role, ...).
     Returns: str
     """
     player_values = f"{row['AVG']}, {row['Q1']}, {row['Q2']}, {row['Q3']}"
 
-    challenger_values = f"{row['ref_AVG']}, {row['ref_Q1']}, {row['ref_Q2']}, {row['ref_Q3']}"
+    reference_values = f"{row['ref_AVG']}, {row['ref_Q1']}, {row['ref_Q2']}, {row['ref_Q3']}"
+    reference_label = row['ref_level'] if 'ref_level' in row.index and isinstance(row['ref_level'], str) else 'reference'
 
     result = (f"[{row['column_stats']}: championName{{{row['championName']}}}, "
               f"individualPosition{{{row['individualPosition']}}}, "
               f"win{{{row['win']}}}, "
               f"player{{{player_values}}}, "
-              f"challenger{{{challenger_values}}}]")
+              f"{reference_label}{{{reference_values}}}")
+    if 'percentile_rank' in row.index and not pd.isna(row['percentile_rank']):
+        result += f", percentileRank{{{round(float(row['percentile_rank']), 1)}}}"
+
+    if 'win_impact' in row.index and not pd.isna(row['win_impact']):
+        result += f", winImpact{{{round(float(row['win_impact']), 3)}}}"
 
-    return result
+    return result + "]"
 
 
 def format_ff(ff_df: pd.DataFrame, ff_dict: dict, chall_ff: pd.DataFrame, chall_ff_stats: pd.DataFrame) -> dict[str, dict]:
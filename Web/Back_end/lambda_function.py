@@ -2,8 +2,11 @@ import boto3
 import csv
 import json
 import logging
+import math
 import numpy as np
+import os
 import pandas as pd
+import time
 import urllib3
 
 
@@ -12,12 +15,63 @@ from botocore.exceptions import NoCredentialsError
 from format_match_api_response import generate_player_line, PLAYER_LINE_SCHEMA
 from format_df_to_body import *
 from dataframe_computing import *
-from ratelimit import limits, sleep_and_retry
+from key_pool import KeyPool, NoActiveKeyError
+from ratelimit import RateLimitException
+from rate_limiter import get_url_host
+from referential_lookup import ReferentialLookup
+from referential_store import ReferentialStore
+from sampling import compute_sample_size, draw_stratified_sample
+from tracing import trace_span, increment_counter, is_tracing_enabled, reset_counters
+from win_effects import WinEffects
 
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+MAX_BATCH_PLAYERS = 10
+
+# Ranked solo and draft queues, the only games analyzed
+RANKED_QUEUES = [420, 400]
+
+# Time kept for analysis, Bedrock and formatting once the history crawl is stopped
+DEADLINE_SAFETY_MARGIN_MS = int(os.environ.get('DEADLINE_SAFETY_MARGIN_MS', 20000))
+RIOT_REQUEST_TIMEOUT_S = float(os.environ.get('RIOT_REQUEST_TIMEOUT_S', 30))
+
+# Raised by a Riot request that could not complete before the deadline, the crawl keeps the games already collected
+DEADLINE_EXCEPTIONS = (RateLimitException, urllib3.exceptions.TimeoutError)
+
+# Sampling mode : target precision of the quartiles (as a quantile rank), unset to analyze the full history
+SAMPLE_PRECISION = float(os.environ['SAMPLE_PRECISION']) if os.environ.get('SAMPLE_PRECISION') else None
+SAMPLE_STRATA = int(os.environ.get('SAMPLE_STRATA', 10))
+
+# Riot API host, overridable to target a local emulator (e.g. "http://127.0.0.1:8089/{host}")
+RIOT_API_URL_TEMPLATE = os.environ.get('RIOT_API_URL_TEMPLATE', 'https://{host}.api.riotgames.com')
+RIOT_RATE_LIMIT_CALLS = int(os.environ.get('RIOT_RATE_LIMIT_CALLS', 99))
+RIOT_RATE_LIMIT_PERIOD = int(os.environ.get('RIOT_RATE_LIMIT_PERIOD', 120))
+
+# TO REMOVE, only here for POC : restricts the players and reads their games from ./poc_games
+POC_MODE = os.environ.get('POC_MODE', 'true').strip().lower() == 'true'
+POC_PLAYERS = ["Happy Hunt", "Hungry Hunt"]
+
+# Directory of the referential bundled with the code
+REFERENTIAL_DIRECTORY = "data"
+# Store of the versioned referentials (local directory or s3://bucket/prefix, see ReferentialStore), the bundled one only when empty
+REFERENTIAL_LOCATION = os.environ.get('REFERENTIAL_LOCATION') or None
+# Values a tier_percentiles.csv row must count to be used, the thinner cells falling back on the next level of ReferentialLookup
+TIER_REFERENTIAL_MIN_COUNT = int(os.environ.get('TIER_REFERENTIAL_MIN_COUNT', 30))
+# A stat is highlighted when the player average ranks in the top or bottom HIGHLIGHT_PERCENTILE % of the referential CDF
+HIGHLIGHT_PERCENTILE = float(os.environ.get('HIGHLIGHT_PERCENTILE', 25))
+# Highlights sent to Bedrock, the ones of largest win impact, when the win effects were built (all of them otherwise)
+KEY_STATS_COUNT = int(os.environ.get('KEY_STATS_COUNT', 8))
+# A highlight correlated above it with an already kept one of the same champion, lane and result is left out of the key stats
+KEY_STATS_MAX_CORRELATION = float(os.environ.get('KEY_STATS_MAX_CORRELATION', 0.8))
+
+# Bedrock flow and alias ids, resolved once per warm container
+_bedrock_flow_cache = {}
+
+# Riot key pools by keys, their rate limit state living as long as the warm container
+_key_pools = {}
+
 
 def get_routing_value(region: str) -> str:
     """Map platform region to routing value for Riot ID API"""
@@ -30,6 +84,7 @@ def get_routing_value(region: str) -> str:
         'eun1': 'europe',
         'tr1': 'europe',
         'ru': 'europe',
+        'me1': 'europe',
         'kr': 'asia',
         'jp1': 'asia',
         'oc1': 'sea',
@@ -41,27 +96,145 @@ def get_routing_value(region: str) -> str:
     }
     return routing_map.get(region, 'europe')
 
+
+def get_match_routing_value(match_id: str) -> str:
+    """
+    Gets the match-v5 routing value of a match from the platform prefixing its id, e.g. "NA1_5012345678" -> "americas".
+    Returns: str
+    """
+    return get_routing_value(str(match_id).split('_')[0].lower())
+
 class UnauthorizedError(Exception):
     def __init__(self, message):
         super().__init__(message)
 
 
-@sleep_and_retry
-@limits(calls=99, period=120)
+def get_riot_api_url(host: str) -> str:
+    """
+    Builds the base URL of the Riot API for a routing value or a platform host.
+    Returns: str
+    """
+    return RIOT_API_URL_TEMPLATE.format(host=host)
+
+
+def get_endpoint_name(url: str) -> str:
+    """
+    Reduces a Riot API URL to its endpoint name, without host, identifiers and query string.
+    Returns: str
+    """
+    path_parts = url.split('?')[0].split('/')[3:]
+    while len(path_parts) > 0 and path_parts[0] not in ['lol', 'riot']:
+        path_parts = path_parts[1:]
+    endpoint = "/".join(path_parts[:4])
+    if path_parts[-1] == 'ids':
+        endpoint += "/ids"
+    return endpoint
+
+
+def get_remaining_crawl_seconds(request_dict: dict) -> float | None:
+    """
+    Seconds left before the crawl must stop, i.e. the Lambda remaining time minus the safety margin. None without a Lambda context.
+    Returns: float | None
+    """
+    context = request_dict.get('context')
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return (context.get_remaining_time_in_millis() - request_dict.get('safety_margin_ms', DEADLINE_SAFETY_MARGIN_MS)) / 1000
+
+
+def get_rate_limit_max_wait(url: str, request_dict: dict) -> float | None:
+    """
+    Longest wait allowed on the rate limiter : a wait running past the crawl deadline is not worth sleeping.
+    Returns: float | None
+    """
+    return get_remaining_crawl_seconds(request_dict)
+
+
+def get_request_options(request_dict: dict) -> dict[str, object]:
+    """
+    Timeout and retries of a Riot request. Within a Lambda, a request never runs past half of the safety margin
+    after the crawl deadline, and is not retried.
+    Returns: dict[str, object]
+    """
+    remaining_seconds = get_remaining_crawl_seconds(request_dict)
+    if remaining_seconds is None:
+        return {'timeout': urllib3.Timeout(total=RIOT_REQUEST_TIMEOUT_S)}
+
+    half_margin_seconds = request_dict.get('safety_margin_ms', DEADLINE_SAFETY_MARGIN_MS) / 2000
+    total = min(RIOT_REQUEST_TIMEOUT_S, max(0.1, remaining_seconds + half_margin_seconds))
+    return {'timeout': urllib3.Timeout(total=total), 'retries': False}
+
+
+def get_key_pool(api_key: str) -> KeyPool:
+    """
+    Gets the pool of the given keys (one key or several comma separated), created once per warm container.
+    Returns: KeyPool
+    """
+    api_keys = tuple(key.strip() for key in api_key.split(',') if key.strip())
+    if api_keys not in _key_pools:
+        _key_pools[api_keys] = KeyPool(list(api_keys), [(RIOT_RATE_LIMIT_CALLS, RIOT_RATE_LIMIT_PERIOD)])
+    return _key_pools[api_keys]
+
+
+def build_request_object(api_key: str, context: object = None, safety_margin_ms: int = DEADLINE_SAFETY_MARGIN_MS, pool_size: int = 1) -> dict:
+    """
+    Builds the HTTP pool and the key pool shared by the Riot requests of an invocation, with the deadline they must respect.
+    api_key holds one Riot key or several comma separated.
+    Returns: dict
+    """
+    return {
+        'http': urllib3.PoolManager(maxsize=pool_size, timeout=urllib3.Timeout(total=RIOT_REQUEST_TIMEOUT_S)),
+        'key_pool': get_key_pool(api_key),
+        'context': context,
+        'safety_margin_ms': safety_margin_ms
+    }
+
+
+def acquire_api_key(url: str, request_dict: dict) -> str:
+    """
+    Waits for the key with the earliest free slot on the URL host. A wait running past the crawl deadline raises
+    RateLimitException instead of being slept.
+    Returns: str
+    """
+    while True:
+        try:
+            api_key, wait = request_dict['key_pool'].reserve(get_url_host(url))
+        except NoActiveKeyError as e:
+            raise UnauthorizedError(str(e))
+        if api_key is not None:
+            return api_key
+
+        max_wait = get_rate_limit_max_wait(url, request_dict)
+        if max_wait is not None and wait > max_wait:
+            raise RateLimitException('too many calls', wait)
+        increment_counter('rate_limit_waits')
+        increment_counter('rate_limit_wait_ms', round(wait * 1000, 3))
+        time.sleep(wait)
+
+
 def send_get_api_request(url: str, request_dict: dict) -> tuple[dict, int]:
     """
     Sends a GET request to the given URL and returns the decoded JSON response with the HTTP status code.
+    A key refused with a 401 is quarantined and the request sent again with another key of the pool.
     Returns: tuple[dict, int]
     """
+    while True:
+        api_key = acquire_api_key(url, request_dict)
 
-    logger.info(f"[INFO] - {datetime.now()} : request sent to {url}")
-    api_response = request_dict['http'].request('GET', url, headers=request_dict['headers'])
-    api_response_decoded = json.loads(api_response.data.decode("utf-8"))
+        logger.info(f"[INFO] - {datetime.now()} : request sent to {url}")
+        with trace_span('riot_request') as span:
+            if is_tracing_enabled():
+                span.set_property('endpoint', get_endpoint_name(url))
+            api_response = request_dict['http'].request('GET', url, headers={'X-Riot-Token': api_key}, **get_request_options(request_dict))
+            span.set_payload_size(len(api_response.data))
+            span.set_property('status_code', api_response.status)
+        increment_counter('riot_requests')
 
-    if api_response.status == 401:
-        raise UnauthorizedError(f'Auth token is Forbidden : {api_response.status} - {api_response_decoded["status"]["message"]}')
+        if api_response.status != 401:
+            return json.loads(api_response.data.decode("utf-8")), api_response.status
 
-    return api_response_decoded, api_response.status
+        request_dict['key_pool'].quarantine(api_key)
+        logger.error(f"[RIOT API] - Key ending with {api_key[-4:]} refused ({api_response.status}), quarantined")
 
 
 
@@ -70,7 +243,7 @@ def get_account_puuid_from_name_and_tag(game_name: str, tag_line: str, server: s
     Retrieves the player's unique Riot PUUID using their Riot ID and tag line.
     Returns: str
     """
-    account_url = f"https://{get_routing_value(server)}.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
+    account_url = f"{get_riot_api_url(get_routing_value(server))}/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}"
     response, status_code = send_get_api_request(account_url, request_dict)
 
     if status_code == 404:
@@ -86,7 +259,7 @@ def get_current_ranked_info(puuid: str, server: str, request_dict: dict) -> dict
     Fetches the player's ranked information (tier, division, LP, wins, losses) or returns None if not ranked.
     Returns: dict | None
     """
-    league_url = f"https://{server}.api.riotgames.com/lol/league/v4/entries/by-puuid/{puuid}"
+    league_url = f"{get_riot_api_url(server)}/lol/league/v4/entries/by-puuid/{puuid}"
     response, status_code = send_get_api_request(league_url, request_dict)
 
     if status_code == 404:
@@ -111,17 +284,13 @@ def get_current_ranked_info(puuid: str, server: str, request_dict: dict) -> dict
     }
 
 
-def send_players_data_to_bedrock_for_advices(df: pd.DataFrame, tier: str, aws_session: boto3.Session) -> str | None:
+def get_bedrock_flow_ids(aws_session: boto3.Session) -> tuple[str, str]:
     """
-    Sends player data to an AWS Bedrock flow to receive performance advice as text.
-    Returns: str | None
+    Resolves the Bedrock flow id and its highest versioned alias, the result is cached for warm containers.
+    Returns: tuple[str, str]
     """
-    division = f"The playere division is {tier}.\n"
-    query = df.apply(transform_row_to_string, axis=1)
-    query = str(query.tolist())[1:-1].replace("'", "")
-    query = division + query
-
-    bedrock = aws_session.client('bedrock-agent-runtime')
+    if 'flow_id' in _bedrock_flow_cache:
+        return _bedrock_flow_cache['flow_id'], _bedrock_flow_cache['alias_id']
 
     bedrock_agent = aws_session.client('bedrock-agent')
 
@@ -134,9 +303,58 @@ def send_players_data_to_bedrock_for_advices(df: pd.DataFrame, tier: str, aws_se
         if alias['routingConfiguration'][0]['flowVersion'] == "DRAFT":
             continue
         elif int(alias['routingConfiguration'][0]['flowVersion']) > highest_version:
-            highest_version = alias['routingConfiguration'][0]['flowVersion']
+            highest_version = int(alias['routingConfiguration'][0]['flowVersion'])
             alias_id = alias['id']
 
+    _bedrock_flow_cache['flow_id'] = flow_id
+    _bedrock_flow_cache['alias_id'] = alias_id
+    return flow_id, alias_id
+
+
+def format_highlights_query(df: pd.DataFrame) -> str:
+    """
+    Turns the player highlights into the text format expected by the Bedrock flow.
+    Returns: str
+    """
+    query = df.apply(transform_row_to_string, axis=1)
+    return str(query.tolist())[1:-1].replace("'", "")
+
+
+def send_players_data_to_bedrock_for_advices(df: pd.DataFrame, tier: str, aws_session: boto3.Session, runtime_client: object = None) -> str | None:
+    """
+    Sends player data to an AWS Bedrock flow to receive performance advice as text.
+    Returns: str | None
+    """
+    division = f"The playere division is {tier}.\n"
+    query = division + format_highlights_query(df)
+
+    return invoke_bedrock_flow(query, aws_session, runtime_client)
+
+
+def send_team_data_to_bedrock_for_advices(players_stats: dict[str, pd.DataFrame], players_tier: dict[str, str], aws_session: boto3.Session) -> str | None:
+    """
+    Sends the highlights of every player of a team, keyed by Riot ID ("name#tag"), in a single AWS Bedrock flow call
+    to receive team-level advice.
+    Returns: str | None
+    """
+    query = f"These players are playing together as a team of {len(players_stats)} players.\n"
+    for riot_id, df in players_stats.items():
+        query += f"The player {riot_id} division is {players_tier[riot_id]}.\n"
+        query += f"{riot_id} stats : {format_highlights_query(df)}\n"
+
+    return invoke_bedrock_flow(query, aws_session)
+
+
+def invoke_bedrock_flow(query: str, aws_session: boto3.Session, runtime_client: object = None) -> str | None:
+    """
+    Invokes the AWS Bedrock flow with the given query and returns the generated document, or None on flow error.
+    A long-lived caller passes its own bedrock-agent-runtime client, clients being thread-safe while sessions are not.
+    Returns: str | None
+    """
+    flow_id, alias_id = get_bedrock_flow_ids(aws_session)
+
+    bedrock = runtime_client if runtime_client is not None else aws_session.client('bedrock-agent-runtime')
+
     response = bedrock.invoke_flow(
         flowIdentifier=flow_id,
         flowAliasIdentifier=alias_id,
@@ -184,55 +402,152 @@ def retrieve_api_key(aws_session: boto3.Session) -> str :
         raise e
 
 
-def get_player_year_history(puuid: str, request_dict: dict) -> list[dict]:
+def get_match_players_lines(match_id: str, puuids: set[str] | None, request_dict: dict) -> dict[str, list[str]]:
     """
-    Retrieves the player's yearly match history and compiles a list of match summaries.
-    Returns: list[dict]
+    Fetches a match and generates the summary line of every requested player (every participant when puuids is None) who took part in it.
+    Matches out of ranked solo and draft queues, or that can't be retrieved, give an empty dict.
+    Returns: dict[str, list[str]]
     """
-    match_history_url = f"https://europe.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?startTime=1736409600&start=[PAGE]&count=100"
-    match_replay_url = f"https://europe.api.riotgames.com/lol/match/v5/matches/[MATCH_ID]"
+    match_replay_url = f"{get_riot_api_url(get_match_routing_value(match_id))}/lol/match/v5/matches/{match_id}"
 
-    match_ids_decoded = None
-    page = 0
+    match_history_decoded, match_status_code = send_get_api_request(match_replay_url, request_dict)
 
-    games_recap = []
+    if match_status_code == 404:
+        logger.info(f'[GET MATCHES] - Data not found for match \"{match_id}\", and puuids :{puuids} "')
+        return {}
+    elif match_status_code != 200:
+        logger.error(f'[GET MATCHES] - Status code error for match \"{match_id}\", and puuids :{puuids} "')
 
-    while match_ids_decoded != []:
-        try:
-            match_ids_decoded, status_code = send_get_api_request(
-                match_history_url.replace("[PAGE]", str(page)),
-                request_dict)
+    try:
+        if match_history_decoded['info']['queueId'] not in RANKED_QUEUES:
+            return {}
+
+        return {
+            participant['puuid']: generate_player_line(match_history_decoded, participant['puuid'])
+            for participant in match_history_decoded['info']['participants']
+            if puuids is None or participant['puuid'] in puuids
+        }
+    except Exception as e:
+        logger.error(f'[GET MATCHES] - Code Error - {e}')
+        return {}
+
+
+def is_deadline_reached(context: object, safety_margin_ms: int = DEADLINE_SAFETY_MARGIN_MS) -> bool:
+    """
+    Checks whether the Lambda remaining time went below the safety margin. Always False without a Lambda context.
+    Returns: bool
+    """
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return False
+    return context.get_remaining_time_in_millis() < safety_margin_ms
+
+
+def sort_match_ids_newest_first(match_ids: set[str]) -> list[str]:
+    """
+    Sorts match ids from the newest to the oldest, their numeric part growing with time.
+    Returns: list[str]
+    """
+    return sorted(match_ids, key=lambda match_id: int(str(match_id).split('_')[-1]), reverse=True)
+
+
+def get_player_match_ids(puuid: str, request_dict: dict, context: object = None, safety_margin_ms: int = DEADLINE_SAFETY_MARGIN_MS,
+                         server: str = 'euw1') -> tuple[list[str], bool]:
+    """
+    Lists the ids of every ranked solo and draft match the player played this season, newest first, and whether the
+    deadline cut the listing. Filtering by queue at the listing keeps other games out of the match calls and of the
+    sampled population. Matches are listed on the routing cluster of the player's server.
+    Returns: tuple[list[str], bool]
+    """
+    match_history_url = f"{get_riot_api_url(get_routing_value(server))}/lol/match/v5/matches/by-puuid/{puuid}/ids?startTime=1736409600&queue=[QUEUE]&start=[PAGE]&count=100"
+
+    match_ids = set()
+
+    for queue in RANKED_QUEUES:
+        match_ids_decoded = None
+        page = 0
+
+        while match_ids_decoded != []:
+            if is_deadline_reached(context, safety_margin_ms):
+                logger.info(f"[GET MATCHES] - Deadline reached, match ids listing truncated to {len(match_ids)} ids for puuid :{puuid}")
+                return sort_match_ids_newest_first(match_ids), True
+
+            try:
+                match_ids_decoded, status_code = send_get_api_request(
+                    match_history_url.replace("[QUEUE]", str(queue)).replace("[PAGE]", str(page)),
+                    request_dict)
+            except DEADLINE_EXCEPTIONS as e:
+                logger.info(f"[GET MATCHES] - Deadline reached ({type(e).__name__}), match ids listing truncated to {len(match_ids)} ids for puuid :{puuid}")
+                return sort_match_ids_newest_first(match_ids), True
 
             if status_code != 200:
                 raise Exception(f'[GET ACCOUNT] - Status code {status_code} - {match_ids_decoded}')
 
-            for match_id in match_ids_decoded:
-                match_history_decoded, match_status_code = send_get_api_request(
-                    match_replay_url.replace("[MATCH_ID]", str(match_id)),
-                    request_dict)
+            match_ids.update(match_ids_decoded)
+            page += 100
 
-                if match_status_code == 404:
-                    logger.info(f'[GET MATCHES] - Data not found for match \"{match_id}\", and puuid :{puuid} "')
-                    continue
-                elif match_status_code != 200:
-                    logger.error(f'[GET MATCHES] - Status code error for match \"{match_id}\", and puuid :{puuid} "')
+    return sort_match_ids_newest_first(match_ids), False
 
-                try:
-                    if match_history_decoded['info']['queueId'] in [420, 400]:
-                        player_match_history = generate_player_line(match_history_decoded, puuid)
-                        games_recap.append(player_match_history)
-                except Exception as e:
-                    logger.error(f'[GET MATCHES] - Code Error - {e}')
-                    continue
 
-            page += 100
+def get_player_year_history(puuid: str, request_dict: dict, match_cache: dict | None = None, tracked_puuids: set[str] | str | None = None,
+                            context: object = None, safety_margin_ms: int = DEADLINE_SAFETY_MARGIN_MS,
+                            sample_precision: float | None = None, server: str = 'euw1') -> tuple[list[dict], dict[str, object]]:
+    """
+    Retrieves the player's yearly match history and compiles a list of match summaries.
+    A match cache shared between players of a batch makes games played together fetched only once,
+    keeping the lines of every tracked player (of every participant when tracked_puuids is "all").
+    Match ids are returned newest first, so when the Lambda deadline gets within the safety margin the crawl
+    stops and the most recent games already collected are kept.
+    With a sample precision, only a stratified sample of the season is fetched, its size being driven by the
+    target precision of the quartiles over all the player's games instead of the number of games played.
+    Returns: tuple[list[dict], dict[str, object]] with the games and how they cover the history
+    """
+    if match_cache is None:
+        match_cache = {}
+    if tracked_puuids == 'all':
+        puuids = None
+    else:
+        puuids = {puuid} if tracked_puuids is None else tracked_puuids | {puuid}
+
+    match_ids, truncated = get_player_match_ids(puuid, request_dict, context, safety_margin_ms, server)
+    total_games = len(match_ids)
+
+    sampled = False
+    if sample_precision is not None:
+        sample_size = compute_sample_size(total_games, sample_precision)
+        if sample_size < total_games:
+            match_ids = draw_stratified_sample(match_ids, sample_size, SAMPLE_STRATA, seed=puuid)
+            sampled = True
+            logger.info(f"[GET MATCHES] - Sampling {sample_size} of {total_games} games for puuid :{puuid}")
 
-        except UnauthorizedError as u:
-            raise UnauthorizedError(u)
-        except Exception as e:
-            raise e
+    games_recap = []
 
-    return games_recap
+    for match_id in match_ids:
+        if match_id not in match_cache and is_deadline_reached(context, safety_margin_ms):
+            logger.info(f"[GET MATCHES] - Deadline reached, history truncated to {len(games_recap)} games for puuid :{puuid}")
+            truncated = True
+            break
+
+        match_lines = match_cache.get(match_id)
+        if match_lines is not None:
+            increment_counter('match_cache_hits')
+        else:
+            try:
+                match_lines = get_match_players_lines(str(match_id), puuids, request_dict)
+            except DEADLINE_EXCEPTIONS as e:
+                logger.info(f"[GET MATCHES] - Deadline reached ({type(e).__name__}), history truncated to {len(games_recap)} games for puuid :{puuid}")
+                truncated = True
+                break
+            match_cache[match_id] = match_lines
+
+        player_match_history = match_lines.get(puuid)
+        if player_match_history is not None:
+            games_recap.append(player_match_history)
+
+    return games_recap, {
+        'truncated': truncated,
+        'sampled': sampled,
+        'totalGames': total_games
+    }
 
 
 def cast_dataframe_to_dict(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
@@ -259,7 +574,7 @@ def convert_csv_to_df(path: str, schema: dict) -> pd.DataFrame:
     referential_df = pd.DataFrame(referential, columns=schema.keys())
     return cast_dataframe_to_dict(referential_df, schema)
 
-def get_referential_dataset() -> pd.DataFrame:
+def get_referential_dataset(directory: str = REFERENTIAL_DIRECTORY) -> pd.DataFrame:
     """
     Loads and returns the referential dataset containing champion performance percentiles.
     Returns: pandas.DataFrame
@@ -274,10 +589,66 @@ def get_referential_dataset() -> pd.DataFrame:
         'ref_Q2': 'float64',
         'ref_Q3': 'float64'
     }
-    return convert_csv_to_df("data/average_percentiles.csv", schema)
+    return convert_csv_to_df(os.path.join(directory, "average_percentiles.csv"), schema)
+
+
+def get_tier_referential_dataset(directory: str = REFERENTIAL_DIRECTORY) -> pd.DataFrame | None:
+    """
+    Loads the per tier referential dataset, with the GLOBAL rows of each tier and of every tier, if it was built.
+    Returns: pandas.DataFrame | None
+    """
+    if not os.path.exists(os.path.join(directory, "tier_percentiles.csv")):
+        return None
+
+    schema = {
+        'tier': 'object',
+        'championName': 'object',
+        'individualPosition': 'object',
+        'win': bool,
+        'column_stats': 'object',
+        'AVG': 'float64',
+        'Q1': 'float64',
+        'Q2': 'float64',
+        'Q3': 'float64',
+        'count': 'int64'
+    }
+    return convert_csv_to_df(os.path.join(directory, "tier_percentiles.csv"), schema)
+
+
+def get_cdf_dataset(name: str, directory: str = REFERENTIAL_DIRECTORY) -> np.ndarray | None:
+    """
+    Loads the float32 CDF knots of the rows of a percentile file (percentile_cdfs.npy, tier_percentile_cdfs.npy), if they were built.
+    Returns: numpy.ndarray | None
+    """
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, allow_pickle=False)
+
+
+def get_win_effects_dataset(directory: str = REFERENTIAL_DIRECTORY) -> WinEffects | None:
+    """
+    Loads the win effects of the stats and their correlations (win_effects.csv, stat_correlations.npy), if they were built.
+    Returns: WinEffects | None
+    """
+    correlations = get_cdf_dataset("stat_correlations.npy", directory)
+    if correlations is None or not os.path.exists(os.path.join(directory, "win_effects.csv")):
+        return None
+
+    schema = {
+        'championName': 'object',
+        'individualPosition': 'object',
+        'column_stats': 'object',
+        'effect': 'object',
+        'count': 'int64'
+    }
+    effects_df = convert_csv_to_df(os.path.join(directory, "win_effects.csv"), schema)
+    # The effects of the stats without two values of each result are left empty
+    effects_df['effect'] = pd.to_numeric(effects_df['effect'].replace('', np.nan))
+    return WinEffects(effects_df, correlations)
 
 
-def get_duration_referential_dataset() -> pd.DataFrame:
+def get_duration_referential_dataset(directory: str = REFERENTIAL_DIRECTORY) -> pd.DataFrame:
     """
     Loads and returns the referential dataset for game duration statistics.
     Returns: pandas.DataFrame
@@ -289,10 +660,10 @@ def get_duration_referential_dataset() -> pd.DataFrame:
         'q3':'float64'
     }
 
-    return convert_csv_to_df("data/duration.csv", schema)
+    return convert_csv_to_df(os.path.join(directory, "duration.csv"), schema)
 
 
-def get_ff_mins_referential_dataset() -> pd.DataFrame:
+def get_ff_mins_referential_dataset(directory: str = REFERENTIAL_DIRECTORY) -> pd.DataFrame:
     """
     Loads and returns the referential dataset for forfeit counts per minute.
     Returns: pandas.DataFrame
@@ -302,10 +673,10 @@ def get_ff_mins_referential_dataset() -> pd.DataFrame:
         'count': 'float64'
     }
 
-    return convert_csv_to_df("data/ff_per_mins.csv", schema)
+    return convert_csv_to_df(os.path.join(directory, "ff_per_mins.csv"), schema)
 
 
-def get_ff_stats_referential_dataset() -> pd.DataFrame:
+def get_ff_stats_referential_dataset(directory: str = REFERENTIAL_DIRECTORY) -> pd.DataFrame:
     """
     Loads and returns the referential dataset containing overall forfeit statistics.
     Returns: pandas.DataFrame
@@ -315,10 +686,10 @@ def get_ff_stats_referential_dataset() -> pd.DataFrame:
         'percents_pre_20_ff': 'float64',
         'percents_post_20_ff': 'float64'
     }
-    return convert_csv_to_df("data/ff_stats.csv", schema)
+    return convert_csv_to_df(os.path.join(directory, "ff_stats.csv"), schema)
 
 
-def get_kill_referential_dataset() -> pd.DataFrame:
+def get_kill_referential_dataset(directory: str = REFERENTIAL_DIRECTORY) -> pd.DataFrame:
     """
     Loads and returns the referential dataset containing average multi-kill statistics.
     Returns: pandas.DataFrame
@@ -333,12 +704,60 @@ def get_kill_referential_dataset() -> pd.DataFrame:
         'ref_pentaKills' : 'float64'
     }
 
-    return convert_csv_to_df("data/multi_kills.csv", schema)
+    return convert_csv_to_df(os.path.join(directory, "multi_kills.csv"), schema)
+
+
+def load_referentials(directory: str = REFERENTIAL_DIRECTORY) -> dict[str, object]:
+    """
+    Loads every referential dataset of a directory once, so that several analyses can share the same instance.
+    The champion stats are solved into a ReferentialLookup, falling back from the tier of the player to every tier and every champion.
+    Returns: dict[str, object]
+    """
+    referential_df = get_referential_dataset(directory)
+    referential_df = referential_df.rename(columns={column: column.removeprefix('ref_') for column in referential_df.columns})
+    tier_referential_df = get_tier_referential_dataset(directory)
+
+    return {
+        'stats': ReferentialLookup(referential_df, tier_referential_df, TIER_REFERENTIAL_MIN_COUNT, get_cdf_dataset("percentile_cdfs.npy", directory),
+                                   get_cdf_dataset("tier_percentile_cdfs.npy", directory) if tier_referential_df is not None else None),
+        'multi_kill': get_kill_referential_dataset(directory),
+        'duration': get_duration_referential_dataset(directory),
+        'ff_mins': get_ff_mins_referential_dataset(directory),
+        'ff_stats': get_ff_stats_referential_dataset(directory),
+        'win_effects': get_win_effects_dataset(directory)
+    }
+
 
+_referential_store = None
 
-def analyze_game_history(game_history: list[dict]) -> dict[str, object]:
+
+def get_referential_store() -> ReferentialStore:
+    """
+    Store of the referential versions, kept by the warm container so that it swaps to a newly published version without a cold start.
+    Returns: ReferentialStore
+    """
+    global _referential_store
+    if _referential_store is None:
+        _referential_store = ReferentialStore(REFERENTIAL_LOCATION, load_referentials, bundled_directory=REFERENTIAL_DIRECTORY)
+    return _referential_store
+
+
+def get_games_patch(game_history: list[list[str]]) -> str | None:
+    """
+    Patch most of the games were played on, e.g. "15.4", which selects the referential version.
+    Returns: str | None
+    """
+    version_index = list(PLAYER_LINE_SCHEMA).index('gameVersion')
+    patches = pd.Series([".".join(str(game[version_index]).split(".")[:2]) for game in game_history if len(game) > version_index])
+    return patches.mode().iloc[0] if len(patches) > 0 else None
+
+
+def analyze_game_history(game_history: list[dict], referentials: dict[str, object] | None = None,
+                         sampling_fraction: float | None = None, tier: str | None = None) -> dict[str, object]:
     """
     Analyzes a player's full game history to produce detailed gameplay statistics and performance summaries.
+    When the games are a sample of the history, the sampling fraction adds confidence intervals to the player statistics.
+    The statistics are compared with the referential of the tier of the player, see ReferentialLookup.
     Returns: dict[str, object]
     """
     classic_cols = [
@@ -375,61 +794,60 @@ def analyze_game_history(game_history: list[dict]) -> dict[str, object]:
         "visionClearedPings"
     ]
 
-    player_df = pd.DataFrame(game_history, columns=PLAYER_LINE_SCHEMA.keys())
-    player_df = cast_dataframe_to_dict(player_df, PLAYER_LINE_SCHEMA)
-
-    referential_df = get_referential_dataset()
-    global_referential_df = referential_df[referential_df['ref_championName'] == 'GLOBAL']\
-        .rename(columns={
-            'ref_championName': 'global_championName',
-            'ref_individualPosition': 'global_individualPosition',
-            'ref_win': 'global_win',
-            'ref_column_stats': 'global_column_stats',
-            'ref_Q1': 'global_Q1',
-            'ref_Q2': 'global_Q2',
-            'ref_Q3': 'global_Q3',
-            'ref_AVG': 'global_AVG'
-    })
-    kill_referential_df = get_kill_referential_dataset()
-
-
-    player_df['kda'] = np.where(
-        player_df['deaths'] != 0,
-        (player_df['kills'] + player_df['assists']) / player_df['deaths'],
-        player_df['kills'] + player_df['assists']
-    )
-    player_df = compute_total_ping(player_df)
+    if referentials is None:
+        with trace_span('analysis.load_referential'):
+            referentials = get_referential_store().get_referentials(get_games_patch(game_history))
 
-    ranked_games = player_df[player_df["queueId"] == 420]
-    draft_games = player_df[player_df["queueId"] == 400] # TO DO
+    with trace_span('analysis.prepare_games', games=len(game_history)):
+        player_df = pd.DataFrame(game_history, columns=PLAYER_LINE_SCHEMA.keys())
+        player_df = cast_dataframe_to_dict(player_df, PLAYER_LINE_SCHEMA)
+
+        player_df['kda'] = np.where(
+            player_df['deaths'] != 0,
+            (player_df['kills'] + player_df['assists']) / player_df['deaths'],
+            player_df['kills'] + player_df['assists']
+        )
+        player_df = compute_total_ping(player_df)
 
-    if len(ranked_games) == 0:
-        # Edge case for the moment cause I might not have time to implement draft games
-        ranked_games = draft_games
+        ranked_games = player_df[player_df["queueId"] == 420]
+        draft_games = player_df[player_df["queueId"] == 400] # TO DO
 
+        if len(ranked_games) == 0:
+            # Edge case for the moment cause I might not have time to implement draft games
+            ranked_games = draft_games
 
-    champ_filtered_ranked_games = filter_player_by_playrate(ranked_games, 'championName')
+        champ_filtered_ranked_games = filter_player_by_playrate(ranked_games, 'championName')
 
-    stats_df = compute_stats_from_df(champ_filtered_ranked_games, classic_cols, col_per_mins)
-    multi_kill_df = compute_multi_kill(champ_filtered_ranked_games)
+    with trace_span('analysis.stats'):
+        stats_df = compute_stats_from_df(champ_filtered_ranked_games, classic_cols, col_per_mins, sampling_fraction)
+        multi_kill_df = compute_multi_kill(champ_filtered_ranked_games)
 
-    duration_df = compute_game_duration_df(ranked_games)
-    ff_df, surrender_dict = surrender_analyses(ranked_games)
-    stats_enriched_df = merge_stats_df(stats_df, referential_df, global_referential_df)
-    multi_kill_enriched_df = merge_multi_kill_df(multi_kill_df, kill_referential_df)
+    with trace_span('analysis.duration_and_surrenders'):
+        duration_df = compute_game_duration_df(ranked_games)
+        ff_df, surrender_dict = surrender_analyses(ranked_games)
 
-    stats_highlights = compute_player_highlights(stats_enriched_df, ['Q1', 'Q2', 'Q3', 'AVG'], "ref_")
+    with trace_span('analysis.merge_referential'):
+        stats_enriched_df = merge_stats_df(stats_df, referentials['stats'], tier)
+        multi_kill_enriched_df = merge_multi_kill_df(multi_kill_df, referentials['multi_kill'])
 
-    win_rate_df = compute_win_rate_by_champ(champ_filtered_ranked_games)
+        stats_highlights = compute_player_highlights(stats_enriched_df, ['Q1', 'Q2', 'Q3', 'AVG'], "ref_")
 
-    spells_cols = ['spell1Casts', 'spell2Casts', 'spell3Casts', 'spell4Casts', 'summoner1Casts', 'summoner2Casts']
-    spells_casted = player_df[spells_cols].sum(axis=0).to_dict()
+    with trace_span('analysis.key_stats'):
+        stats_highlights = compute_win_impacts(stats_highlights, referentials.get('win_effects'))
+        key_stats = select_key_stats(stats_highlights, referentials.get('win_effects'))
+
+    with trace_span('analysis.win_rate_and_spells'):
+        win_rate_df = compute_win_rate_by_champ(champ_filtered_ranked_games)
+
+        spells_cols = ['spell1Casts', 'spell2Casts', 'spell3Casts', 'spell4Casts', 'summoner1Casts', 'summoner2Casts']
+        spells_casted = player_df[spells_cols].sum(axis=0).to_dict()
 
     return {
         'durations': duration_df,
         'ff': ff_df,
         'surrender_stat': surrender_dict,
         'player_stats': stats_highlights,
+        'key_stats': key_stats,
         'multi_kill_stats': multi_kill_enriched_df,
         'win_rate' : win_rate_df,
         'spells': spells_casted
@@ -438,17 +856,62 @@ def analyze_game_history(game_history: list[dict]) -> dict[str, object]:
 
 def compute_player_highlights(df: pd.DataFrame, cols: list[str], prefix: str) -> pd.DataFrame:
     """
-    Identifies player performances significantly above or below reference percentiles.
+    Identifies player performances significantly above or below reference percentiles : the player average ranked in the top or
+    bottom HIGHLIGHT_PERCENTILE % of the referential when its CDF was built, else every column above or below its reference.
     Returns: pandas.DataFrame
     """
     df = df.copy()
-    df_clean = df.dropna()
+    df_clean = df.dropna(subset=[col for col in df.columns if col != 'percentile_rank'])
 
     ahead = (df_clean[cols].values > df_clean[[f'{prefix}{col}' for col in cols]].values).all(axis=1)
     below = (df_clean[cols].values < df_clean[[f'{prefix}{col}' for col in cols]].values).all(axis=1)
+    if 'percentile_rank' in df_clean.columns:
+        ranks = df_clean['percentile_rank'].to_numpy(dtype=np.float64)
+        is_ranked = ~np.isnan(ranks)
+        ahead = np.where(is_ranked, ranks >= 100 - HIGHLIGHT_PERCENTILE, ahead)
+        below = np.where(is_ranked, ranks <= HIGHLIGHT_PERCENTILE, below)
     return df_clean[ahead | below]
 
 
+def compute_win_impacts(df: pd.DataFrame, win_effects: WinEffects | None) -> pd.DataFrame:
+    """
+    Adds to the highlights the win_impact of each one : how far the player average is from the referential, from -1 to 1 (its
+    percentile rank centered on the median, else its distance to ref_Q2 over the referential interquartile range), times the
+    win effect of the stat for the champion and lane. Positive when the gap of the player goes in the direction of the wins.
+    Returns: pandas.DataFrame, win_impact being NaN without win effects
+    """
+    df = df.copy()
+    if win_effects is None:
+        df['win_impact'] = np.nan
+        return df
+
+    averages = df['AVG'].to_numpy(dtype=np.float64)
+    spreads = (df['ref_Q3'] - df['ref_Q1']).to_numpy(dtype=np.float64)
+    gaps = averages - df['ref_Q2'].to_numpy(dtype=np.float64)
+    deviations = np.clip(np.divide(gaps, spreads, out=np.sign(gaps), where=spreads > 0), -1, 1)
+    if 'percentile_rank' in df.columns:
+        ranks = df['percentile_rank'].to_numpy(dtype=np.float64)
+        deviations = np.where(np.isnan(ranks), deviations, (ranks - 50) / 50)
+
+    effects = win_effects.get_effects(df['championName'], df['individualPosition'], df['column_stats'])
+    df['win_impact'] = deviations * effects
+    return df
+
+
+def select_key_stats(df: pd.DataFrame, win_effects: WinEffects | None) -> pd.DataFrame:
+    """
+    Highlights sent to Bedrock : the KEY_STATS_COUNT of largest absolute win_impact, skipping the ones correlated above
+    KEY_STATS_MAX_CORRELATION with a kept highlight of the same champion, lane and result, every highlight without win effects.
+    Returns: pandas.DataFrame
+    """
+    if win_effects is None or len(df) == 0:
+        return df
+
+    kept = win_effects.select(df['championName'], df['individualPosition'], df['win'], df['column_stats'],
+                              df['win_impact'].to_numpy(dtype=np.float64), KEY_STATS_COUNT, KEY_STATS_MAX_CORRELATION)
+    return df.iloc[kept]
+
+
 def merge_multi_kill_df(df: pd.DataFrame, referential_df: pd.DataFrame) -> pd.DataFrame:
     """
     Merges player multi-kill data with referential statistics for comparative analysis.
@@ -467,36 +930,35 @@ def merge_multi_kill_df(df: pd.DataFrame, referential_df: pd.DataFrame) -> pd.Da
                    'ref_doubleKills', 'ref_tripleKills', 'ref_quadraKills', 'ref_pentaKills',]]
 
 
-def merge_stats_df(df: pd.DataFrame, referential_df: pd.DataFrame, global_referential_df: pd.DataFrame) -> pd.DataFrame:
+def merge_stats_df(df: pd.DataFrame, referential_lookup: ReferentialLookup, tier: str | None = None) -> pd.DataFrame:
     """
-    Merges player performance statistics with both champion-specific and global referential datasets.
+    Adds to the player performance statistics the champion-specific (ref_) and lane (global_) referential values of the tier,
+    ref_level telling the level of the fallback each ref_ value comes from, and the percentile_rank of the player average
+    in the CDF of the ref_ values, NaN when the referential has no CDF.
     Returns: pandas.DataFrame
     """
-    result = pd.merge(
-        df,
-        referential_df,
-        left_on=['championName', 'individualPosition', 'win', 'column_stats'],
-        right_on=['ref_championName', 'ref_individualPosition', 'ref_win', 'ref_column_stats'],
-        how='left'
-    )
+    result = df.reset_index(drop=True)
+    keys = [result['individualPosition'], result['win'], result['column_stats']]
 
-    result = pd.merge(
-        result,
-        global_referential_df,
-        left_on=['individualPosition', 'win', 'column_stats'],
-        right_on=['global_individualPosition', 'global_win', 'global_column_stats'],
-        how='left'
-    )
+    ref_values, ref_levels = referential_lookup.lookup(tier, result['championName'], *keys)
+    global_values, _ = referential_lookup.lookup_role(tier, *keys)
+    result[['ref_Q1', 'ref_Q2', 'ref_Q3', 'ref_AVG']] = ref_values
+    result['ref_level'] = ref_levels
+    result['percentile_rank'] = referential_lookup.percentile_ranks(tier, result['championName'], *keys, result['AVG'])
+    result[['global_Q1', 'global_Q2', 'global_Q3', 'global_AVG']] = global_values
+
+    confidence_cols = [col for col in df.columns if col.endswith('_low') or col.endswith('_high')]
 
     return result[['championName', 'individualPosition', 'win', 'column_stats',
                      'Q1', 'Q2', 'Q3', 'AVG',
-                     'ref_Q1', 'ref_Q2', 'ref_Q3', 'ref_AVG',
-                     'global_Q1', 'global_Q2', 'global_Q3', 'global_AVG']]
+                     'ref_Q1', 'ref_Q2', 'ref_Q3', 'ref_AVG', 'ref_level', 'percentile_rank',
+                     'global_Q1', 'global_Q2', 'global_Q3', 'global_AVG'] + confidence_cols]
 
 
-def compute_stats_from_df(df: pd.DataFrame, classic_cols: list[str], col_per_mins: list[str]) -> pd.DataFrame:
+def compute_stats_from_df(df: pd.DataFrame, classic_cols: list[str], col_per_mins: list[str], sampling_fraction: float | None = None) -> pd.DataFrame:
     """
     Computes aggregated performance metrics per champion and per minute from raw match data.
+    With a sampling fraction, the confidence intervals of each statistic are added as <stat>_low / <stat>_high columns.
     Returns: pandas.DataFrame
     """
     df_copy = df.copy()
@@ -505,11 +967,20 @@ def compute_stats_from_df(df: pd.DataFrame, classic_cols: list[str], col_per_min
 
     per_min_cols_rename = {col_name: f'{col_name}PerMins' for col_name in col_per_mins}
 
-    per_min_df = compute_cols_per_minutes(col_per_mins, df_copy).rename(columns=per_min_cols_rename)
-    per_min_df = compute_avg_percentile(columns=per_min_cols_rename.values(), df=per_min_df, group_by_champ=True)
-    per_min_df = split_multi_col_to_save_format(per_min_cols_rename.values(), per_min_df, group_by_champ=True)
+    per_min_values_df = compute_cols_per_minutes(col_per_mins, df_copy).rename(columns=per_min_cols_rename)
+    per_min_df = compute_avg_percentile(columns=per_min_cols_rename.values(), df=per_min_values_df, group_by_champ=True)
+    per_min_df_stats = split_multi_col_to_save_format(per_min_cols_rename.values(), per_min_df, group_by_champ=True)
+
+    stats_df = pd.concat([per_game_df, per_min_df_stats])
+    if sampling_fraction is None:
+        return stats_df
+
+    confidence_df = pd.concat([
+        compute_confidence_intervals(classic_cols, df_copy, group_by_champ=True, sampling_fraction=sampling_fraction),
+        compute_confidence_intervals(list(per_min_cols_rename.values()), per_min_values_df, group_by_champ=True, sampling_fraction=sampling_fraction)
+    ])
 
-    return pd.concat([per_game_df, per_min_df])
+    return stats_df.merge(confidence_df, on=['championName', 'individualPosition', 'win', 'column_stats'], how='left')
 
 
 def compute_game_duration_df(df: pd.DataFrame) -> pd.DataFrame:
@@ -526,22 +997,25 @@ def compute_game_duration_df(df: pd.DataFrame) -> pd.DataFrame:
     return split_multi_col_to_save_format(['gameDuration'], duration_df)
 
 
-def prepare_data_for_response(stats_dict: dict[str, object], player_name: str, player_tag: str) -> dict[str, object]:
+def prepare_data_for_response(stats_dict: dict[str, object], player_name: str, player_tag: str, referentials: dict[str, pd.DataFrame] | None = None) -> dict[str, object]:
     """
     Formats analyzed player data into a structured response with key performance highlights.
     Returns: dict[str, object]
     """
+    if referentials is None:
+        referentials = get_referential_store().get_referentials()
+
     key_highlights = format_top_champions(stats_dict['win_rate'])
     pings = format_pings(stats_dict['player_stats'])
     kda = format_kda(stats_dict['player_stats'])
     damage = format_damages(stats_dict['player_stats'])
     multi_kills = format_multi_kill(stats_dict['multi_kill_stats'])
-    duration = format_duration(stats_dict['durations'], get_duration_referential_dataset())
+    duration = format_duration(stats_dict['durations'], referentials['duration'])
     surrenders = format_ff(
         stats_dict['ff'],
         stats_dict['surrender_stat'],
-        get_ff_mins_referential_dataset(),
-        get_ff_stats_referential_dataset()
+        referentials['ff_mins'],
+        referentials['ff_stats']
     )
 
     return {
@@ -553,16 +1027,205 @@ def prepare_data_for_response(stats_dict: dict[str, object], player_name: str, p
         "damage": damage,
         "multiKills": multi_kills,
         "gameDuration": duration,
-        "surrenders": surrenders
+        "surrenders": surrenders,
+        "referentialVersion": referentials.get('version')
     }
 
-def lambda_handler(event: dict, context: object) -> dict[str, object]:
+def get_player_games(player_name: str, puuid: str, request_dict: dict, match_cache: dict | None = None, tracked_puuids: set[str] | str | None = None,
+                     context: object = None, sample_precision: float | None = None, server: str = 'euw1') -> tuple[list[list[str]], dict[str, object]]:
     """
-    Main AWS Lambda entry point that processes player data requests, performs analysis, and returns a JSON response.
+    Retrieves the games to analyze for a player, and how they cover the player's history (truncation, sampling).
+    Returns: tuple[list[list[str]], dict[str, object]]
+    """
+    if not POC_MODE:
+        return get_player_year_history(puuid, request_dict, match_cache, tracked_puuids, context, sample_precision=sample_precision, server=server)
+
+    # TO REMOVE, only here for POC
+    with open(f"./poc_games/{player_name.replace(' ', '_')}.csv", newline='', encoding='utf-8') as csvfile:
+        lecteur = csv.reader(csvfile)
+        poc_games = [ligne for ligne in lecteur]
+        return poc_games, {'truncated': False, 'sampled': False, 'totalGames': len(poc_games)}
+
+
+def get_sampling_fraction(games: list[list[str]], history_info: dict[str, object]) -> float | None:
+    """
+    Returns the fraction of the history the games represent when they were sampled, None otherwise.
+    Returns: float | None
+    """
+    if not history_info['sampled'] or history_info['totalGames'] == 0:
+        return None
+    return len(games) / history_info['totalGames']
+
+
+def get_sample_precision(params: dict) -> float | None:
+    """
+    Reads the optional "samplePrecision" parameter, falling back on the SAMPLE_PRECISION environment variable.
+    The precision is a quantile rank, strictly between 0 and 1 : a ValueError is raised otherwise, answered with a 400.
+    Returns: float | None
+    """
+    sample_precision = params.get('samplePrecision', None)
+    if sample_precision is None:
+        return SAMPLE_PRECISION
+    sample_precision = float(sample_precision)
+    if not (math.isfinite(sample_precision) and 0 < sample_precision < 1):
+        raise ValueError(f"samplePrecision must be between 0 and 1 excluded, got {sample_precision}")
+    return sample_precision
+
+
+def get_coverage_body(games: list[list[str]], history_info: dict[str, object]) -> dict[str, object]:
+    """
+    Describes how much of the player's history the analysis covers.
     Returns: dict[str, object]
     """
-    params = event.get('queryStringParameters', {})
+    return {
+        "gamesAnalyzed": len(games),
+        "totalGames": history_info['totalGames'],
+        "truncated": history_info['truncated'],
+        "sampled": history_info['sampled']
+    }
+
+
+def parse_players_parameter(players: str) -> list[tuple[str, str]]:
+    """
+    Parses a comma separated list of Riot IDs ("name#tag,name#tag") into (name, tag) tuples, without duplicates.
+    Returns: list[tuple[str, str]]
+    """
+    riot_ids = []
+    for riot_id in players.split(','):
+        riot_id = riot_id.strip()
+        if len(riot_id) == 0:
+            continue
+        if '#' not in riot_id:
+            raise ValueError(f'Riot ID "{riot_id}" must be formatted as "name#tag"')
+
+        game_name, tag_line = riot_id.rsplit('#', 1)
+        if (game_name.strip(), tag_line.strip()) not in riot_ids:
+            riot_ids.append((game_name.strip(), tag_line.strip()))
+
+    return riot_ids
+
+
+def batch_lambda_handler(params: dict, context: object = None) -> dict[str, object]:
+    """
+    Analyzes a whole team at once. SSM, the referential datasets, the rate-limit budget and the matches played
+    together are shared between players, and a single team-level Bedrock call is made.
+    Returns: dict[str, object]
+    """
+    server = params.get('region', None)
+
+    try:
+        players = parse_players_parameter(params.get('players', ''))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': {'Invalid parameters' : f'{e}\n{params}'}
+        }
+
+    try:
+        sample_precision = get_sample_precision(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': {'Invalid parameters' : f'{e}\n{params}'}
+        }
+
+    if server is None or len(players) == 0 or len(players) > MAX_BATCH_PLAYERS:
+        return {
+            'statusCode': 400,
+            'body': {'Parameters missing' : f'Please provide "region" and between 1 and {MAX_BATCH_PLAYERS} "players" formatted as "name#tag,name#tag"\n{params}'}
+        }
+
+    # TO REMOVE, only here for POC
+    if POC_MODE and any(player_name not in POC_PLAYERS for player_name, _ in players):
+        return  {
+            'statusCode': 400,
+            'body': {'Unsupported' : f'This lambda is in POC phase, only few users are accepted.\n{params}'}
+        }
+
+    reset_counters()
+    with trace_span('invocation', players=len(players)):
+        session = boto3.Session(region_name="us-east-1")
+
+        with trace_span('ssm'):
+            api_key = retrieve_api_key(session)
+
+        request_object = build_request_object(api_key, context)
+
+        referential_store = get_referential_store()
+
+        # Players are keyed by Riot ID, two players may share the same name with different tags
+        players_puuid = {}
+        players_tier = {}
+        for player_name, player_tag in players:
+            riot_id = f"{player_name}#{player_tag}"
+            with trace_span('account'):
+                players_puuid[riot_id] = get_account_puuid_from_name_and_tag(player_name, player_tag, server, request_object)
+            with trace_span('rank'):
+                player_info = get_current_ranked_info(players_puuid[riot_id], server, request_object)
+            players_tier[riot_id] = player_info['tier'] if player_info is not None else 'UNRANKED'
+
+        match_cache = {}
+        tracked_puuids = set(players_puuid.values())
+        players_analysis = {}
+        players_referentials = {}
+        players_coverage = {}
+        for player_name, player_tag in players:
+            riot_id = f"{player_name}#{player_tag}"
+            with trace_span('history_fetch') as span:
+                player_year_games, history_info = get_player_games(player_name, players_puuid[riot_id], request_object,
+                                                                   match_cache, tracked_puuids, context, sample_precision, server)
+                span.set_property('games', len(player_year_games))
+                span.set_property('truncated', history_info['truncated'])
+            players_coverage[riot_id] = get_coverage_body(player_year_games, history_info)
+
+            if len(player_year_games) == 0:
+                continue
+
+            with trace_span('load_referentials'):
+                players_referentials[riot_id] = referential_store.get_referentials(get_games_patch(player_year_games))
+
+            with trace_span('analysis'):
+                players_analysis[riot_id] = analyze_game_history(player_year_games, players_referentials[riot_id],
+                                                                     get_sampling_fraction(player_year_games, history_info), players_tier[riot_id])
+
+        team_tips = {}
+        if len(players_analysis) > 0:
+            with trace_span('bedrock'):
+                team_advices = send_team_data_to_bedrock_for_advices(
+                    {riot_id: analysis['key_stats'] for riot_id, analysis in players_analysis.items()},
+                    players_tier,
+                    session
+                )
+                team_tips = format_tips_from_bedrock(team_advices) if team_advices is not None else {}
+
+        with trace_span('formatting') as span:
+            players_body = []
+            for player_name, player_tag in players:
+                riot_id = f"{player_name}#{player_tag}"
+                body = {"username": player_name, "tag": player_tag}
+                try:
+                    if riot_id in players_analysis:
+                        body = prepare_data_for_response(players_analysis[riot_id], player_name, player_tag, players_referentials[riot_id])
+                        body['spells_pressed'] = players_analysis[riot_id]['spells']
+                except Exception as e:
+                    logger.error(f"Failed to format the response of {riot_id}.\n{e}")
+                body['coverage'] = players_coverage[riot_id]
+                players_body.append(body)
+
+            body_json = json.dumps({'players': players_body, 'teamTips': team_tips})
+            span.set_payload_size(len(body_json))
+
+    return {
+        'statusCode': 200,
+        'body': body_json
+    }
+
 
+def check_player_parameters(params: dict) -> dict[str, object] | None:
+    """
+    Validates the single player query parameters, returning the 400 response to send back or None when they are valid.
+    Returns: dict[str, object] | None
+    """
     player_name = params.get('username', None)
     player_tag = params.get('tag', None)
     server = params.get('region', None)
@@ -575,57 +1238,107 @@ def lambda_handler(event: dict, context: object) -> dict[str, object]:
             'body': {'Parameters missing' : f'Mandatory parameters are missing.\nPlease provide "username" and "tag"\n{params}'}
         }
 
+    try:
+        get_sample_precision(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': {'Invalid parameters' : f'{e}\n{params}'}
+        }
+
     # TO REMOVE, only here for POC
-    if player_name not in ["Happy Hunt", "Hungry Hunt"]:
+    if POC_MODE and player_name not in POC_PLAYERS:
         return  {
             'statusCode': 400,
             'body': {'Unsupported' : f'This lambda is in POC phase, only few users are accepted.\nPlease provide "username" and "tag"\n{params}'}
         }
 
-    session = boto3.Session(region_name="us-east-1")
-
-    api_key = retrieve_api_key(session)
-
-    request_object = {
-        'http': urllib3.PoolManager(),
-        'headers': {'X-Riot-Token': api_key}
-    }
-    account_puuid = get_account_puuid_from_name_and_tag(player_name, player_tag, server, request_object)
-    player_info = get_current_ranked_info(account_puuid, server, request_object)
-
+    return None
 
 
-    if False:
-        if player_info is None:
-            legger.info("[RETRIEVE RANKED GAMES] - No ranked game, we switch to draft")
+def lambda_handler(event: dict, context: object) -> dict[str, object]:
+    """
+    Main AWS Lambda entry point that processes player data requests, performs analysis, and returns a JSON response.
+    A "players" parameter switches to the batch mode analyzing a whole team.
+    Returns: dict[str, object]
+    """
+    params = event.get('queryStringParameters', {})
 
-        player_year_games = get_player_year_history(account_puuid, request_object)
+    if 'players' in params:
+        return batch_lambda_handler(params, context)
+
+    error_response = check_player_parameters(params)
+    if error_response is not None:
+        return error_response
+
+    player_name = params['username']
+    player_tag = params['tag']
+    server = params['region']
+    sample_precision = get_sample_precision(params)
+
+    reset_counters()
+    with trace_span('invocation'):
+        session = boto3.Session(region_name="us-east-1")
+
+        with trace_span('ssm'):
+            api_key = retrieve_api_key(session)
+
+        request_object = build_request_object(api_key, context)
+        with trace_span('account'):
+            account_puuid = get_account_puuid_from_name_and_tag(player_name, player_tag, server, request_object)
+        with trace_span('rank'):
+            player_info = get_current_ranked_info(account_puuid, server, request_object)
+        tier = player_info['tier'] if player_info is not None else 'UNRANKED'
+
+        with trace_span('history_fetch') as span:
+            if player_info is None:
+                logger.info("[RETRIEVE RANKED GAMES] - No ranked game, we switch to draft")
+
+            player_year_games, history_info = get_player_games(player_name, account_puuid, request_object,
+                                                               context=context, sample_precision=sample_precision, server=server)
+            span.set_property('games', len(player_year_games))
+            span.set_property('truncated', history_info['truncated'])
+
+        if len(player_year_games) == 0:
+            body_json = json.dumps({
+                "username": player_name,
+                "tag": player_tag,
+                "coverage": get_coverage_body(player_year_games, history_info)
+            })
+            return {
+                'statusCode': 200,
+                'body': body_json
+            }
 
-    # TO REMOVE, only here for POC
-    with open(f"./poc_games/{player_name.replace(' ', '_')}.csv", newline='', encoding='utf-8') as csvfile:
-        lecteur = csv.reader(csvfile)
-        player_year_games = [ligne for ligne in lecteur]
+        with trace_span('load_referentials'):
+            referentials = get_referential_store().get_referentials(get_games_patch(player_year_games))
 
+        with trace_span('analysis'):
+            player_analysis = analyze_game_history(player_year_games, referentials, get_sampling_fraction(player_year_games, history_info), tier)
 
-    player_analysis = analyze_game_history(player_year_games)
+        with trace_span('bedrock'):
+            bedrock_advices = send_players_data_to_bedrock_for_advices(player_analysis['key_stats'], tier, session)
+            tips_body = format_tips_from_bedrock(bedrock_advices)
 
-    bedrock_advices = send_players_data_to_bedrock_for_advices(player_analysis['player_stats'], player_info['tier'], session)
-    tips_body = format_tips_from_bedrock(bedrock_advices)
+        with trace_span('formatting') as span:
+            body = {}
+            try:
+                body = prepare_data_for_response(player_analysis, player_name, player_tag, referentials)
+                body['spells_pressed'] = player_analysis['spells']
+                body['tips'] = tips_body
+                body['coverage'] = get_coverage_body(player_year_games, history_info)
+            except Exception as e:
+                logger.error(e)
+                logging.error(f"Failed to interact with AWS Bedrock.\n{e}")
 
-    body = {}
-    try:
-        body = prepare_data_for_response(player_analysis, player_name, player_tag)
-        body['spells_pressed'] = player_analysis['spells']
-        body['tips'] = tips_body
-    except Exception as e:
-        logger.error(e)
-        logging.error(f"Failed to interact with AWS Bedrock.\n{e}")
+            print(json.dumps(body, indent=4))
 
-    print(json.dumps(body, indent=4))
+            body_json = json.dumps(body)
+            span.set_payload_size(len(body_json))
 
     return {
         'statusCode': 200,
-        'body': json.dumps(body)
+        'body': body_json
     }
 
 
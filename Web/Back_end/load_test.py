@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+import numpy as np
+import urllib3
+
+
+POC_GAMES_FILES = ["./poc_games/Happy_Hunt.csv", "./poc_games/Hungry_Hunt.csv"]
+
+# Number of general and team fields leading every player line, see PLAYER_LINE_SCHEMA
+GENERAL_FIELDS = 6
+TEAM_FIELDS = 9
+
+
+def load_poc_lines() -> list[list[str]]:
+    """
+    Reads the POC games, used as the source of the emulated matches.
+    Returns: list[list[str]]
+    """
+    lines = []
+    for path in POC_GAMES_FILES:
+        with open(path, newline='', encoding='utf-8') as csvfile:
+            lines.extend(csv.reader(csvfile))
+    return lines
+
+
+def build_match_response(line: list[str], match_id: str, puuid: str, game_name: str, schema_keys: list[str]) -> dict:
+    """
+    Rebuilds a match-v5 response from a player line, so generate_player_line gives the same line back.
+    Returns: dict
+    """
+    general_keys = schema_keys[:GENERAL_FIELDS]
+    player_keys = schema_keys[GENERAL_FIELDS + 2 * TEAM_FIELDS:]
+
+    info = dict(zip(general_keys, line[:GENERAL_FIELDS]))
+    info['queueId'] = int(info['queueId'])
+
+    teams = []
+    for team_index in range(2):
+        team = line[GENERAL_FIELDS + team_index * TEAM_FIELDS:GENERAL_FIELDS + (team_index + 1) * TEAM_FIELDS]
+        teams.append({
+            'teamId': team[0],
+            'win': team[1],
+            'objectives': {
+                'tower': {'kills': team[2], 'first': team[3]},
+                'atakhan': {'first': team[4]},
+                'baron': {'kills': team[5]},
+                'dragon': {'kills': team[6]},
+                'horde': {'kills': team[7]},
+                'riftHerald': {'kills': team[8]}
+            }
+        })
+
+    participant = dict(zip(player_keys, line[GENERAL_FIELDS + 2 * TEAM_FIELDS:]))
+    participant['puuid'] = puuid
+    participant['riotIdGameName'] = game_name
+    participant['riotIdTagline'] = 'EUW'
+
+    info['teams'] = teams
+    info['participants'] = [participant]
+    return {'metadata': {'matchId': match_id, 'participants': [puuid]}, 'info': info}
+
+
+class RiotEmulator:
+    """
+    In-memory emulation of the account, league and match-v5 endpoints used by lambda_function,
+    serving emulated players "Player{n}#EUW" whose matches are taken from the POC games.
+    """
+    def __init__(self, players: int, games_per_player: int, latency_ms: float):
+        from format_match_api_response import PLAYER_LINE_SCHEMA
+
+        self.latency_ms = latency_ms
+        self.matches = {}
+        self.match_ids = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        schema_keys = list(PLAYER_LINE_SCHEMA.keys())
+        poc_lines = load_poc_lines()
+        for n in range(players):
+            puuid = f"emulated-puuid-{n}"
+            self.match_ids[puuid] = []
+            for i in range(games_per_player):
+                match_id = f"EUW1_{n:03d}{i:05d}"
+                self.matches[match_id] = build_match_response(poc_lines[(n + i) % len(poc_lines)], match_id, puuid, f"Player{n}", schema_keys)
+                self.match_ids[puuid].append(match_id)
+
+    def route(self, path: str, query: dict) -> tuple[int, object]:
+        """
+        Answers an emulated Riot API request.
+        Returns: tuple[int, object] with the status code and the JSON body
+        """
+        with self._lock:
+            self.requests += 1
+
+        account = re.search(r'/riot/account/v1/accounts/by-riot-id/Player(\d+)/([^/]+)$', path)
+        if account:
+            return 200, {'puuid': f"emulated-puuid-{account.group(1)}", 'gameName': f"Player{account.group(1)}", 'tagLine': account.group(2)}
+
+        league = re.search(r'/lol/league/v4/entries/by-puuid/([^/]+)$', path)
+        if league:
+            return 200, [{'queueType': 'RANKED_SOLO_5x5', 'tier': 'GOLD', 'rank': 'II', 'leaguePoints': 42, 'wins': 60, 'losses': 55}]
+
+        match_ids = re.search(r'/lol/match/v5/matches/by-puuid/([^/]+)/ids$', path)
+        if match_ids:
+            start = int(query.get('start', ['0'])[0])
+            count = int(query.get('count', ['20'])[0])
+            player_match_ids = self.match_ids.get(match_ids.group(1), [])
+            if 'queue' in query:
+                player_match_ids = [match_id for match_id in player_match_ids
+                                    if self.matches[match_id]['info']['queueId'] == int(query['queue'][0])]
+            return 200, player_match_ids[start:start + count]
+
+        match = re.search(r'/lol/match/v5/matches/([^/]+)$', path)
+        if match and match.group(1) in self.matches:
+            return 200, self.matches[match.group(1)]
+
+        return 404, {'status': {'message': 'Data not found', 'status_code': 404}}
+
+    def start(self, port: int) -> ThreadingHTTPServer:
+        """
+        Serves the emulator on localhost in a daemon thread.
+        Returns: ThreadingHTTPServer
+        """
+        emulator = self
+
+        class EmulatorHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if emulator.latency_ms > 0:
+                    time.sleep(emulator.latency_ms / 1000)
+                url = urlparse(self.path)
+                status_code, body = emulator.route(unquote(url.path), parse_qs(url.query))
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), EmulatorHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def get_stub_bedrock_provider(latency_ms: float):
+    """
+    Builds an advice provider standing in for the Bedrock flow, answering after a fixed latency.
+    Returns: function
+    """
+    def advice_provider(player_stats, tier: str) -> str:
+        time.sleep(latency_ms / 1000)
+        return f"- Stubbed advice for a {tier} player\n- Stubbed advice about {len(player_stats)} stats"
+    return advice_provider
+
+
+def start_service(service_port: int, bedrock_latency_ms: float, analysis_workers: int):
+    """
+    Starts the async service in a background event loop, once the environment targets the emulator.
+    Returns: ChallengersService
+    """
+    from service import ChallengersService, serve
+
+    app = ChallengersService(api_key='emulated-key', advice_provider=get_stub_bedrock_provider(bedrock_latency_ms),
+                             aws_session=object(), analysis_workers=analysis_workers)
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        ready_event = asyncio.Event()
+
+        async def main():
+            serve_task = asyncio.ensure_future(serve(app, '127.0.0.1', service_port, ready_event))
+            await ready_event.wait()
+            ready.set()
+            await serve_task
+
+        loop.run_until_complete(main())
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return app
+
+
+def run_clients(service_port: int, players: int, concurrency: int, total_requests: int) -> tuple[list[float], int, float]:
+    """
+    Sends the requests from concurrent clients, each one picking a random emulated player.
+    Returns: tuple[list[float], int, float] with the latencies in ms, the number of errors and the elapsed seconds
+    """
+    http = urllib3.PoolManager(maxsize=concurrency)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [total_requests]
+
+    def client(client_index: int):
+        nonlocal errors
+        randomizer = random.Random(client_index)
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+
+            player = randomizer.randrange(players)
+            url = f"http://127.0.0.1:{service_port}/?username=Player{player}&tag=EUW&region=euw1"
+            start = time.perf_counter()
+            response = http.request('GET', url, retries=False)
+            latency_ms = (time.perf_counter() - start) * 1000
+
+            with lock:
+                latencies.append(latency_ms)
+                if response.status != 200:
+                    errors += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def print_load_report(latencies: list[float], errors: int, elapsed: float, riot_requests: int) -> None:
+    """
+    Prints the throughput and the latency percentiles of the run.
+    Returns: None
+    """
+    durations = np.array(latencies)
+    print(f"requests      : {len(latencies)} ({errors} errors) in {elapsed:.2f}s")
+    print(f"throughput    : {len(latencies) / elapsed:.2f} req/s")
+    print(f"latency (ms)  : p50 {np.percentile(durations, 50):.1f} | p95 {np.percentile(durations, 95):.1f} | "
+          f"p99 {np.percentile(durations, 99):.1f} | max {durations.max():.1f}")
+    print(f"riot requests : {riot_requests}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load tests the async service against a local Riot emulator and a stubbed Bedrock.")
+    parser.add_argument('--requests', type=int, default=200, help="Total number of requests to send.")
+    parser.add_argument('--concurrency', type=int, default=16, help="Number of concurrent clients.")
+    parser.add_argument('--players', type=int, default=20, help="Number of distinct emulated players.")
+    parser.add_argument('--games', type=int, default=150, help="Number of games in each emulated player's history.")
+    parser.add_argument('--riot-latency-ms', type=float, default=20, help="Latency added by the Riot emulator to every request.")
+    parser.add_argument('--bedrock-latency-ms', type=float, default=500, help="Latency of the stubbed Bedrock flow.")
+    parser.add_argument('--analysis-workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Analysis worker processes.")
+    parser.add_argument('--emulator-port', type=int, default=8089)
+    parser.add_argument('--service-port', type=int, default=8080)
+    args = parser.parse_args()
+
+    # lambda_function reads its configuration at import time, the service must be imported afterwards
+    os.environ['RIOT_API_URL_TEMPLATE'] = f"http://127.0.0.1:{args.emulator_port}/{{host}}"
+    os.environ['RIOT_RATE_LIMIT_CALLS'] = str(10 ** 9)
+    os.environ['POC_MODE'] = 'false'
+
+    riot_emulator = RiotEmulator(args.players, args.games, args.riot_latency_ms)
+    riot_emulator.start(args.emulator_port)
+    start_service(args.service_port, args.bedrock_latency_ms, args.analysis_workers)
+
+    request_latencies, request_errors, elapsed_seconds = run_clients(args.service_port, args.players, args.concurrency, args.requests)
+    print_load_report(request_latencies, request_errors, elapsed_seconds, riot_emulator.requests)
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from collections import deque
+from urllib.parse import urlparse
+
+
+# Riot development key limits : 20 requests every second and 100 requests every 2 minutes, per routing value / platform
+RIOT_RATE_LIMITS = [(20, 1), (99, 120)]
+
+
+class RateLimiter:
+    """
+    Sliding window limiter enforcing several (calls, period) windows at once, shared by threads.
+    """
+    def __init__(self, rate_limits=RIOT_RATE_LIMITS):
+        self.rate_limits = rate_limits
+        self._calls = [deque() for _ in rate_limits]
+        self._lock = threading.Lock()
+
+    def _get_wait(self, now):
+        wait = 0.0
+        for (calls, period), window in zip(self.rate_limits, self._calls):
+            while window and window[0] <= now - period:
+                window.popleft()
+            if len(window) >= calls:
+                wait = max(wait, window[0] + period - now)
+        return wait
+
+    def next_slot_delay(self) -> float:
+        """
+        Seconds to wait before a call is allowed, 0 when one is allowed now.
+        Returns: float
+        """
+        with self._lock:
+            return self._get_wait(time.monotonic())
+
+    def try_acquire(self) -> float:
+        """
+        Takes a slot when one is free.
+        Returns: float, 0 when the slot was taken, the seconds to wait otherwise
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = self._get_wait(now)
+            if wait == 0:
+                for window in self._calls:
+                    window.append(now)
+            return wait
+
+    def acquire(self) -> None:
+        """
+        Blocks until a slot is free, then takes it.
+        """
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    def get_usage(self) -> list[tuple[int, int, int]]:
+        """
+        Calls taken in each window, e.g. [(20, 1, 12), (99, 120, 57)] for 12 calls in the last second and 57 in the last 2 minutes.
+        Returns: list[tuple[int, int, int]], (calls, period, used) per window
+        """
+        with self._lock:
+            self._get_wait(time.monotonic())
+            return [(calls, period, len(window)) for (calls, period), window in zip(self.rate_limits, self._calls)]
+
+
+def get_url_host(url: str) -> str:
+    """
+    Gets the Riot host of a URL, e.g. "europe" for https://europe.api.riotgames.com/...
+    Returns: str
+    """
+    return urlparse(url).hostname.split(".")[0]
+
+
+class HostRateLimiters:
+    """
+    One RateLimiter per Riot host (europe, americas, asia, sea, euw1, na1, ...), Riot limits applying per routing value and platform,
+    so crawling a cluster never waits for the quota of another one.
+    """
+    def __init__(self, rate_limits=RIOT_RATE_LIMITS):
+        self.rate_limits = rate_limits
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, host: str) -> RateLimiter:
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = RateLimiter(self.rate_limits)
+            return self._limiters[host]
+
+    def get_hosts(self) -> list[str]:
+        with self._lock:
+            return list(self._limiters)
+
+    def acquire(self, url: str) -> None:
+        """
+        Blocks until the limiter of the URL host allows a call.
+        """
+        self.get(get_url_host(url)).acquire()
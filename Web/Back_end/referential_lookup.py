@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+
+# Levels of the fallback, most specific first : a (tier, champion, position, win, stat) key takes the values of the first level holding it
+LOOKUP_LEVELS = ['champion_tier', 'champion', 'role_tier', 'role', 'global']
+ROLE_LOOKUP_LEVELS = ['role_tier', 'role', 'global']
+VALUE_COLUMNS = ['Q1', 'Q2', 'Q3', 'AVG']
+# Quantiles of the CDF knots of a row, evenly spaced from 0 to 1
+CDF_KNOTS = 101
+
+GLOBAL_CHAMPION = 'GLOBAL'
+# Tier and position of the rows of tier_percentiles.csv computed over every tier and every lane
+ALL_TIERS = 'ALL'
+ALL_POSITIONS = 'ALL'
+
+
+def get_percentile_ranks(knots: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Percentile rank (0 to 100) of each value in the CDF of its row of knots, interpolated between the two knots around it, the middle
+    of the knots equal to it when several are (a stat often at 0). The rows are shifted apart so that a single searchsorted on the
+    flattened knots places every value in its own row.
+    Returns: numpy.ndarray, NaN for the rows without knots or the NaN values
+    """
+    knots = np.asarray(knots, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    ranks = np.full(len(values), np.nan)
+    valid = ~np.isnan(knots).any(axis=1) & ~np.isnan(values)
+    if not valid.any():
+        return ranks
+
+    knots, values = knots[valid], values[valid]
+    # The values are clipped to the knots of their row so that no shifted value falls in the next row, the ones out of them ranking 0 or 100
+    clipped = np.clip(values, knots[:, 0], knots[:, -1])
+    shifts = np.arange(len(knots)) * (knots.max() - knots.min() + 1.0)
+    shifted_knots = (knots + shifts[:, None]).ravel()
+    starts = np.arange(len(knots)) * knots.shape[1]
+    left = np.searchsorted(shifted_knots, clipped + shifts, side='left') - starts
+    right = np.searchsorted(shifted_knots, clipped + shifts, side='right') - starts
+
+    rows = np.arange(len(knots))
+    lower = knots[rows, np.maximum(left - 1, 0)]
+    upper = knots[rows, np.minimum(left, knots.shape[1] - 1)]
+    gaps = upper - lower
+    between = left - 1 + np.divide(clipped - lower, gaps, out=np.zeros_like(clipped), where=gaps > 0)
+    positions = np.where(right > left, (left + right - 1) / 2, between)
+    positions = np.where(values < knots[:, 0], 0, np.where(values > knots[:, -1], knots.shape[1] - 1, positions))
+    ranks[valid] = positions / (knots.shape[1] - 1) * 100
+    return ranks
+
+
+def get_codes(values: object, categories: pd.Index) -> np.ndarray:
+    """
+    Codes of the values in the categories, the values out of them getting the reserved last code len(categories).
+    Returns: numpy.ndarray
+    """
+    codes = pd.Categorical(values, categories=categories).codes.astype(np.int64)
+    codes[codes < 0] = len(categories)
+    return codes
+
+
+class ReferentialLookup:
+    """
+    Referential values of a (tier, champion, position, win, stat) key, resolved champion + tier -> champion -> role + tier -> role -> global.
+    The fallback is solved once at load time into dense arrays of row indexes, one slot per known tier, champion, position and stat
+    plus a last slot for the unknown ones (an UNRANKED player, a champion released since the build), so that looking up the stats
+    of a player is a single gather, whatever the number of tiers. The tier rows counting less than min_count values are skipped.
+    The CDF knots of the rows (one array per file, in the order of its rows), when built, give the percentile rank of a value in the
+    row its key resolves to.
+    """
+    def __init__(self, stats_df: pd.DataFrame, tier_stats_df: pd.DataFrame | None = None, min_count: int = 0,
+                 knots: np.ndarray | None = None, tier_knots: np.ndarray | None = None):
+        if tier_stats_df is None:
+            tier_stats_df = pd.DataFrame(columns=['tier', 'championName', 'individualPosition', 'win', 'column_stats', *VALUE_COLUMNS, 'count'])
+        for frame, frame_knots in ((stats_df, knots), (tier_stats_df, tier_knots)):
+            if frame_knots is not None and frame_knots.shape != (len(frame), CDF_KNOTS):
+                raise ValueError(f"CDF knots of shape {frame_knots.shape} for {len(frame)} referential rows")
+        kept = (tier_stats_df['count'] >= min_count).to_numpy()
+        tier_stats_df = tier_stats_df[kept]
+        base_tier_df = tier_stats_df[tier_stats_df['tier'] != ALL_TIERS]
+
+        self.tiers = pd.Index(base_tier_df['tier'].unique())
+        self.champions = pd.Index(pd.concat([stats_df['championName'], base_tier_df['championName']]).unique()).drop(GLOBAL_CHAMPION, errors='ignore')
+        self.positions = pd.Index(pd.concat([stats_df['individualPosition'], base_tier_df['individualPosition']]).unique())
+        self.stats = pd.Index(pd.concat([stats_df['column_stats'], tier_stats_df['column_stats']]).unique())
+
+        # Last row of values is the NaN of the keys of no level
+        frames = [stats_df, tier_stats_df]
+        self.values = np.vstack([frame[VALUE_COLUMNS].to_numpy(dtype=np.float64) for frame in frames] + [np.full((1, len(VALUE_COLUMNS)), np.nan)])
+        missing_row = len(self.values) - 1
+        self.knots = None
+        if knots is not None or tier_knots is not None:
+            frame_knots = [knots, tier_knots[kept] if tier_knots is not None else None]
+            self.knots = np.vstack([row_knots if row_knots is not None else np.full((len(frame), CDF_KNOTS), np.nan, dtype=np.float32)
+                                    for frame, row_knots in zip(frames, frame_knots)] + [np.full((1, CDF_KNOTS), np.nan, dtype=np.float32)])
+        stats_rows = np.arange(len(stats_df))
+        tier_rows = len(stats_df) + np.arange(len(tier_stats_df))
+
+        shape = (len(self.tiers) + 1, len(self.champions) + 1, len(self.positions) + 1, 2, len(self.stats) + 1)
+        self.index = np.full(shape, missing_row, dtype=np.int32)
+        self.levels = np.full(shape, len(LOOKUP_LEVELS), dtype=np.int8)
+        self.role_index = np.full((shape[0], shape[2], 2, shape[4]), missing_row, dtype=np.int32)
+        self.role_levels = np.full(self.role_index.shape, len(ROLE_LOOKUP_LEVELS), dtype=np.int8)
+
+        is_stats_global = (stats_df['championName'] == GLOBAL_CHAMPION).to_numpy()
+        is_tier_global = (tier_stats_df['championName'] == GLOBAL_CHAMPION).to_numpy()
+        is_all_tiers = (tier_stats_df['tier'] == ALL_TIERS).to_numpy()
+        # Least specific level first, each one overwriting the slots of the levels above
+        self._fill(tier_stats_df[is_all_tiers], tier_rows[is_all_tiers], 'global', tier=False, champion=False, position=False)
+        self._fill(stats_df[is_stats_global], stats_rows[is_stats_global], 'role', tier=False, champion=False)
+        self._fill(tier_stats_df[is_tier_global & ~is_all_tiers], tier_rows[is_tier_global & ~is_all_tiers], 'role_tier', champion=False)
+        self._fill(stats_df[~is_stats_global], stats_rows[~is_stats_global], 'champion', tier=False)
+        self._fill(tier_stats_df[~is_tier_global], tier_rows[~is_tier_global], 'champion_tier')
+
+    def _fill(self, df: pd.DataFrame, rows: np.ndarray, level: str, tier: bool = True, champion: bool = True, position: bool = True) -> None:
+        """
+        Points the slots of the keys of the rows of a level to the rows, every slot of a dimension the level does not hold included.
+        """
+        dimensions = [(tier, 'tier', self.tiers), (champion, 'championName', self.champions), (position, 'individualPosition', self.positions)]
+        spread = len([held for held, _, _ in dimensions if not held])
+        # Each dimension not held takes an axis of its own and the keys the last one, so that the indexes broadcast to all its slots
+        key_shape = (1,) * spread + (len(df),)
+        keys = []
+        axis = 0
+        for held, column, categories in dimensions:
+            if held:
+                keys.append(get_codes(df[column], categories).reshape(key_shape))
+                continue
+            axis_shape = [1] * (spread + 1)
+            axis_shape[axis] = len(categories) + 1
+            keys.append(np.arange(len(categories) + 1).reshape(axis_shape))
+            axis += 1
+        wins = df['win'].to_numpy(dtype=np.int64).reshape(key_shape)
+        stats = get_codes(df['column_stats'], self.stats).reshape(key_shape)
+
+        tiers, champions, positions = keys
+        self.index[tiers, champions, positions, wins, stats] = rows.reshape(key_shape)
+        self.levels[tiers, champions, positions, wins, stats] = LOOKUP_LEVELS.index(level)
+        if not champion:
+            self.role_index[tiers, positions, wins, stats] = rows.reshape(key_shape)
+            self.role_levels[tiers, positions, wins, stats] = ROLE_LOOKUP_LEVELS.index(level)
+
+    def _get_slots(self, tier: str | None, champions: object, positions: object, wins: object, stats: object) -> tuple[tuple, np.ndarray]:
+        """
+        Returns: tuple[tuple, numpy.ndarray], the codes of the keys in self.index and the row of each key
+        """
+        codes = (get_codes([tier], self.tiers)[0], get_codes(champions, self.champions), get_codes(positions, self.positions),
+                 np.asarray(wins, dtype=np.int64), get_codes(stats, self.stats))
+        return codes, self.index[codes]
+
+    def lookup(self, tier: str | None, champions: object, positions: object, wins: object, stats: object) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Values of the keys of a player of the given tier, in a single gather.
+        Returns: tuple[numpy.ndarray, numpy.ndarray], the (n, 4) Q1, Q2, Q3 and AVG values, NaN for the keys of no level, and the level of each key
+        """
+        codes, slots = self._get_slots(tier, champions, positions, wins, stats)
+        levels = np.array(LOOKUP_LEVELS + [None], dtype=object)[self.levels[codes]]
+        return self.values[slots], levels
+
+    def percentile_ranks(self, tier: str | None, champions: object, positions: object, wins: object, stats: object, values: object) -> np.ndarray:
+        """
+        Percentile rank of each value in the CDF of the row its key resolves to, the row of its lookup values.
+        Returns: numpy.ndarray, NaN without CDF for the row
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if self.knots is None:
+            return np.full(len(values), np.nan)
+        _, slots = self._get_slots(tier, champions, positions, wins, stats)
+        return get_percentile_ranks(self.knots[slots], values)
+
+    def lookup_role(self, tier: str | None, positions: object, wins: object, stats: object) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Values of the keys over every champion of the position, resolved role + tier -> role -> global.
+        Returns: tuple[numpy.ndarray, numpy.ndarray], the (n, 4) Q1, Q2, Q3 and AVG values and the level of each key
+        """
+        tier_code = get_codes([tier], self.tiers)[0]
+        position_codes = get_codes(positions, self.positions)
+        win_codes = np.asarray(wins, dtype=np.int64)
+        stat_codes = get_codes(stats, self.stats)
+        slots = self.role_index[tier_code, position_codes, win_codes, stat_codes]
+        levels = np.array(ROLE_LOOKUP_LEVELS + [None], dtype=object)[self.role_levels[tier_code, position_codes, win_codes, stat_codes]]
+        return self.values[slots], levels
@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from collections import OrderedDict
+
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Referential versions kept loaded by a container, the least recently used one being dropped beyond
+REFERENTIAL_MAX_VERSIONS = int(os.environ.get('REFERENTIAL_MAX_VERSIONS', 2))
+# Seconds between two reads of the index of the store, a newer version being swapped in at the first read after its publication
+REFERENTIAL_REFRESH_S = float(os.environ.get('REFERENTIAL_REFRESH_S', 60))
+# Local copy of the versions read from S3, /tmp being the only writable directory of a Lambda
+REFERENTIAL_CACHE_DIRECTORY = os.environ.get('REFERENTIAL_CACHE_DIRECTORY', '/tmp/referentials')
+# Endpoint of an S3-compatible store (MinIO, localstack, ...), AWS S3 when empty
+REFERENTIAL_S3_ENDPOINT_URL = os.environ.get('REFERENTIAL_S3_ENDPOINT_URL') or None
+
+INDEX_FILE = "index.json"
+BUNDLED_VERSION = "bundled"
+# Key of a patch, major * PATCH_KEY_BASE + minor, as build_referential.get_patch_key
+PATCH_KEY_BASE = 1000
+
+
+def get_patch_key(game_version: str | None) -> int | None:
+    """
+    Orders the patches : 15004 for the patch "15.4" or the game version "15.4.657.1245".
+    Returns: int | None
+    """
+    parts = str(game_version).split(".")
+    try:
+        return int(parts[0]) * PATCH_KEY_BASE + int(parts[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def get_file_hash(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ReferentialStore:
+    """
+    Versions of the referential published by Data_exploration/publish_referential.py, each one built from the games of a patch range,
+    in a local directory or an S3-compatible bucket (s3://bucket/prefix). Without location, the data directory bundled with the code
+    is the only version.
+    The index of the store is read again every refresh_s seconds by the warm container, so that a newly published version replaces
+    the previous one of its patch range without a redeploy : the versions no longer in use are dropped from memory, and at most
+    max_resident versions stay loaded.
+    """
+    def __init__(self, location: str | None, loader, max_resident: int = REFERENTIAL_MAX_VERSIONS, refresh_s: float = REFERENTIAL_REFRESH_S,
+                 cache_directory: str = REFERENTIAL_CACHE_DIRECTORY, bundled_directory: str = "data"):
+        self.location = location
+        self.loader = loader
+        self.max_resident = max(1, max_resident)
+        self.refresh_s = refresh_s
+        self.cache_directory = cache_directory
+        self.bundled_directory = bundled_directory
+        self.versions = []
+        self._resident = OrderedDict()
+        # Versions that could not be loaded, not tried again before the next read of the index
+        self._failed = {}
+        self._index_tag = None
+        self._next_refresh = 0.0
+        self._s3_client = None
+        self._lock = threading.Lock()
+
+    def _get_s3_location(self) -> tuple[str, str] | None:
+        if self.location is None or not self.location.startswith("s3://"):
+            return None
+        bucket, _, prefix = self.location[len("s3://"):].partition("/")
+        return bucket, prefix.strip("/")
+
+    def _get_s3_client(self):
+        if self._s3_client is None:
+            import boto3
+
+            self._s3_client = boto3.client("s3", endpoint_url=REFERENTIAL_S3_ENDPOINT_URL)
+        return self._s3_client
+
+    def _read_index(self) -> dict | None:
+        """
+        Reads the index of the store if it changed since the last read, by modification time or S3 ETag.
+        Returns: dict | None, None when unchanged
+        """
+        s3_location = self._get_s3_location()
+        if s3_location is None:
+            path = os.path.join(self.location, INDEX_FILE)
+            index_stat = os.stat(path)
+            tag = (index_stat.st_mtime_ns, index_stat.st_size)
+            if tag == self._index_tag:
+                return None
+            with open(path, "r", encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        else:
+            from botocore.exceptions import ClientError
+
+            bucket, prefix = s3_location
+            request = {'Bucket': bucket, 'Key': f"{prefix}/{INDEX_FILE}".lstrip("/")}
+            if self._index_tag is not None:
+                request['IfNoneMatch'] = self._index_tag
+            try:
+                response = self._get_s3_client().get_object(**request)
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('304', 'NotModified'):
+                    return None
+                raise
+            tag = response['ETag']
+            index = json.loads(response['Body'].read())
+
+        self._index_tag = tag
+        return index
+
+    def _refresh(self) -> None:
+        """
+        Reads the index when due, then drops the loaded versions replaced by a newer one of their patch range.
+        """
+        if self.location is None or time.monotonic() < self._next_refresh:
+            return
+        self._next_refresh = time.monotonic() + self.refresh_s
+        self._failed = {}
+        try:
+            index = self._read_index()
+        except Exception as e:
+            logger.error(f"[REFERENTIAL] - Index of {self.location} unreadable, version {[*self._resident]} kept.\n{e}")
+            return
+        if index is None:
+            return
+
+        # Newest version of each patch range, ordered by patch range
+        latest = {}
+        for version in sorted(index['versions'], key=lambda version: version['created_at']):
+            patches = version.get('patches')
+            latest[(patches['first'], patches['last']) if patches else None] = version
+        self.versions = sorted(latest.values(), key=lambda version: get_patch_key(version['patches']['first']) if version.get('patches') else -1)
+
+        active = {version['id'] for version in self.versions}
+        for version_id in [version_id for version_id in self._resident if version_id not in active]:
+            self._evict(version_id)
+            logger.info(f"[REFERENTIAL] - Version {version_id} replaced, dropped from memory")
+
+    def select_version(self, patch: str | None = None) -> dict | None:
+        """
+        Version of the patch range holding the patch, else the one of the closest older range, else the newest range.
+        Returns: dict | None, the index entry of the version, None without published versions
+        """
+        if not self.versions:
+            return None
+        patch_key = get_patch_key(patch)
+        if patch_key is None:
+            return self.versions[-1]
+
+        older = None
+        for version in self.versions:
+            patches = version.get('patches')
+            if patches is None:
+                older = older or version
+                continue
+            if get_patch_key(patches['first']) <= patch_key <= get_patch_key(patches['last']):
+                return version
+            if get_patch_key(patches['last']) < patch_key:
+                older = version
+        return older or self.versions[-1]
+
+    def _get_version_directory(self, version: dict) -> str:
+        """
+        Directory of the files of a version, downloaded first for an S3 store and checked against the hashes of the index.
+        Returns: str
+        """
+        s3_location = self._get_s3_location()
+        if s3_location is None:
+            return os.path.join(self.location, version['id'])
+
+        bucket, prefix = s3_location
+        directory = os.path.join(self.cache_directory, version['id'])
+        os.makedirs(directory, exist_ok=True)
+        for name, sha256 in version['artifacts'].items():
+            path = os.path.join(directory, name)
+            if os.path.exists(path) and get_file_hash(path) == sha256:
+                continue
+            self._get_s3_client().download_file(bucket, f"{prefix}/{version['id']}/{name}".lstrip("/"), path + ".tmp")
+            if get_file_hash(path + ".tmp") != sha256:
+                raise ValueError(f"{name} of version {version['id']} does not match the index of {self.location}")
+            os.replace(path + ".tmp", path)
+        return directory
+
+    def _evict(self, version_id: str) -> None:
+        self._resident.pop(version_id, None)
+        if self._get_s3_location() is not None:
+            shutil.rmtree(os.path.join(self.cache_directory, version_id), ignore_errors=True)
+
+    def get_referentials(self, patch: str | None = None) -> dict[str, object]:
+        """
+        Referentials of the version matching a patch, loaded on first use. The bundled ones are used when no version is published,
+        and the last loaded version when the store cannot be read.
+        Returns: dict[str, object], the datasets of load_referentials and the 'version' id
+        """
+        with self._lock:
+            self._refresh()
+            version = self.select_version(patch)
+            version_id = version['id'] if version is not None else BUNDLED_VERSION
+            if version_id in self._resident:
+                self._resident.move_to_end(version_id)
+                return self._resident[version_id]
+
+            try:
+                if version_id in self._failed:
+                    raise self._failed[version_id]
+                directory = self._get_version_directory(version) if version is not None else self.bundled_directory
+                referentials = self.loader(directory)
+            except Exception as e:
+                if version_id == BUNDLED_VERSION:
+                    raise
+                if version_id not in self._failed:
+                    self._failed[version_id] = e
+                    logger.error(f"[REFERENTIAL] - Version {version_id} could not be loaded.\n{e}")
+                if self._resident:
+                    return next(reversed(self._resident.values()))
+                version_id, referentials = BUNDLED_VERSION, self.loader(self.bundled_directory)
+
+            referentials['version'] = version_id
+            self._resident[version_id] = referentials
+            logger.info(f"[REFERENTIAL] - Version {version_id} loaded for patch {patch}")
+            while len(self._resident) > self.max_resident:
+                self._evict(next(iter(self._resident)))
+            return referentials
+
+    def get_resident_versions(self) -> list[str]:
+        with self._lock:
+            return list(self._resident)
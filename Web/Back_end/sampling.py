@@ -0,0 +1,56 @@
+import math
+import random
+
+
+# z-score of a two-sided 95% confidence level
+CONFIDENCE_Z = 1.96
+
+
+def compute_sample_size(population_size: int, precision: float, z: float = CONFIDENCE_Z) -> int:
+    """
+    Computes how many games must be drawn so that every quartile estimate falls within +/- precision
+    (expressed as a quantile rank, 0.05 meaning 5 percentiles) of the true quartile at the given confidence.
+    The worst case is the median (q(1 - q) = 0.25), the finite population correction is then applied.
+    The result never depends on more than the precision, which bounds the number of match calls.
+    The precision holds for the pooled distribution of the player's games : each champion / position / win cell
+    only gets its share of the sample, so its own interval is wider (see compute_confidence_intervals).
+    Returns: int
+    """
+    if population_size <= 0:
+        return 0
+
+    infinite_sample_size = (z ** 2) * 0.25 / (precision ** 2)
+    sample_size = infinite_sample_size / (1 + (infinite_sample_size - 1) / population_size)
+    return min(population_size, math.ceil(sample_size))
+
+
+def draw_stratified_sample(match_ids: list[str], sample_size: int, strata: int, seed: str) -> list[str]:
+    """
+    Draws a stratified sample of match ids. The ids are ordered by time, so splitting them into contiguous strata
+    spreads the sample across the whole season, each stratum getting a share proportional to its size.
+    The sample is returned interleaved between strata, so a fetch stopped early still covers the season evenly.
+    Returns: list[str]
+    """
+    if sample_size >= len(match_ids):
+        return list(match_ids)
+
+    randomizer = random.Random(seed)
+    strata = max(1, min(strata, sample_size))
+    bounds = [round(i * len(match_ids) / strata) for i in range(strata + 1)]
+
+    strata_samples = []
+    allocated = 0
+    for i in range(strata):
+        stratum = match_ids[bounds[i]:bounds[i + 1]]
+        stratum_sample_size = round(sample_size * bounds[i + 1] / len(match_ids)) - allocated
+        allocated += stratum_sample_size
+        sampled_indexes = sorted(randomizer.sample(range(len(stratum)), min(stratum_sample_size, len(stratum))))
+        strata_samples.append([stratum[index] for index in sampled_indexes])
+
+    interleaved_sample = []
+    for i in range(max(len(stratum_sample) for stratum_sample in strata_samples)):
+        for stratum_sample in strata_samples:
+            if i < len(stratum_sample):
+                interleaved_sample.append(stratum_sample[i])
+
+    return interleaved_sample
@@ -0,0 +1,451 @@
+import asyncio
+import boto3
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import lambda_function
+from format_df_to_body import format_tips_from_bedrock
+from tracing import reset_counters
+from lambda_function import (
+    analyze_game_history,
+    build_request_object,
+    check_player_parameters,
+    get_account_puuid_from_name_and_tag,
+    get_bedrock_flow_ids,
+    get_coverage_body,
+    get_current_ranked_info,
+    get_games_patch,
+    get_player_games,
+    get_sample_precision,
+    get_sampling_fraction,
+    get_referential_store,
+    prepare_data_for_response,
+    retrieve_api_key,
+    send_players_data_to_bedrock_for_advices
+)
+
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SERVICE_HOST = os.environ.get('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.environ.get('SERVICE_PORT', 8080))
+
+# Processes running the pandas analysis, threads running the blocking Riot / Bedrock calls
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+IO_WORKERS = int(os.environ.get('IO_WORKERS', 32))
+
+# Matches are immutable, their lines are kept for every participant so any later player can reuse them
+MATCH_CACHE_SIZE = int(os.environ.get('MATCH_CACHE_SIZE', 20000))
+ACCOUNT_CACHE_SIZE = int(os.environ.get('ACCOUNT_CACHE_SIZE', 5000))
+# Ranks move with every game, they are only kept for a few minutes
+RANK_CACHE_TTL_S = float(os.environ.get('RANK_CACHE_TTL_S', 300))
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache exposing the small dict interface the history crawl relies on.
+    With a ttl_s, entries also expire that many seconds after being set.
+    """
+    def __init__(self, max_size: int, ttl_s: float | None = None):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_expired(self, key) -> bool:
+        return self.ttl_s is not None and time.monotonic() - self._items[key][1] > self.ttl_s
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._items and not self._is_expired(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            if self._is_expired(key):
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            self._items[key] = (value, time.monotonic())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+class InFlightCalls:
+    """
+    Coalesces concurrent calls sharing a key : the first caller runs the function, the others wait for its result.
+    """
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func, *args):
+        with self._lock:
+            future = self._futures.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._futures[key] = future
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._futures[key]
+        return future.result()
+
+
+def init_analysis_worker() -> None:
+    """
+    Loads the newest referential version once per analysis worker process, each worker keeping its own store.
+    Returns: None
+    """
+    get_referential_store().get_referentials()
+
+
+def analyze_player_games(games: list[list[str]], history_info: dict[str, object], player_name: str, player_tag: str,
+                         tier: str | None = None) -> tuple[dict, object]:
+    """
+    Runs the CPU-bound analysis and formatting of a player in a worker process.
+    Returns: tuple[dict, object] with the response body and the key stats DataFrame sent to Bedrock
+    """
+    referentials = get_referential_store().get_referentials(get_games_patch(games))
+    player_analysis = analyze_game_history(games, referentials, get_sampling_fraction(games, history_info), tier)
+
+    body = prepare_data_for_response(player_analysis, player_name, player_tag, referentials)
+    body['spells_pressed'] = player_analysis['spells']
+    return body, player_analysis['key_stats']
+
+
+def get_bedrock_advice_provider(aws_session: boto3.Session):
+    """
+    Builds the default advice provider, asking the Bedrock flow for tips about a player.
+    The flow ids and the runtime client are resolved once, so the I/O threads never use the session itself.
+    Returns: function taking the player stats DataFrame and the tier, returning the raw tips or None
+    """
+    get_bedrock_flow_ids(aws_session)
+    runtime_client = aws_session.client('bedrock-agent-runtime')
+
+    def advice_provider(player_stats, tier: str) -> str | None:
+        return send_players_data_to_bedrock_for_advices(player_stats, tier, aws_session, runtime_client)
+    return advice_provider
+
+
+class ChallengersService:
+    """
+    Long-lived ASGI application serving the lambda_handler single player interface (username, tag, region).
+    The referential datasets, the Riot connection pool, the rate limiter and the caches are shared between requests,
+    the analysis runs in a process pool so the event loop only waits on I/O.
+    """
+    def __init__(self, api_key: str | None = None, advice_provider=None, aws_session: boto3.Session | None = None,
+                 analysis_workers: int = ANALYSIS_WORKERS, io_workers: int = IO_WORKERS):
+        self.aws_session = aws_session
+        self.api_key = api_key
+        self.advice_provider = advice_provider
+        self.analysis_workers = analysis_workers
+        self.io_workers = io_workers
+
+        self.match_cache = LRUCache(MATCH_CACHE_SIZE)
+        self.account_cache = LRUCache(ACCOUNT_CACHE_SIZE)
+        self.rank_cache = LRUCache(ACCOUNT_CACHE_SIZE, ttl_s=RANK_CACHE_TTL_S)
+        self.in_flight = InFlightCalls()
+        self.request_object = None
+        self.analysis_pool = None
+        self.io_pool = None
+        self._startup_lock = threading.Lock()
+
+    def startup(self) -> None:
+        """
+        Retrieves the API key and opens the pools. Called by the lifespan startup event or by the first request,
+        later calls do nothing.
+        Returns: None
+        """
+        with self._startup_lock:
+            if self.request_object is None:
+                self._open()
+
+    def _open(self) -> None:
+        if self.aws_session is None:
+            self.aws_session = boto3.Session(region_name="us-east-1")
+        if self.api_key is None:
+            self.api_key = os.environ.get('RIOT_API_KEY') or retrieve_api_key(self.aws_session)
+        if self.advice_provider is None:
+            self.advice_provider = get_bedrock_advice_provider(self.aws_session)
+
+        self.io_pool = ThreadPoolExecutor(max_workers=self.io_workers)
+        self.analysis_pool = ProcessPoolExecutor(max_workers=self.analysis_workers, initializer=init_analysis_worker)
+        # Set last : requests consider the service started once the request object exists
+        self.request_object = build_request_object(self.api_key, pool_size=self.io_workers)
+
+    def shutdown(self) -> None:
+        """
+        Closes the pools.
+        Returns: None
+        """
+        if self.analysis_pool is not None:
+            self.analysis_pool.shutdown(cancel_futures=True)
+        if self.io_pool is not None:
+            self.io_pool.shutdown(cancel_futures=True)
+        if self.request_object is not None:
+            self.request_object['http'].clear()
+            self.request_object = None
+
+    def get_cached(self, cache: LRUCache, key: tuple, func, *args):
+        """
+        Reads a cache entry, concurrent misses on the same key waiting for a single call of func.
+        Returns: object
+        """
+        if key in cache:
+            return cache.get(key)
+
+        def load():
+            value = func(*args)
+            cache[key] = value
+            return value
+        return self.in_flight.run((id(cache),) + key, load)
+
+    def get_account_puuid(self, player_name: str, player_tag: str, server: str) -> str:
+        """
+        Resolves a Riot ID to its puuid, through the account cache.
+        Returns: str
+        """
+        return self.get_cached(self.account_cache, (player_name.lower(), player_tag.lower(), server),
+                               get_account_puuid_from_name_and_tag, player_name, player_tag, server, self.request_object)
+
+    def get_ranked_info(self, puuid: str, server: str) -> dict | None:
+        """
+        Fetches the ranked information of a player, through the rank cache.
+        Returns: dict | None
+        """
+        return self.get_cached(self.rank_cache, (puuid, server), get_current_ranked_info, puuid, server, self.request_object)
+
+    def fetch_player_games(self, player_name: str, player_tag: str, server: str,
+                           sample_precision: float | None) -> tuple[str, list[list[str]], dict[str, object]]:
+        """
+        Blocking part of a request: account, rank and history, run in the I/O thread pool.
+        Returns: tuple[str, list[list[str]], dict[str, object]] with the tier, the games and their coverage
+        """
+        puuid = self.get_account_puuid(player_name, player_tag, server)
+        player_info = self.get_ranked_info(puuid, server)
+        if player_info is None:
+            logger.info("[RETRIEVE RANKED GAMES] - No ranked game, we switch to draft")
+
+        # Concurrent requests of the same player share one history crawl instead of each missing the match cache
+        games, history_info = self.in_flight.run(
+            ('history', puuid, sample_precision),
+            lambda: get_player_games(player_name, puuid, self.request_object, self.match_cache, 'all', sample_precision=sample_precision,
+                                     server=server))
+        return player_info['tier'] if player_info is not None else 'UNRANKED', games, history_info
+
+    async def handle_player_request(self, params: dict) -> dict[str, object]:
+        """
+        Same contract as lambda_handler for a single player.
+        Returns: dict[str, object]
+        """
+        error_response = check_player_parameters(params)
+        if error_response is not None:
+            return error_response
+
+        player_name = params['username']
+        player_tag = params['tag']
+        server = params['region']
+        try:
+            sample_precision = get_sample_precision(params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': {'Invalid parameters' : f'{e}\n{params}'}
+            }
+
+        # The counters of the request, shared with the I/O threads running in a copy of its context
+        reset_counters()
+        loop = asyncio.get_running_loop()
+        tier, games, history_info = await loop.run_in_executor(
+            self.io_pool, contextvars.copy_context().run, self.fetch_player_games, player_name, player_tag, server, sample_precision)
+
+        if len(games) == 0:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    "username": player_name,
+                    "tag": player_tag,
+                    "coverage": get_coverage_body(games, history_info)
+                })
+            }
+
+        body, player_stats = await loop.run_in_executor(
+            self.analysis_pool, analyze_player_games, games, history_info, player_name, player_tag, tier)
+
+        advices = await loop.run_in_executor(self.io_pool, contextvars.copy_context().run, self.advice_provider, player_stats, tier)
+        body['tips'] = format_tips_from_bedrock(advices) if advices is not None else {}
+        body['coverage'] = get_coverage_body(games, history_info)
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps(body)
+        }
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        """
+        ASGI entry point, handling the lifespan events and the GET requests.
+        Returns: None
+        """
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                # SSM, boto3 and the pools block : run off the event loop, as the blocking work of the requests
+                if message['type'] == 'lifespan.startup':
+                    await asyncio.get_running_loop().run_in_executor(None, self.startup)
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        if scope['type'] != 'http':
+            return
+
+        # ASGI servers running with lifespan disabled never send the startup event
+        if self.request_object is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.startup)
+
+        if scope['path'] == '/health':
+            response = {'statusCode': 200, 'body': json.dumps({'status': 'ok'})}
+        elif scope['method'] != 'GET':
+            response = {'statusCode': 405, 'body': {'Unsupported' : f'Method {scope["method"]} is not allowed'}}
+        else:
+            params = dict(parse_qsl(scope.get('query_string', b'').decode('utf-8')))
+            try:
+                response = await self.handle_player_request(params)
+            except Exception as e:
+                logger.error(f"[SERVICE] - Request failed for {params} : {e}")
+                response = {'statusCode': 500, 'body': {'Error' : str(e)}}
+
+        body = response['body']
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = body.encode('utf-8')
+
+        await send({
+            'type': 'http.response.start',
+            'status': response['statusCode'],
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+async def handle_http_connection(app: ChallengersService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Minimal HTTP/1.1 keep-alive server calling the ASGI application, so the service runs without an ASGI server installed.
+    Returns: None
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+
+            headers = []
+            content_length = 0
+            keep_alive = True
+            while True:
+                header_line = await reader.readline()
+                if header_line in (b'\r\n', b'\n', b''):
+                    break
+                name, value = header_line.decode('latin-1').split(':', 1)
+                headers.append((name.strip().lower().encode(), value.strip().encode()))
+                if name.strip().lower() == 'content-length':
+                    content_length = int(value.strip())
+                if name.strip().lower() == 'connection' and value.strip().lower() == 'close':
+                    keep_alive = False
+            if content_length > 0:
+                await reader.readexactly(content_length)
+
+            path, _, query_string = target.partition('?')
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': method,
+                'path': path,
+                'query_string': query_string.encode('latin-1'),
+                'headers': headers
+            }
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            response_parts = []
+
+            async def send(message):
+                response_parts.append(message)
+
+            await app(scope, receive, send)
+
+            start, body = response_parts[0], response_parts[1]
+            status_line = f"HTTP/1.1 {start['status']} {'OK' if start['status'] == 200 else 'Error'}\r\n"
+            header_lines = "".join(f"{name.decode()}: {value.decode()}\r\n" for name, value in start['headers'])
+            writer.write((status_line + header_lines + "\r\n").encode('latin-1') + body['body'])
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(app: ChallengersService, host: str = SERVICE_HOST, port: int = SERVICE_PORT, ready: asyncio.Event | None = None) -> None:
+    """
+    Starts the application and serves it until cancelled.
+    Returns: None
+    """
+    app.startup()
+    server = await asyncio.start_server(lambda reader, writer: handle_http_connection(app, reader, writer), host, port)
+    logger.info(f"[SERVICE] - Listening on {host}:{port} (POC mode : {lambda_function.POC_MODE})")
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        app.shutdown()
+
+
+# ASGI servers can import this instance directly, e.g. "uvicorn service:app"
+app = ChallengersService()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    started_at = time.time()
+    try:
+        asyncio.run(serve(app))
+    except KeyboardInterrupt:
+        logger.info(f"[SERVICE] - Stopped after {round(time.time() - started_at)}s")
@@ -0,0 +1,96 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+
+def parse_metrics_lines(lines) -> list[dict]:
+    """
+    Extracts the EMF metrics documents from raw log lines (CloudWatch exports prefix them with timestamps and request ids).
+    Returns: list[dict]
+    """
+    metrics_lines = []
+    for line in lines:
+        json_start = line.find('{"_aws"')
+        if json_start == -1:
+            continue
+        try:
+            metrics_line = json.loads(line[json_start:])
+        except json.JSONDecodeError:
+            continue
+        if 'stage' in metrics_line and 'duration_ms' in metrics_line:
+            metrics_lines.append(metrics_line)
+    return metrics_lines
+
+
+def get_stage_key(metrics_line: dict) -> str:
+    """
+    Names the report row of a metrics line, Riot requests being split per endpoint.
+    Returns: str
+    """
+    if 'endpoint' in metrics_line:
+        return f"{metrics_line['stage']} {metrics_line['endpoint']}"
+    return metrics_line['stage']
+
+
+def aggregate_per_stage(metrics_lines: list[dict]) -> list[dict]:
+    """
+    Aggregates p50/p95/p99 durations, peak RSS, payload sizes and rate-limit waits per stage (and per endpoint for Riot requests).
+    Returns: list[dict]
+    """
+    stages = {}
+    for metrics_line in metrics_lines:
+        stages.setdefault(get_stage_key(metrics_line), []).append(metrics_line)
+
+    report = []
+    for stage, stage_lines in sorted(stages.items()):
+        durations = np.array([line['duration_ms'] for line in stage_lines])
+        payloads = [line['payload_bytes'] for line in stage_lines if 'payload_bytes' in line]
+        report.append({
+            'stage': stage,
+            'count': len(stage_lines),
+            'p50_ms': round(float(np.percentile(durations, 50)), 2),
+            'p95_ms': round(float(np.percentile(durations, 95)), 2),
+            'p99_ms': round(float(np.percentile(durations, 99)), 2),
+            'max_ms': round(float(durations.max()), 2),
+            'peak_rss_kb': max(line.get('peak_rss_kb', 0) for line in stage_lines),
+            'avg_payload_bytes': round(sum(payloads) / len(payloads)) if payloads else None,
+            'rate_limit_waits': sum(line.get('rate_limit_waits', 0) for line in stage_lines)
+        })
+    return report
+
+
+def print_report(report: list[dict]) -> None:
+    """
+    Prints the per-stage report as an aligned table.
+    Returns: None
+    """
+    header = f"{'stage':<56}| {'count':>7} | {'p50 ms':>10} | {'p95 ms':>10} | {'p99 ms':>10} | {'max ms':>10} | {'peak rss kb':>11} | {'avg payload':>11} | {'rl waits':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in report:
+        avg_payload = row['avg_payload_bytes'] if row['avg_payload_bytes'] is not None else '-'
+        print(f"{row['stage']:<56}| {row['count']:>7} | {row['p50_ms']:>10} | {row['p95_ms']:>10} | {row['p99_ms']:>10} | "
+              f"{row['max_ms']:>10} | {row['peak_rss_kb']:>11} | {avg_payload:>11} | {row['rate_limit_waits']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregates the lambda_handler tracing lines into per-stage latency percentiles.")
+    parser.add_argument('log_files', nargs='*', help="Log files containing the EMF lines, stdin is read when omitted.")
+    parser.add_argument('--json', action='store_true', help="Prints the report as JSON instead of a table.")
+    args = parser.parse_args()
+
+    if args.log_files:
+        lines = []
+        for log_file in args.log_files:
+            with open(log_file, "r", encoding="utf-8") as f:
+                lines.extend(f.readlines())
+    else:
+        lines = sys.stdin.readlines()
+
+    stage_report = aggregate_per_stage(parse_metrics_lines(lines))
+    if args.json:
+        print(json.dumps(stage_report, indent=4))
+    else:
+        print_report(stage_report)
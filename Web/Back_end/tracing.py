@@ -0,0 +1,179 @@
+import contextvars
+import json
+import os
+import resource
+import time
+
+
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'false').strip().lower() in ('1', 'true', 'yes')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ChallengersWannabe')
+
+# Counters of the current invocation, a dict per context so that the concurrent requests of the service do not mix their counts
+_counters = contextvars.ContextVar('tracing_counters', default=None)
+
+
+class _NoopSpan:
+    """
+    Span returned when tracing is disabled, every call is a no-op so the traced code pays almost nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_payload_size(self, size: int) -> None:
+        pass
+
+    def set_property(self, key: str, value: object) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """
+    Measures the wall time of a stage and emits one metrics line when the stage ends.
+    """
+    def __init__(self, stage: str, properties: dict):
+        self.stage = stage
+        self.properties = properties
+        self.payload_size = None
+        self.counters_at_start = {}
+        self.start = 0.0
+
+    def __enter__(self):
+        self.counters_at_start = dict(get_counters())
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration_ms = round((time.perf_counter() - self.start) * 1000, 3)
+
+        counters_delta = {
+            name: value - self.counters_at_start.get(name, 0)
+            for name, value in get_counters().items()
+            if value != self.counters_at_start.get(name, 0)
+        }
+        if exc_type is not None:
+            self.properties['error'] = exc_type.__name__
+
+        emit_metrics_line(self.stage, duration_ms, self.payload_size, counters_delta, self.properties)
+        return False
+
+    def set_payload_size(self, size: int) -> None:
+        self.payload_size = size
+
+    def set_property(self, key: str, value: object) -> None:
+        self.properties[key] = value
+
+
+def set_tracing_enabled(enabled: bool) -> None:
+    """
+    Switches tracing on or off at runtime (the default comes from the TRACING_ENABLED environment variable).
+    Returns: None
+    """
+    global TRACING_ENABLED
+    TRACING_ENABLED = enabled
+
+
+def is_tracing_enabled() -> bool:
+    """
+    Tells whether spans are live, so callers can skip computing properties that would be thrown away.
+    Returns: bool
+    """
+    return TRACING_ENABLED
+
+
+def trace_span(stage: str, **properties) -> _Span | _NoopSpan:
+    """
+    Opens a tracing span for the given stage, to be used as a context manager.
+    Returns: _Span | _NoopSpan
+    """
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return _Span(stage, properties)
+
+
+def get_counters() -> dict:
+    """
+    Counters of the invocation of the current context, created on first use.
+    Returns: dict
+    """
+    counters = _counters.get()
+    if counters is None:
+        counters = {}
+        _counters.set(counters)
+    return counters
+
+
+def increment_counter(name: str, value: int | float = 1) -> None:
+    """
+    Increments an invocation counter, spans report how much each counter moved while they were open.
+    Returns: None
+    """
+    if TRACING_ENABLED:
+        counters = get_counters()
+        counters[name] = counters.get(name, 0) + value
+
+
+def reset_counters() -> None:
+    """
+    Starts new invocation counters in the current context, called at the start of each Lambda invocation since containers are
+    reused, and of each request of the service. The threads run in the context of the invocation (contextvars.copy_context) share them.
+    Returns: None
+    """
+    _counters.set({})
+
+
+def get_peak_rss_kb() -> int:
+    """
+    Returns the peak resident set size of the process in kilobytes.
+    Returns: int
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def build_metrics_line(stage: str, duration_ms: float, payload_size: int | None, counters: dict, properties: dict) -> dict:
+    """
+    Builds a CloudWatch Embedded Metric Format (EMF) document for a finished stage.
+    Returns: dict
+    """
+    metrics = [
+        {"Name": "duration_ms", "Unit": "Milliseconds"},
+        {"Name": "peak_rss_kb", "Unit": "Kilobytes"}
+    ]
+    line = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["stage"]],
+                "Metrics": metrics
+            }]
+        },
+        "stage": stage,
+        "duration_ms": duration_ms,
+        "peak_rss_kb": get_peak_rss_kb()
+    }
+
+    if payload_size is not None:
+        metrics.append({"Name": "payload_bytes", "Unit": "Bytes"})
+        line["payload_bytes"] = payload_size
+
+    for name, value in counters.items():
+        metrics.append({"Name": name, "Unit": "Count"})
+        line[name] = value
+
+    line.update(properties)
+    return line
+
+
+def emit_metrics_line(stage: str, duration_ms: float, payload_size: int | None, counters: dict, properties: dict) -> None:
+    """
+    Prints the EMF document on stdout, where the Lambda runtime forwards it to CloudWatch Logs.
+    Returns: None
+    """
+    print(json.dumps(build_metrics_line(stage, duration_ms, payload_size, counters, properties)))
+
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from referential_lookup import GLOBAL_CHAMPION, get_codes
+
+
+class WinEffects:
+    """
+    Win effect of each (champion, position, stat), falling back from the champion to its lane (GLOBAL), and the correlations between
+    the stats of each (champion, position), read from win_effects.csv and stat_correlations.npy (see Data_exploration). Both are solved
+    at load time into dense arrays, so that scoring the statistics of a player is a gather and selecting the ones that matter a pass
+    over them.
+    """
+    def __init__(self, effects_df: pd.DataFrame, correlations: np.ndarray):
+        self.champions = pd.Index(effects_df['championName'].unique()).drop(GLOBAL_CHAMPION, errors='ignore')
+        self.positions = pd.Index(effects_df['individualPosition'].unique())
+        self.stats = pd.Index(effects_df['column_stats'].unique())
+        groups = effects_df[['championName', 'individualPosition']].drop_duplicates()
+        if len(groups) != len(correlations):
+            raise ValueError(f"{len(correlations)} correlation matrices for {len(groups)} win effect groups")
+
+        # Last group of correlations and last stat of each matrix are the NaN of the unknown keys
+        self.correlations = np.full((len(groups) + 1, len(self.stats) + 1, len(self.stats) + 1), np.nan, dtype=np.float32)
+        self.correlations[:-1, :-1, :-1] = correlations
+        self.effects = np.full((len(self.champions) + 1, len(self.positions) + 1, len(self.stats) + 1), np.nan, dtype=np.float32)
+        self.groups = np.full((len(self.champions) + 1, len(self.positions) + 1), len(groups), dtype=np.int32)
+
+        is_global = (groups['championName'] == GLOBAL_CHAMPION).to_numpy()
+        group_positions = get_codes(groups['individualPosition'], self.positions)
+        group_champions = get_codes(groups['championName'], self.champions)
+        group_indexes = np.arange(len(groups))
+        # Lane groups first, on every champion slot, then the champion ones over them
+        self.groups[:, group_positions[is_global]] = group_indexes[is_global]
+        self.groups[group_champions[~is_global], group_positions[~is_global]] = group_indexes[~is_global]
+
+        is_global_row = (effects_df['championName'] == GLOBAL_CHAMPION).to_numpy()
+        positions = get_codes(effects_df['individualPosition'], self.positions)
+        champions = get_codes(effects_df['championName'], self.champions)
+        stats = get_codes(effects_df['column_stats'], self.stats)
+        effects = effects_df['effect'].to_numpy(dtype=np.float32)
+        self.effects[:, positions[is_global_row], stats[is_global_row]] = effects[is_global_row]
+        champion_effects = self.effects[champions[~is_global_row], positions[~is_global_row], stats[~is_global_row]]
+        # A champion effect left empty (too few games of a result) keeps the one of the lane
+        self.effects[champions[~is_global_row], positions[~is_global_row], stats[~is_global_row]] = \
+            np.where(np.isnan(effects[~is_global_row]), champion_effects, effects[~is_global_row])
+
+    def get_effects(self, champions: object, positions: object, stats: object) -> np.ndarray:
+        """
+        Returns: numpy.ndarray, the win effect of each key, NaN for the keys of no champion nor lane
+        """
+        return self.effects[get_codes(champions, self.champions), get_codes(positions, self.positions), get_codes(stats, self.stats)]
+
+    def select(self, champions: object, positions: object, wins: object, stats: object, scores: np.ndarray, count: int,
+               max_correlation: float) -> np.ndarray:
+        """
+        Rows of the count largest absolute scores, a row being skipped when its stat correlates above max_correlation with the stat
+        of a kept row of the same champion, position and result (kills after the KDA), as it tells the same thing.
+        Returns: numpy.ndarray, the indexes of the kept rows, largest score first
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        champion_codes = get_codes(champions, self.champions)
+        position_codes = get_codes(positions, self.positions)
+        groups = self.groups[champion_codes, position_codes]
+        stat_codes = get_codes(stats, self.stats)
+        group_keys = (champion_codes * (len(self.positions) + 1) + position_codes) * 2 + np.asarray(wins, dtype=np.int64)
+
+        kept = []
+        # The rows without score come last, after every scored one
+        for i in np.argsort(-np.where(np.isnan(scores), -1.0, np.abs(scores)), kind='stable'):
+            if len(kept) >= count or np.isnan(scores[i]):
+                break
+            kept_same_group = [j for j in kept if group_keys[j] == group_keys[i]]
+            if any(abs(self.correlations[groups[i], stat_codes[i], stat_codes[j]]) > max_correlation for j in kept_same_group):
+                continue
+            kept.append(i)
+        return np.array(kept, dtype=np.int64)